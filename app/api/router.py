@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.api.routers import pastas, scan, indexacao, busca, download, arquivos, auth
+from app.api.routers import pastas, scan, indexacao, busca, download, arquivos, auth, jobs, metrics
 
 api_router = APIRouter()
 api_router.include_router(auth.router)
@@ -10,3 +10,5 @@ api_router.include_router(indexacao.router)
 api_router.include_router(busca.router)
 api_router.include_router(download.router)
 api_router.include_router(arquivos.router)
+api_router.include_router(jobs.router)
+api_router.include_router(metrics.router)
@@ -4,6 +4,7 @@
 api_arquivos.py
 - Consulta de metadados dos arquivos carregados em 'files'.
 - Filtros por root_id, extensão, tamanho e mtime (epoch seconds).
+- /files/find: busca por trecho do nome/caminho (índice trigram).
 """
 
 from typing import Optional, List
@@ -12,9 +13,10 @@ from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
 
-from app.models.models import File, RootFolderPermission, User
-from app.db.database import get_db
-from app.core.deps import get_current_user
+from app.models.models import File, User
+from app.db.database import get_read_db
+from app.core.deps import get_current_user, readable_root_ids
+from app.services.filename_index import find_files
 
 router = APIRouter(prefix="/files", tags=["Arquivos (Metadados, dependencies=[Depends(get_current_user)])"])
 
@@ -32,7 +34,7 @@ class FileOut(BaseModel):
 
 @router.get("", response_model=List[FileOut])
 def list_files(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
     root_id: Optional[int] = Query(None),
     ext: Optional[str] = Query(None, description="ex.: pdf,docx (uma extensão)"),
@@ -46,8 +48,14 @@ def list_files(
     q = db.query(File)
     conds = []
 
+    # usuário comum: só raízes com permissão
+    root_ids = readable_root_ids(db, current_user)
     if root_id is not None:
+        if root_ids is not None and root_id not in root_ids:
+            raise HTTPException(status_code=403, detail="Sem permissão para este diretório raiz")
         conds.append(File.root_id == root_id)
+    elif root_ids is not None:
+        conds.append(File.root_id.in_(root_ids))
 
     if ext:
         e = ext.strip().lower()
@@ -73,18 +81,33 @@ def list_files(
     rows = q.order_by(File.mtime.desc().nullslast(), File.id.asc()).limit(limit).offset(offset).all()
     return rows
 
+@router.get("/find", response_model=List[FileOut])
+def find(
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+    q: str = Query(..., min_length=1, description="Trecho do nome (ou caminho), sem diferenciar maiúsculas"),
+    field: str = Query("name", pattern="^(name|path)$"),
+    mode: str = Query("substring", pattern="^(substring|prefix)$"),
+    root_id: Optional[int] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+):
+    root_ids = readable_root_ids(db, current_user)
+    if root_id is not None:
+        root_ids = [r for r in (root_ids if root_ids is not None else [root_id]) if r == root_id]
+    rows = find_files(db, q, field=field, mode=mode, root_ids=root_ids, limit=limit)
+    return [FileOut(**row._mapping) for row in rows]
+
 @router.get("/{file_id}", response_model=FileOut)
-def get_file(file_id: int, db: Session = Depends(get_db)):
+def get_file(
+    file_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+):
     f = db.query(File).filter(File.id == file_id).first()
     if not f:
         raise HTTPException(status_code=404, detail="Arquivo não encontrado")
 
-    if current_user.is_superuser != 1:
-        perm = (
-            db.query(RootFolderPermission)
-            .filter(RootFolderPermission.root_id == f.root_id, RootFolderPermission.user_id == current_user.id)
-            .first()
-        )
-        if not perm:
-            raise HTTPException(status_code=403, detail="Sem permissão para este diretório raiz")
+    root_ids = readable_root_ids(db, current_user)
+    if root_ids is not None and f.root_id not in root_ids:
+        raise HTTPException(status_code=403, detail="Sem permissão para este diretório raiz")
     return f
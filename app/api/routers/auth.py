@@ -6,7 +6,7 @@ from sqlalchemy.orm import Session
 
 from app.core.security import verify_password, create_access_token
 from app.core.deps import get_current_user
-from app.db.database import get_db
+from app.db.database import get_read_db
 from app.models.models import User
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
@@ -33,7 +33,7 @@ class UserOut(BaseModel):
 
 
 @router.post("/login", response_model=TokenOut)
-def login(payload: LoginIn, db: Session = Depends(get_db)):
+def login(payload: LoginIn, db: Session = Depends(get_read_db)):
     # Login via JSON (sem multipart/form-data)
     user = db.query(User).filter(User.username == payload.username).first()
     if not user or user.is_active != 1:
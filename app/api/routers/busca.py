@@ -4,18 +4,22 @@
 api_busca.py
 - Pesquisa full-text (FTS5) em 'docs' unindo 'files' via 'map'.
 - Retorna metadados, snippet e links 'file://' e '/download'.
+- order=relevance (bm25) ou recent; paginação pelo header X-Next-Cursor.
+- /search/suggest: autocompletar de termos e nomes de arquivo.
+- facets=true: resposta vira {"results", "facets", "next_cursor"} com contagens
+  por extensão, raiz, ano e faixa de tamanho.
 """
 
-from typing import Optional, List
+from typing import Any, Optional, List, Union
 from datetime import datetime
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from pydantic import BaseModel
-from sqlalchemy import text
 from sqlalchemy.orm import Session
 
-from app.models.models import RootFolder, File, RootFolderPermission
-from app.db.database import get_db
-from app.core.deps import get_current_user, require_root_access
+from app.db.database import get_read_db
+from app.core.deps import get_current_user, readable_root_ids
+from app.services.search import InvalidQuery, SearchFilters, search_cached, search_facets_cached
+from app.services.suggest import suggest as suggest_terms
 
 router = APIRouter(prefix="/search", tags=["Busca"], dependencies=[Depends(get_current_user)])
 
@@ -30,15 +34,61 @@ class SearchResult(BaseModel):
     score: float
     snippet: str
 
+class FacetCountOut(BaseModel):
+    value: Any
+    count: int
+
+class FacetsOut(BaseModel):
+    total: int
+    truncated: bool
+    ext: List[FacetCountOut]
+    root_id: List[FacetCountOut]
+    year: List[FacetCountOut]
+    size: List[FacetCountOut]
+
+class SearchPage(BaseModel):
+    results: List[SearchResult]
+    facets: FacetsOut
+    next_cursor: Optional[str]
+    truncated: bool = False  # relevance: acertos além de SEARCH_MAX_SCORED ficaram de fora
+
+class TermSuggestionOut(BaseModel):
+    term: str
+    docs: Optional[int] = None  # só para quem lê todas as raízes
+    completion: str
+
+class FileSuggestionOut(BaseModel):
+    id: int
+    name: str
+    path: str
+
+class SuggestOut(BaseModel):
+    terms: List[TermSuggestionOut]
+    files: List[FileSuggestionOut]
+
 def to_file_uri(windows_path: str) -> str:
     # \\server\share\dir\file.docx -> file://///server/share/dir/file.docx
     p = windows_path.replace("\\", "/")
     p = p.lstrip("/")  # remove barras iniciais extras
     return f"file://///{p}"
 
-@router.get("", response_model=List[SearchResult])
+@router.get("/suggest", response_model=SuggestOut)
+def suggest(
+    db: Session = Depends(get_read_db),
+    current_user = Depends(get_current_user),
+    q: str = Query(..., min_length=1, max_length=200, description="Texto digitado até agora"),
+    limit: int = Query(8, ge=1, le=20),
+):
+    s = suggest_terms(db, q, limit=limit, root_ids=readable_root_ids(db, current_user))
+    return SuggestOut(
+        terms=[TermSuggestionOut(term=t.term, docs=t.docs, completion=t.completion) for t in s.terms],
+        files=[FileSuggestionOut(id=f.id, name=f.name, path=f.path) for f in s.files],
+    )
+
+@router.get("", response_model=Union[List[SearchResult], SearchPage])
 def search(
-    db: Session = Depends(get_db),
+    response: Response,
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user),
     q: str = Query(..., description="Consulta FTS5 (use aspas para frase, AND/OR, NEAR)"),
     ext: Optional[str] = Query(None, description="Filtro por extensões: ex 'pdf,docx,txt'"),
@@ -48,87 +98,65 @@ def search(
     min_size: Optional[int] = Query(None, ge=0),
     max_size: Optional[int] = Query(None, ge=0),
     project: Optional[str] = Query(None, description="Código do projeto para boost"),
-    limit: int = Query(50, ge=1, le=500)
+    order: str = Query("recent", pattern="^(relevance|recent)$",
+                       description="relevance: bm25 (conteúdo + nome); recent: boost de projeto + mais recentes"),
+    cursor: Optional[str] = Query(None, description="Valor do header X-Next-Cursor da página anterior"),
+    limit: int = Query(50, ge=1, le=500),
+    facets: bool = Query(False, description="Inclui contagens por ext/raiz/ano/tamanho (resposta em envelope)"),
 ):
-    # Segurança: se root_id foi informado, exige permissão mínima (reader)
-    if root_id is not None and current_user.is_superuser != 1:
-        perm = (
-            db.query(RootFolderPermission)
-            .filter(RootFolderPermission.root_id == root_id, RootFolderPermission.user_id == current_user.id)
-            .first()
-        )
-        if not perm:
-            from fastapi import HTTPException, status
-            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Sem permissão para este diretório raiz")
-    # Monta SQL com MATCH + filtros + snippet
-    sql_parts = []
-    sql_parts.append("""
-        SELECT f.id as file_id, f.path, f.name, f.ext, f.size, f.mtime,
-               snippet(docs, 0, '[', ']', ' ... ', 8) AS snip,
-               CASE 
-                 WHEN :project IS NOT NULL AND f.name LIKE '%'||:project||'%' THEN 10.0
-                 ELSE 0.0
-               END AS boost
-        FROM docs
-        JOIN map ON docs.rowid = map.rowid_docs
-        JOIN files f ON f.id = map.file_id
-        WHERE docs MATCH :q
-    """)
-
-    params = {"q": q, "project": project}
+    # Segurança: usuário comum só vê as raízes com permissão (filtro dentro do SQL);
+    # root_id explícito fora delas é 403
+    root_ids = readable_root_ids(db, current_user)
+    if root_id is not None and root_ids is not None and root_id not in root_ids:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Sem permissão para este diretório raiz")
+
+    filters = SearchFilters(root_id=root_id, min_size=min_size, max_size=max_size, project=project)
+    # com root_id já validado, o filtro de permissão seria redundante
+    if root_id is None and root_ids is not None:
+        filters.root_ids = list(root_ids)
 
     # Filtro por extensão
     if ext:
         ext_list = [("." + e.strip().lower()) if not e.strip().startswith(".") else e.strip().lower()
                     for e in ext.split(",") if e.strip()]
-        if ext_list:
-            # cria IN (?, ?, ?)
-            placeholders = ",".join([f":ext{i}" for i in range(len(ext_list))])
-            sql_parts.append(f"AND f.ext IN ({placeholders})")
-            for i, e in enumerate(ext_list):
-                params[f"ext{i}"] = e
-
-    # Filtro por raiz
-    if root_id is not None:
-        sql_parts.append("AND f.root_id = :root_id")
-        params["root_id"] = root_id
+        filters.exts = ext_list or None
 
     # Datas
     if since:
-        since_dt = datetime.strptime(since, "%Y-%m-%d")
-        sql_parts.append("AND f.mtime >= :since_epoch")
-        params["since_epoch"] = int(since_dt.timestamp())
+        filters.since_epoch = int(datetime.strptime(since, "%Y-%m-%d").timestamp())
     if until:
-        until_dt = datetime.strptime(until, "%Y-%m-%d")
-        sql_parts.append("AND f.mtime <= :until_epoch")
-        params["until_epoch"] = int(until_dt.timestamp())
-
-    # Tamanho
-    if min_size is not None:
-        sql_parts.append("AND f.size >= :min_size")
-        params["min_size"] = int(min_size)
-    if max_size is not None:
-        sql_parts.append("AND f.size <= :max_size")
-        params["max_size"] = int(max_size)
-
-    # Ordenação: boost por nome + mtime (estável)
-    sql_parts.append("ORDER BY boost DESC, f.mtime DESC")
-    sql_parts.append("LIMIT :limit")
-    params["limit"] = limit
-
-    final_sql = "\n".join(sql_parts)
-    rows = db.execute(text(final_sql), params).fetchall()
+        filters.until_epoch = int(datetime.strptime(until, "%Y-%m-%d").timestamp())
+
+    try:
+        hits, next_cursor, truncated = search_cached(db, q, filters, order=order, limit=limit, cursor=cursor)
+        facet_counts = search_facets_cached(db, q, filters) if facets else None
+    except InvalidQuery as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if truncated:
+        # relevance: só os SEARCH_MAX_SCORED acertos mais recentes foram pontuados
+        response.headers["X-Search-Truncated"] = "true"
 
     results = []
-    for file_id, path, name, extn, size, mtime, snip, boost in rows:
-        file_uri = to_file_uri(path)
-        download_url = f"/download/{file_id}"
-        mtime_iso = datetime.fromtimestamp(mtime).isoformat()
-        score = float(boost or 0.0)
-        snippet = snip or ""
+    for h in hits:
         results.append(SearchResult(
-            name=name, ext=extn or "", path=path, file_uri=file_uri,
-            download_url=download_url, size=size or 0, mtime=mtime_iso,
-            score=score, snippet=snippet
+            name=h.name, ext=h.ext or "", path=h.path, file_uri=to_file_uri(h.path),
+            download_url=f"/download/{h.file_id}", size=h.size or 0,
+            mtime=datetime.fromtimestamp(h.mtime or 0).isoformat(),
+            score=h.score, snippet=h.snippet,
         ))
-    return results
\ No newline at end of file
+    if facet_counts is not None:
+        return SearchPage(
+            results=results,
+            facets=FacetsOut(
+                total=facet_counts.total, truncated=facet_counts.truncated,
+                ext=[FacetCountOut(value=c.value, count=c.count) for c in facet_counts.ext],
+                root_id=[FacetCountOut(value=c.value, count=c.count) for c in facet_counts.root_id],
+                year=[FacetCountOut(value=c.value, count=c.count) for c in facet_counts.year],
+                size=[FacetCountOut(value=c.value, count=c.count) for c in facet_counts.size],
+            ),
+            next_cursor=next_cursor,
+            truncated=truncated,
+        )
+    return results
@@ -3,54 +3,145 @@
 Download seguro
 - Faz download a partir de file_id (banco), evitando path arbitrário.
 - Exige JWT e permissão mínima (reader) no root_id do arquivo.
+- FileResponse: Content-Length, Range (206, retomada/seek; 416 fora do arquivo),
+  If-Range e envio sem cópia ("http.response.pathsend") quando o servidor ASGI
+  oferece; senão, blocos de 1 MB.
+- ETag = fingerprint do índice (size-mtime) e Last-Modified = mtime; GET
+  condicional (If-None-Match / If-Modified-Since) responde 304 sem abrir o arquivo.
+- POST /download/zip: vários arquivos num ZIP montado durante o envio (ids,
+  consulta ou pasta); permissão conferida uma vez por raiz envolvida.
 """
 
 import os
 import mimetypes
+import stat as stat_mod
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
-from app.db.database import get_db
-from app.core.deps import get_current_user
-from app.models.models import File, RootFolderPermission, User
+from app.core.config import settings
+from app.db.database import get_read_db
+from app.core.deps import get_current_user, readable_root_ids
+from app.models.models import File, User
+from app.services.bulk_zip import entries_by_folder, entries_by_ids, entries_by_query, iter_zip
+from app.services.search import InvalidQuery, SearchFilters
 
 router = APIRouter(prefix="", tags=["Download"])
 
-@router.get("/download/{file_id}")
+CHUNK_SIZE = 1024 * 1024
+
+def file_etag(size: int, mtime: int) -> str:
+    # mesmo f"{size}-{mtime}" usado como fingerprint em map
+    return f'"{size}-{mtime}"'
+
+def not_modified(request: Request, etag: str, mtime: int) -> bool:
+    """RFC 9110: If-None-Match tem precedência; If-Modified-Since só sem ele."""
+    inm: Optional[str] = request.headers.get("if-none-match")
+    if inm is not None:
+        tags = [t.strip() for t in inm.split(",")]
+        return "*" in tags or any(t.removeprefix("W/") == etag for t in tags)
+    ims = request.headers.get("if-modified-since")
+    if ims:
+        try:
+            return mtime <= int(parsedate_to_datetime(ims).timestamp())
+        except (TypeError, ValueError):
+            return False
+    return False
+
+@router.api_route("/download/{file_id}", methods=["GET", "HEAD"])
 def download_file(
     file_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     f = db.query(File).filter(File.id == file_id).first()
     if not f:
         raise HTTPException(status_code=404, detail="Arquivo não encontrado")
 
-    if current_user.is_superuser != 1:
-        perm = (
-            db.query(RootFolderPermission)
-            .filter(RootFolderPermission.root_id == f.root_id, RootFolderPermission.user_id == current_user.id)
-            .first()
-        )
-        if not perm:
-            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Sem permissão para este diretório raiz")
+    root_ids = readable_root_ids(db, current_user)
+    if root_ids is not None and f.root_id not in root_ids:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Sem permissão para este diretório raiz")
 
     path = f.path
-    if not path or not os.path.exists(path):
+    try:
+        st = os.stat(path) if path else None
+    except OSError:
+        st = None
+    if st is None or not stat_mod.S_ISREG(st.st_mode):
         raise HTTPException(status_code=404, detail="Arquivo não acessível no servidor")
 
+    # o disco manda: se o arquivo mudou depois do último scan, a ETag muda junto
+    mtime = int(st.st_mtime)
+    etag = file_etag(st.st_size, mtime)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(mtime, usegmt=True),
+        "Cache-Control": "private, no-cache",
+    }
+    if not_modified(request, etag, mtime):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
     mime, _ = mimetypes.guess_type(path)
     mime = mime or "application/octet-stream"
 
-    def iterfile():
-        with open(path, "rb") as fp:
-            while True:
-                chunk = fp.read(1024 * 1024)
-                if not chunk:
-                    break
-                yield chunk
+    resp = FileResponse(path, media_type=mime, filename=f.name, stat_result=st, headers=headers)
+    resp.chunk_size = CHUNK_SIZE
+    return resp
+
+class ZipRequest(BaseModel):
+    file_ids: Optional[List[int]] = Field(None, description="Arquivos específicos")
+    q: Optional[str] = Field(None, description="Consulta FTS5: todos os arquivos que casam")
+    ext: Optional[List[str]] = Field(None, description="Com q: filtro por extensões, ex ['pdf','docx']")
+    root_id: Optional[int] = Field(None, description="Com q: filtra a raiz; com folder: raiz da pasta")
+    folder: Optional[str] = Field(None, description="Caminho de uma pasta dentro de root_id (tudo abaixo dela)")
+
+@router.post("/download/zip")
+def download_zip(
+    inp: ZipRequest,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+):
+    chosen = [inp.file_ids is not None, inp.q is not None, inp.folder is not None]
+    if sum(chosen) != 1:
+        raise HTTPException(status_code=400, detail="Informe exatamente um entre file_ids, q e folder")
+
+    max_files = settings.DOWNLOAD_ZIP_MAX_FILES
+    root_ids = readable_root_ids(db, current_user)
+    if inp.root_id is not None and root_ids is not None and inp.root_id not in root_ids:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Sem permissão para este diretório raiz")
+
+    if inp.file_ids is not None:
+        if len(inp.file_ids) > max_files:
+            raise HTTPException(status_code=400, detail=f"Máximo de {max_files} arquivos por ZIP")
+        entries = entries_by_ids(db, inp.file_ids)
+        # uma checagem por raiz envolvida, não por arquivo
+        roots = {e.root_id for e in entries}
+        if root_ids is not None and not roots.issubset(root_ids):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Sem permissão para este diretório raiz")
+    elif inp.q is not None:
+        filters = SearchFilters(root_id=inp.root_id)
+        if inp.ext:
+            filters.exts = [e.lower() if e.startswith(".") else "." + e.lower() for e in inp.ext]
+        if inp.root_id is None and root_ids is not None:
+            filters.root_ids = list(root_ids)
+        try:
+            entries = entries_by_query(db, inp.q, filters, max_files)
+        except InvalidQuery as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    else:
+        if inp.root_id is None:
+            raise HTTPException(status_code=400, detail="folder exige root_id")
+        entries = entries_by_folder(db, inp.root_id, inp.folder, max_files)
+
+    if not entries:
+        raise HTTPException(status_code=404, detail="Nenhum arquivo encontrado")
 
-    headers = {"Content-Disposition": f'attachment; filename="{f.name}"'}
-    return StreamingResponse(iterfile(), media_type=mime, headers=headers)
+    name = f"mylib-{datetime.now():%Y%m%d-%H%M%S}.zip"
+    headers = {"Content-Disposition": f'attachment; filename="{name}"'}
+    return StreamingResponse(iter_zip(entries), media_type="application/zip", headers=headers)
@@ -3,117 +3,38 @@
 """
 api_indexacao.py
 - Indexa conteúdo de arquivos (files) em FTS5 (docs) com controle incremental via 'map'.
-- Suporta: PDF, DOCX, PPTX, XLSX, TXT, CSV.
+- Suporta: PDF, DOCX, PPTX, XLSX, TXT, CSV, ODT/ODS/ODP, RTF, HTML, EML (registro em app/services/extractors.py).
+- Por padrão roda como job em background (202 + job); background=false mantém
+  a indexação dentro da requisição.
+- /index/status lista arquivos cuja extração parou em limite ou falhou.
+- Candidatos vêm da fila index_queue (alimentada pelo scan); /index/queue
+  mostra quanto falta por prioridade.
+- Entre processos, no máximo INDEX_MAX_CONCURRENT indexações ao mesmo tempo
+  (vagas index:<n>); o mesmo pedido com um job ativo devolve esse job.
+- INDEX_SHARDS: /index/shards lista os shards; rebuild (job) e DELETE (esvazia)
+  atuam numa raiz só.
 """
 
-import csv
-from typing import Optional, List
-from fastapi import APIRouter, Depends, HTTPException, Query
+import time
+from datetime import datetime
+from typing import Optional, List, Union
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from pydantic import BaseModel
-from sqlalchemy import text
 from sqlalchemy.orm import Session
 
-from app.models.models import RootFolder, File
-from app.db.database import get_db
-from app.core.deps import require_root_access
-
-# Extratores (locais)
-from PyPDF2 import PdfReader
-from docx import Document
-from pptx import Presentation
-from openpyxl import load_workbook
+from app.models.models import ExtractStatus, File, User
+from app.db.database import get_db, get_read_db, serialized_writer
+from app.core.deps import get_current_user, has_root_access, require_superuser
+from app.api.routers.jobs import JobOut, job_to_out
+from app.services import shards
+from app.services.index_queue import queue_status
+from app.services.index_store import bump_index_generation
+from app.services.indexer import run_index
+from app.services.jobs import job_manager
+from app.services.work_locks import LockLost, index_keys, scan_key, work_locks
 
 router = APIRouter(prefix="/index", tags=["Indexação"])
 
-SUPPORTED_EXTS = {".pdf", ".docx", ".pptx", ".xlsx", ".txt", ".csv"}
-BATCH_SIZE = 200
-
-# --------- utilidades de extração ---------
-def safe_read_text(path, encodings=("utf-8", "latin-1", "cp1252")):
-    for enc in encodings:
-        try:
-            with open(path, "r", encoding=enc, errors="ignore") as f:
-                return f.read()
-        except Exception:
-            continue
-    return ""
-
-def extract_pdf(path):
-    try:
-        reader = PdfReader(path)
-        texts = []
-        for page in reader.pages:
-            texts.append(page.extract_text() or "")
-        return "\n".join(texts)
-    except Exception:
-        return ""
-
-def extract_docx(path):
-    try:
-        doc = Document(path)
-        return "\n".join([p.text for p in doc.paragraphs])
-    except Exception:
-        return ""
-
-def extract_pptx(path):
-    try:
-        prs = Presentation(path)
-        texts = []
-        for slide in prs.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    texts.append(shape.text)
-        return "\n".join(texts)
-    except Exception:
-        return ""
-
-def extract_xlsx(path, max_cells=10000):
-    try:
-        wb = load_workbook(path, read_only=True, data_only=True)
-        texts = []
-        total = 0
-        for ws in wb.worksheets:
-            for row in ws.iter_rows(values_only=True):
-                if total > max_cells:
-                    break
-                for cell in row:
-                    if cell is not None:
-                        texts.append(str(cell))
-                        total += 1
-        return "\n".join(texts)
-    except Exception:
-        return ""
-
-def extract_csv(path, max_rows=100000):
-    try:
-        texts = []
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            reader = csv.reader(f)
-            for i, row in enumerate(reader):
-                if i > max_rows:
-                    break
-                texts.append(" ".join([str(x) for x in row if x is not None]))
-        return "\n".join(texts)
-    except Exception:
-        return ""
-
-def extract_text(path, ext):
-    ext = (ext or "").lower()
-    if ext == ".pdf":
-        return extract_pdf(path)
-    elif ext == ".docx":
-        return extract_docx(path)
-    elif ext == ".pptx":
-        return extract_pptx(path)
-    elif ext == ".xlsx":
-        return extract_xlsx(path)
-    elif ext == ".txt":
-        return safe_read_text(path)
-    elif ext == ".csv":
-        return extract_csv(path)
-    else:
-        return ""
-
 def normalize_ext_list(ext: Optional[str]) -> Optional[List[str]]:
     if not ext:
         return None
@@ -133,94 +54,174 @@ class IndexRunResult(BaseModel):
     indexed: int
     skipped: int
     errors: int
+    cached: int = 0
+    deduped: int = 0
+    limited: int = 0
+    retried: int = 0
     elapsed_sec: float
 
+class ExtractStatusOut(BaseModel):
+    file_id: int
+    root_id: int
+    path: str
+    status: str
+    detail: Optional[str]
+    chars: Optional[int]
+    elapsed_ms: Optional[int]
+    updated_at: datetime
+
+class QueueStatusOut(BaseModel):
+    root_id: Optional[int]
+    new: int  # arquivos novos
+    modified: int  # tamanho/mtime mudou
+    retry: int  # falharam, aguardando nova tentativa
+    leased: int  # reservados por uma execução em andamento
+    waiting: int  # ainda dentro da espera da nova tentativa
+
+class ShardOut(BaseModel):
+    root_id: int
+    path: str
+    exists: bool  # raiz ainda sem nada indexado não tem arquivo
+    size_bytes: int  # arquivo + WAL
+    files_indexed: int  # linhas de map da raiz
+
 # --------- endpoint ---------
-@router.post("/run", response_model=IndexRunResult)
+@router.post("/run", response_model=Union[JobOut, IndexRunResult])
 def index_run(
+    response: Response,
     db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
     root_id: Optional[int] = Query(None, description="Se informado, indexa apenas essa raiz"),
     ext: Optional[str] = Query(None, description="Filtro por extensões: ex 'pdf,docx,xlsx'"),
     limit: Optional[int] = Query(None, ge=1, le=100000, description="Limite opcional de arquivos a processar"),
-    reindex_all: bool = Query(False, description="Se true, força reindexação mesmo sem mudança")
+    reindex_all: bool = Query(False, description="Se true, força reindexação mesmo sem mudança"),
+    background: bool = Query(True, description="true: enfileira um job e responde 202 (acompanhar em /jobs/{id}); false: indexa dentro da requisição"),
 ):
-    import time
-    t0 = time.time()
+    # Segurança: indexar uma raiz exige 'editor' nela; indexar tudo exige superuser
+    if current_user.is_superuser != 1:
+        if root_id is None:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Informe root_id (indexação global restrita a superuser)")
+        if not has_root_access(db, current_user, root_id, "editor"):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Sem permissão de indexação nesta raiz")
 
     ext_filter = normalize_ext_list(ext)
 
-    # Seleciona arquivos candidatos
-    q = db.query(File)
-    if root_id is not None:
-        q = q.filter(File.root_id == root_id)
-    # aplica filtro por extensão suportada/solicitada
-    if ext_filter:
-        q = q.filter(File.ext.in_(ext_filter))
-    else:
-        q = q.filter(File.ext.in_(list(SUPPORTED_EXTS)))
-
-    # ordena por mtime desc e limita se pedido
-    q = q.order_by(File.mtime.desc().nullslast(), File.id.asc())
-    if limit:
-        q = q.limit(limit)
-
-    files = q.all()
-
-    candidates = len(files)
-    indexed = 0
-    skipped = 0
-    errors = 0
-
-    # Preparar statements SQL para FTS5 (docs) e map
-    ins_docs = text("INSERT INTO docs(content, filename, ext) VALUES (:content, :filename, :ext)")
-    sel_map = text("SELECT rowid_docs, fingerprint FROM map WHERE file_id = :fid")
-    upsert_map = text("""
-        INSERT INTO map(file_id, rowid_docs, fingerprint) VALUES (:fid, :rowid, :fp)
-        ON CONFLICT(file_id) DO UPDATE SET rowid_docs = excluded.rowid_docs, fingerprint = excluded.fingerprint
-    """)
-    del_docs = text("DELETE FROM docs WHERE rowid = :rowid")
-
-    batch = 0
-
-    for f in files:
-        try:
-            fp = f"{f.size}-{f.mtime}"
-            # checar map existente
-            row_map = db.execute(sel_map, {"fid": f.id}).fetchone()
-            if row_map and not reindex_all:
-                existing_rowid, existing_fp = row_map
-                if existing_fp == fp:
-                    skipped += 1
-                    continue
-                # fingerprint mudou -> apagar docs antigo antes de reindexar
-                if existing_rowid is not None:
-                    db.execute(del_docs, {"rowid": existing_rowid})
-
-            # extrair texto
-            content = extract_text(f.path, f.ext) or ""
-            # inserir no FTS5
-            res = db.execute(ins_docs, {"content": content, "filename": f.name, "ext": f.ext or ""})
-            # SQLite retorna via cursor.lastrowid em nível DB-API; em SQLAlchemy, podemos buscar com SELECT last_insert_rowid()
-            rowid = db.execute(text("SELECT last_insert_rowid()")).scalar()
-
-            # mapear file_id -> docs.rowid com fingerprint
-            db.execute(upsert_map, {"fid": f.id, "rowid": rowid, "fp": fp})
-
-            indexed += 1
-            batch += 1
-            if batch % BATCH_SIZE == 0:
-                db.commit()
-        except Exception:
-            errors += 1
-            continue
+    if background:
+        job = job_manager.submit(
+            db, "index",
+            {"root_id": root_id, "ext": ext_filter, "limit": limit, "reindex_all": reindex_all},
+            root_id=root_id, user_id=current_user.id,
+        )
+        response.status_code = 202
+        return job_to_out(job)
 
-    db.commit()
+    t0 = time.time()
+    try:
+        with work_locks.hold(index_keys()) as key, serialized_writer():
+            stats = run_index(db, root_id=root_id, ext_filter=ext_filter, limit=limit, reindex_all=reindex_all,
+                              progress=lambda _stats: work_locks.check(key))
+    except LockLost as e:
+        # lotes já gravados ficam; o resto voltou para a fila
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     dt = time.time() - t0
 
     return IndexRunResult(
-        candidates=candidates,
-        indexed=indexed,
-        skipped=skipped,
-        errors=errors,
+        candidates=stats.candidates,
+        indexed=stats.indexed,
+        skipped=stats.skipped,
+        errors=stats.errors,
+        cached=stats.cached,
+        deduped=stats.deduped,
+        limited=stats.limited,
+        retried=stats.retried,
         elapsed_sec=round(dt, 2),
     )
+
+@router.get("/status", response_model=List[ExtractStatusOut])
+def extract_status(
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+    root_id: Optional[int] = Query(None, description="Filtrar por raiz (obrigatório para não-superuser)"),
+    status_: Optional[str] = Query(None, alias="status", description="truncated|timeout|too_large|error"),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    if current_user.is_superuser != 1:
+        if root_id is None:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Informe root_id")
+        if not has_root_access(db, current_user, root_id):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Sem permissão para este diretório raiz")
+
+    q = db.query(ExtractStatus, File).join(File, File.id == ExtractStatus.file_id)
+    if root_id is not None:
+        q = q.filter(File.root_id == root_id)
+    if status_:
+        q = q.filter(ExtractStatus.status == status_)
+    rows = q.order_by(ExtractStatus.updated_at.desc()).limit(limit).all()
+    return [
+        ExtractStatusOut(
+            file_id=st.file_id, root_id=f.root_id, path=f.path, status=st.status, detail=st.detail,
+            chars=st.chars, elapsed_ms=st.elapsed_ms, updated_at=st.updated_at,
+        )
+        for st, f in rows
+    ]
+
+@router.get("/queue", response_model=QueueStatusOut)
+def index_queue(
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+    root_id: Optional[int] = Query(None, description="Filtrar por raiz (obrigatório para não-superuser)"),
+):
+    if current_user.is_superuser != 1:
+        if root_id is None:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Informe root_id")
+        if not has_root_access(db, current_user, root_id):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Sem permissão para este diretório raiz")
+    return QueueStatusOut(root_id=root_id, **queue_status(db, root_id))
+
+# --------- shards (INDEX_SHARDS) ---------
+def _require_shards() -> None:
+    if not shards.enabled():
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Índice sem shards (INDEX_SHARDS=false)")
+
+@router.get("/shards", response_model=List[ShardOut])
+def shard_list(
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(require_superuser),
+):
+    _require_shards()
+    return shards.shard_info(db, shards.all_root_ids(db))
+
+@router.post("/shards/{root_id}/rebuild", response_model=JobOut, status_code=202)
+def shard_rebuild(
+    root_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Esvazia o shard da raiz e reindexa todos os arquivos dela (job)."""
+    _require_shards()
+    if current_user.is_superuser != 1 and not has_root_access(db, current_user, root_id, "editor"):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Sem permissão de indexação nesta raiz")
+    if root_id not in shards.all_root_ids(db):
+        raise HTTPException(status_code=404, detail="Root não encontrado")
+    job = job_manager.submit(
+        db, "index",
+        {"root_id": root_id, "ext": None, "limit": None, "reindex_all": True, "rebuild_shard": True},
+        root_id=root_id, user_id=current_user.id,
+    )
+    return job_to_out(job)
+
+@router.delete("/shards/{root_id}", status_code=204)
+def shard_drop(
+    root_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_superuser),
+):
+    """Esvazia o shard da raiz (some da busca); volta com rebuild ou reindex_all."""
+    _require_shards()
+    if root_id not in shards.all_root_ids(db):
+        raise HTTPException(status_code=404, detail="Root não encontrado")
+    # todas as vagas de indexação: nenhuma execução grava no shard enquanto ele é esvaziado
+    with work_locks.hold(scan_key(root_id)), work_locks.hold_all(index_keys()), serialized_writer():
+        shards.reset_shard(db, root_id)
+        bump_index_generation(db)
+    return Response(status_code=204)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+api_jobs.py
+- Acompanhamento de jobs em background (scan / indexação).
+- Progresso ao vivo (contadores, throughput, ETA) e cancelamento.
+- Usuário comum vê os próprios jobs e os de raízes em que é editor (um pedido
+  repetido devolve o job ativo de quem pediu primeiro); superuser vê todos.
+"""
+
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from app.models.models import Job, User
+from app.db.database import get_db, get_read_db
+from app.core.deps import get_current_user, has_root_access
+from app.services.jobs import job_manager
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+class JobOut(BaseModel):
+    id: int
+    kind: str
+    root_id: Optional[int]
+    status: str
+    cancel_requested: bool
+    params: Dict[str, Any]
+    counters: Dict[str, Any]
+    processed: int
+    total: Optional[int]
+    throughput_per_sec: Optional[float]
+    eta_sec: Optional[float]
+    elapsed_sec: Optional[float]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    error: Optional[str]
+    result: Optional[Dict[str, Any]]
+
+def job_to_out(job: Job) -> JobOut:
+    # job rodando neste processo: usa o progresso em memória (mais recente que o banco)
+    live = job_manager.live(job.id)
+    processed = live["processed"] if live else (job.processed or 0)
+    total = live["total"] if live else job.total
+    counters = live["counters"] if live else json.loads(job.counters or "{}")
+
+    elapsed = throughput = eta = None
+    if job.started_at:
+        end = job.finished_at or datetime.utcnow()
+        elapsed = max(0.0, (end - job.started_at).total_seconds())
+        if elapsed > 0:
+            throughput = round(processed / elapsed, 2)
+        if job.status == "running" and throughput and total and total > processed:
+            eta = round((total - processed) / throughput, 1)
+        elapsed = round(elapsed, 2)
+
+    return JobOut(
+        id=job.id,
+        kind=job.kind,
+        root_id=job.root_id,
+        status=job.status,
+        cancel_requested=bool(job.cancel_requested),
+        params=json.loads(job.params or "{}"),
+        counters=counters,
+        processed=processed,
+        total=total,
+        throughput_per_sec=throughput,
+        eta_sec=eta,
+        elapsed_sec=elapsed,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        error=job.error,
+        result=json.loads(job.result) if job.result else None,
+    )
+
+def _get_visible_job(db: Session, job_id: int, current_user: User) -> Job:
+    job = db.query(Job).filter(Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    if (current_user.is_superuser != 1 and job.created_by != current_user.id
+            and not (job.root_id is not None and has_root_access(db, current_user, job.root_id, "editor"))):
+        raise HTTPException(status_code=403, detail="Sem permissão para este job")
+    return job
+
+@router.get("", response_model=List[JobOut])
+def list_jobs(
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+    status: Optional[str] = Query(None, description="queued|running|done|failed|cancelled|interrupted"),
+    kind: Optional[str] = Query(None, description="scan|index"),
+    root_id: Optional[int] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+):
+    q = db.query(Job)
+    if current_user.is_superuser != 1:
+        q = q.filter(Job.created_by == current_user.id)
+    if status:
+        q = q.filter(Job.status == status)
+    if kind:
+        q = q.filter(Job.kind == kind)
+    if root_id is not None:
+        q = q.filter(Job.root_id == root_id)
+    rows = q.order_by(Job.id.desc()).limit(limit).all()
+    return [job_to_out(j) for j in rows]
+
+@router.get("/{job_id}", response_model=JobOut)
+def get_job(job_id: int, db: Session = Depends(get_read_db), current_user: User = Depends(get_current_user)):
+    return job_to_out(_get_visible_job(db, job_id, current_user))
+
+@router.post("/{job_id}/cancel", response_model=JobOut)
+def cancel_job(job_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    job = _get_visible_job(db, job_id, current_user)
+    job_manager.cancel(db, job)
+    return job_to_out(job)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+api_metrics.py
+- Métricas internas do processo (somente superuser).
+- /metrics/caches: entradas, acertos/erros e despejos de cada cache em memória.
+- /metrics/watch: raízes acompanhadas pelo watcher (backend, pendências, contadores).
+- /metrics/locks: travas entre processos ativas (scan/index/watch), de todos os workers.
+"""
+
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel
+
+from app.core.cache import all_cache_stats
+from app.core.deps import require_superuser
+from app.services.watcher import watch_manager
+from app.services.work_locks import work_locks
+
+router = APIRouter(prefix="/metrics", tags=["Métricas"], dependencies=[Depends(require_superuser)])
+
+class CacheStatsOut(BaseModel):
+    name: str
+    entries: int
+    max_entries: int
+    ttl_sec: float
+    hits: int
+    misses: int
+    hit_rate: Optional[float]
+    evictions: int
+    expirations: int
+
+@router.get("/caches", response_model=List[CacheStatsOut])
+def cache_stats():
+    return all_cache_stats()
+
+class WatchStatusOut(BaseModel):
+    root_id: int
+    path: str
+    backend: Optional[str]  # inotify | poll (None enquanto inicia)
+    watches: int
+    pending: int
+    last_flush_at: Optional[str]
+    events: int
+    flushes: int
+    upserted: int
+    deleted: int
+    indexed: int
+    rescans: int
+    errors: int
+
+@router.get("/watch", response_model=List[WatchStatusOut])
+def watch_status():
+    return watch_manager.status()
+
+class LockOut(BaseModel):
+    key: str  # scan:<root_id> | index:<n> | watch:<root_id>
+    owner: str  # host:pid:uuid do processo
+    job_id: Optional[int]
+    mine: bool  # deste processo
+    held_sec: float
+    expires_in_sec: float
+
+@router.get("/locks", response_model=List[LockOut])
+def lock_status():
+    return work_locks.active()
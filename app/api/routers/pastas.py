@@ -3,6 +3,8 @@
 """
 api_pastas.py
 CRUD para a tabela root_folders.
+Remover a raiz tira do índice os arquivos dela (files, map, docs e
+extract_status, como no scan); com INDEX_SHARDS, apaga também o arquivo do shard.
 """
 
 from datetime import datetime
@@ -12,9 +14,11 @@ from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel, Field, validator
 from sqlalchemy.orm import Session
 
-from app.models.models import RootFolder
+from app.models.models import File, RootFolder
 from app.db.database import get_db
 from app.core.deps import require_superuser
+from app.services import shards
+from app.services.index_store import bump_index_generation, purge_files
 router = APIRouter(prefix="/roots", tags=["Pastas Raiz"], dependencies=[Depends(require_superuser)])
 
 # -------- Schemas --------
@@ -112,6 +116,12 @@ def delete_root(root_id: int, db: Session = Depends(get_db)):
     rf = db.query(RootFolder).filter(RootFolder.id == root_id).first()
     if not rf:
         raise HTTPException(status_code=404, detail="Root não encontrado")
+    if shards.enabled():
+        # sem o shard, purge_files só limpa o banco principal
+        shards.drop_shard(root_id)
+    # FTS5 não tem cascata: docs (e map) saem pelo mesmo caminho do scan
+    purge_files(db, [fid for (fid,) in db.query(File.id).filter(File.root_id == root_id)])
     db.delete(rf)
     db.commit()
+    bump_index_generation(db)
     return Response(status_code=204)
@@ -6,22 +6,33 @@ api_scan.py
 - Atualiza estatísticas da raiz: files_count, total_size_bytes, last_scan_at.
 
 Observações:
-- Incremental: se o path já existe em 'files', atualiza size/mtime/ext/name.
+- Incremental: carrega (path, size, mtime) da raiz uma vez e grava apenas
+  inserts/updates, em lote (INSERT ... ON CONFLICT DO UPDATE).
 - Extensões filtráveis via query (?ext=pdf,docx,xlsx). Se não informar, varre todas.
+- Arquivos que não existem mais no disco saem de 'files', 'map' e 'docs' (campo deleted).
+- mode=incremental (padrão) usa o cache por diretório (scan_dirs) para não
+  relistar pastas cujo mtime não mudou; mode=full relista a árvore inteira.
+- Por padrão roda como job em background (202 + job); background=false mantém
+  a varredura dentro da requisição. Pedir o scan de uma raiz que já está na
+  fila ou rodando (mesmos parâmetros, qualquer processo) devolve o job existente.
+- Um scan por raiz entre processos (trava scan:<root_id>).
 """
 
 import os
 import time
-from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Union
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
-from app.models.models import RootFolder, File
-from app.db.database import get_db
-from app.core.deps import require_root_access
+from app.models.models import RootFolder, User
+from app.db.database import get_db, serialized_writer
+from app.core.deps import get_current_user, require_root_access
+from app.api.routers.jobs import JobOut, job_to_out
+from app.services.jobs import job_manager
+from app.services.scanner import run_root_scan
+from app.services.work_locks import LockLost, scan_key, work_locks
 
 router = APIRouter(prefix="/scan", tags=["Scan / Varredura"])
 
@@ -29,6 +40,7 @@ router = APIRouter(prefix="/scan", tags=["Scan / Varredura"])
 class ScanResult(BaseModel):
     root_id: int
     root_path: str
+    mode: str
     candidates: int
     inserted: int
     updated: int
@@ -36,6 +48,8 @@ class ScanResult(BaseModel):
     errors: int
     total_size_bytes: int
     files_count: int
+    pruned_dirs: int
+    deleted: int
     elapsed_sec: float
     last_scan_at: str
 
@@ -54,12 +68,16 @@ def normalize_ext_list(ext: Optional[str]) -> Optional[List[str]]:
     return items or None
 
 # --------- Endpoint de scan ---------
-@router.post("/{root_id}", response_model=ScanResult)
+@router.post("/{root_id}", response_model=Union[JobOut, ScanResult])
 def scan_root(
     root_id: int,
+    response: Response,
     ext: Optional[str] = Query(None, description="Filtro de extensões: ex 'pdf,docx,xlsx'"),
+    mode: str = Query("incremental", pattern="^(incremental|full)$", description="incremental: pula diretórios de mtime inalterado; full: relista tudo"),
+    background: bool = Query(True, description="true: enfileira um job e responde 202 (acompanhar em /jobs/{id}); false: varre dentro da requisição"),
     db: Session = Depends(get_db),
-    current_user = Depends(require_root_access('editor'))
+    _root = Depends(require_root_access('editor')),
+    current_user: User = Depends(get_current_user),
 ):
     rf = db.query(RootFolder).filter(RootFolder.id == root_id).first()
     if not rf:
@@ -74,87 +92,24 @@ def scan_root(
         raise HTTPException(status_code=404, detail=f"Caminho não existe: {base_path}")
 
     ext_filter = normalize_ext_list(ext)
-    t0 = time.time()
 
-    candidates = 0
-    inserted = 0
-    updated = 0
-    skipped = 0
-    errors = 0
-    total_size = 0
-    files_count = 0
+    if background:
+        job = job_manager.submit(
+            db, "scan", {"root_id": root_id, "ext": ext_filter, "mode": mode},
+            root_id=root_id, user_id=current_user.id,
+        )
+        response.status_code = 202
+        return job_to_out(job)
 
-    # Caminhamento
+    t0 = time.time()
     try:
-        for root, dirs, files in os.walk(base_path):
-            for fn in files:
-                candidates += 1
-                full = os.path.join(root, fn)
-                # Coleta metadados com tolerância a erro
-                try:
-                    st = os.stat(full)
-                    size = int(st.st_size)
-                    mtime = int(st.st_mtime)  # epoch seconds
-                    name = fn
-                    extn = os.path.splitext(fn)[1].lower()
-                    if ext_filter and extn not in ext_filter:
-                        skipped += 1
-                        continue
-
-                    total_size += size
-                    files_count += 1
-
-                    # Upsert manual por path
-                    rec = db.query(File).filter(File.path == full).first()
-                    if rec is None:
-                        rec = File(
-                            root_id=root_id,
-                            path=full,
-                            name=name,
-                            ext=extn,
-                            size=size,
-                            mtime=mtime
-                        )
-                        db.add(rec)
-                        inserted += 1
-                    else:
-                        changed = False
-                        if rec.root_id != root_id:
-                            rec.root_id = root_id
-                            changed = True
-                        if rec.name != name:
-                            rec.name = name
-                            changed = True
-                        if rec.ext != extn:
-                            rec.ext = extn
-                            changed = True
-                        if rec.size != size:
-                            rec.size = size
-                            changed = True
-                        if rec.mtime != mtime:
-                            rec.mtime = mtime
-                            changed = True
-                        if changed:
-                            updated += 1
-                        else:
-                            skipped += 1
-
-                    # Commit em lotes leves (melhorar: transações maiores)
-                    if (inserted + updated) % 500 == 0:
-                        db.commit()
-
-                except Exception:
-                    errors += 1
-                    # segue adiante
-                    continue
-
-        # Commit final e atualização das stats da raiz
-        db.commit()
-        rf.files_count = files_count
-        rf.total_size_bytes = total_size
-        rf.last_scan_at = datetime.utcnow()
-        db.commit()
-
+        with work_locks.hold(scan_key(root_id)) as key, serialized_writer():
+            rf, stats = run_root_scan(db, root_id, ext_filter=ext_filter, mode=mode,
+                                      progress=lambda _stats: work_locks.check(key))
+    except LockLost as e:
+        # outro processo assumiu o scan da raiz: o que já foi gravado fica
+        db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Falha ao varrer: {str(e)}")
@@ -163,13 +118,16 @@ def scan_root(
     return ScanResult(
         root_id=root_id,
         root_path=base_path,
-        candidates=candidates,
-        inserted=inserted,
-        updated=updated,
-        skipped=skipped,
-        errors=errors,
-        total_size_bytes=total_size,
-        files_count=files_count,
+        mode=mode,
+        candidates=stats.candidates,
+        inserted=stats.inserted,
+        updated=stats.updated,
+        skipped=stats.skipped,
+        errors=stats.errors,
+        total_size_bytes=stats.total_size_bytes,
+        files_count=stats.files_count,
+        pruned_dirs=stats.pruned_dirs,
+        deleted=stats.deleted,
         elapsed_sec=round(dt, 2),
         last_scan_at=rf.last_scan_at.isoformat() if rf.last_scan_at else ""
     )
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+app/core/auth_cache.py
+- Caches da cadeia de dependências de autenticação (por processo, TTL):
+  - auth_tokens: token JWT -> payload decodificado (respeita o exp do token)
+  - auth_users: username -> cópia destacada da linha de users
+  - root_access: user_id -> {root_id: access_level}
+- Invalidação explícita: alterações em User / RootFolderPermission feitas pelo
+  ORM limpam as entradas afetadas quando a transação é confirmada (after_commit),
+  para que outra requisição não recarregue o valor antigo entre flush e commit.
+- Alterações fora do ORM (SQL direto, outro processo) valem após AUTH_CACHE_TTL_SEC.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.models.models import RootFolderPermission, User
+
+token_cache = LRUCache("auth_tokens", settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL_SEC)
+user_cache = LRUCache("auth_users", settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL_SEC)
+root_access_cache = LRUCache("root_access", settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL_SEC)
+
+_PENDING = "auth_cache_invalidate"
+
+
+def get_token_payload(token: str) -> Optional[Dict[str, Any]]:
+    payload = token_cache.get(token)
+    if payload is not None and payload.get("exp", 0) <= time.time():
+        token_cache.invalidate(token)
+        return None
+    return payload
+
+
+def put_token_payload(token: str, payload: Dict[str, Any]) -> None:
+    token_cache.put(token, payload)
+
+
+def get_user(db: Session, username: str) -> Optional[User]:
+    """Usuário do cache, anexado à sessão sem SELECT (merge load=False)."""
+    cached = user_cache.get(username)
+    if cached is None:
+        return None
+    return db.merge(cached, load=False)
+
+
+def put_user(user: User) -> None:
+    # cópia própria: a instância da requisição continua ligada à sessão dela
+    copy = User(**{c.key: getattr(user, c.key) for c in User.__table__.columns})
+    make_transient_to_detached(copy)
+    user_cache.put(user.username, copy)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect(session: Session, flush_context) -> None:
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(obj, (User, RootFolderPermission)):
+            continue
+        pending = session.info.setdefault(_PENDING, {"users": False, "perm_users": set()})
+        if isinstance(obj, User):
+            # username pode ter mudado: mais simples limpar todos os usuários
+            pending["users"] = True
+            pending["perm_users"].add(obj.id)
+        else:
+            pending["perm_users"].add(obj.user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply(session: Session) -> None:
+    pending = session.info.pop(_PENDING, None)
+    if not pending:
+        return
+    if pending["users"]:
+        user_cache.clear()
+    for user_id in pending["perm_users"]:
+        root_access_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session: Session) -> None:
+    session.info.pop(_PENDING, None)
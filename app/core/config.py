@@ -8,15 +8,100 @@ class Settings(BaseSettings):
     ENV: str = "dev"
     # SQLite default (mantém compatível com seu projeto atual)
     DATABASE_URL: str = Field(default="sqlite:///./mylib.db")
+    # SQLite: pragmas de cada conexão. WAL deixa a busca ler durante scan/indexação
+    # (use "delete" se o .db estiver num compartilhamento de rede: WAL exige disco local)
+    SQLITE_JOURNAL_MODE: str = Field(default="wal")
+    SQLITE_SYNCHRONOUS: str = Field(default="normal")  # normal é seguro em WAL
+    SQLITE_CACHE_SIZE_MB: int = Field(default=64)  # por conexão
+    SQLITE_MMAP_SIZE_MB: int = Field(default=256)
+    SQLITE_TEMP_STORE: str = Field(default="memory")
+    SQLITE_BUSY_TIMEOUT_MS: int = Field(default=10000)
+    # conexões somente leitura (busca, arquivos, download)
+    DB_READ_POOL_SIZE: int = Field(default=8)
 
     # JWT
     JWT_SECRET_KEY: str = Field(default="CHANGE_ME_SUPER_SECRET")
     JWT_ALGORITHM: str = Field(default="HS256")
     JWT_EXPIRES_MINUTES: int = Field(default=60 * 12)  # 12h
+    # cache de tokens decodificados, usuários e raízes legíveis (por processo; 0 desliga)
+    AUTH_CACHE_SIZE: int = Field(default=10000)
+    AUTH_CACHE_TTL_SEC: float = Field(default=60.0)
 
     # Seed admin (cria/atualiza na inicialização)
     ADMIN_USERNAME: str = Field(default="admin")
     ADMIN_PASSWORD: str = Field(default="admin123")
     ADMIN_EMAIL: str = Field(default="admin@example.com")
 
+    # Scan: threads que listam diretórios em paralelo (I/O bound, bom para UNC)
+    SCAN_WORKERS: int = Field(default=16)
+    # Scan: linhas de 'files' por executemany/commit
+    SCAN_BATCH_SIZE: int = Field(default=10000)
+
+    # Indexação: processos de extração (0 = nº de CPUs); 1 com
+    # INDEX_FILE_TIMEOUT_SEC=0 extrai na própria thread, sem processos
+    INDEX_WORKERS: int = Field(default=0)
+    # tarefas em voo por processo (limita memória de textos aguardando gravação)
+    INDEX_QUEUE_FACTOR: int = Field(default=4)
+    # limites por arquivo na extração (estourou => status truncated/timeout/too_large)
+    INDEX_MAX_FILE_MB: int = Field(default=200)
+    INDEX_MAX_CHARS: int = Field(default=2_000_000)
+    INDEX_MAX_PAGES: int = Field(default=2000)  # páginas de PDF / slides de PPTX
+    # prazo por arquivo: o processo de extração é morto 5s depois (0 = sem prazo)
+    INDEX_FILE_TIMEOUT_SEC: float = Field(default=60.0)
+    # módulos extras com @register_extractor (separados por vírgula)
+    INDEX_EXTRACTOR_PLUGINS: str = Field(default="")
+    # cache do texto extraído (SQLite à parte, zlib); 0 desliga
+    TEXT_CACHE_PATH: str = Field(default="./text_cache.db")
+    TEXT_CACHE_MAX_MB: int = Field(default=2048)
+    # arquivos de conteúdo e nome idênticos compartilham um único docs (hash só quando o tamanho se repete)
+    INDEX_DEDUP: bool = Field(default=True)
+    # fila de indexação: lease de cada lote reservado (vencido, volta para a fila)
+    INDEX_LEASE_SEC: float = Field(default=600.0)
+    # erro/timeout na extração: novas tentativas com espera BACKOFF * 2^(n-1)
+    INDEX_RETRY_MAX_ATTEMPTS: int = Field(default=3)
+    INDEX_RETRY_BACKOFF_SEC: float = Field(default=600.0)
+    # índice de conteúdo (docs) num arquivo por raiz, em INDEX_SHARD_DIR; mudar
+    # a opção reconstrói o índice na próxima inicialização
+    INDEX_SHARDS: bool = Field(default=False)
+    INDEX_SHARD_DIR: str = Field(default="./shards")
+    # busca em várias raízes com INDEX_SHARDS: shards consultados em paralelo
+    SEARCH_SHARD_WORKERS: int = Field(default=8)
+
+    # Busca: pesos do bm25 por coluna de docs (order=relevance)
+    SEARCH_WEIGHT_CONTENT: float = Field(default=1.0)
+    SEARCH_WEIGHT_FILENAME: float = Field(default=5.0)
+    # relevance: pontua no máximo os N acertos mais recentes (0 = todos)
+    SEARCH_MAX_SCORED: int = Field(default=20000)
+    # cache de resultados em memória (por processo); 0 desliga
+    SEARCH_CACHE_SIZE: int = Field(default=1000)
+    SEARCH_CACHE_TTL_SEC: float = Field(default=300.0)
+    # facetas (facets=true): contadas sobre no máximo N acertos (os mais recentes)
+    SEARCH_FACET_MAX_ROWS: int = Field(default=50000)
+    SEARCH_FACET_MAX_VALUES: int = Field(default=20)
+    # autocompletar: termos em menos docs que isso não são sugeridos; cache de prefixos
+    SUGGEST_MIN_DOCS: int = Field(default=2)
+    SUGGEST_CACHE_SIZE: int = Field(default=2000)
+    SUGGEST_CACHE_TTL_SEC: float = Field(default=600.0)
+
+    # Download em lote (POST /download/zip): máximo de arquivos por ZIP
+    DOWNLOAD_ZIP_MAX_FILES: int = Field(default=5000)
+
+    # Watcher: mudanças no disco vão para files/índice em segundos (inotify no
+    # Linux, senão scan incremental a cada WATCH_POLL_SEC). Com vários processos,
+    # cada raiz é acompanhada por um só (trava watch:<root_id>).
+    WATCH_ENABLED: bool = Field(default=False)
+    WATCH_ROOTS: str = Field(default="")  # ids separados por vírgula; vazio = todas as raízes
+    WATCH_BACKEND: str = Field(default="auto")  # auto | inotify | poll (compartilhamentos de rede)
+    WATCH_DEBOUNCE_SEC: float = Field(default=2.0)  # aplica após N s sem eventos novos...
+    WATCH_MAX_DELAY_SEC: float = Field(default=30.0)  # ...ou no máximo N s após o primeiro
+    WATCH_POLL_SEC: float = Field(default=300.0)
+
+    # Jobs em background (scan/indexação)
+    JOB_WORKERS: int = Field(default=2)
+    JOB_FLUSH_SEC: float = Field(default=2.0)  # intervalo de gravação do progresso
+    JOB_STALE_SEC: int = Field(default=120)  # sem heartbeat por esse tempo => interrompido
+    # Travas entre processos (uvicorn --workers N): validade renovada a cada 1/3
+    LOCK_TTL_SEC: float = Field(default=60.0)
+    INDEX_MAX_CONCURRENT: int = Field(default=1)  # indexações simultâneas, somando todos os processos
+
 settings = Settings()
@@ -1,13 +1,14 @@
 from __future__ import annotations
 
-from typing import Callable, Optional
+from typing import Callable, Dict, Optional, Tuple
 
 from fastapi import Depends, HTTPException, Path, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.orm import Session
 
+from app.core import auth_cache
 from app.core.security import decode_token
-from app.db.database import get_db
+from app.db.database import get_read_db
 from app.models.models import User, RootFolderPermission
 
 bearer_scheme = HTTPBearer(auto_error=True)
@@ -17,18 +18,25 @@ _ACCESS_ORDER = {"reader": 1, "editor": 2, "admin": 3}
 
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ) -> User:
     token = credentials.credentials
-    try:
-        payload = decode_token(token)
-        username = payload.get("sub")
-        if not username:
-            raise ValueError("missing sub")
-    except Exception:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token inválido ou expirado")
-
-    user = db.query(User).filter(User.username == username).first()
+    payload = auth_cache.get_token_payload(token)
+    if payload is None:
+        try:
+            payload = decode_token(token)
+            if not payload.get("sub"):
+                raise ValueError("missing sub")
+        except Exception:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token inválido ou expirado")
+        auth_cache.put_token_payload(token, payload)
+    username = payload["sub"]
+
+    user = auth_cache.get_user(db, username)
+    if user is None:
+        user = db.query(User).filter(User.username == username).first()
+        if user:
+            auth_cache.put_user(user)
     if not user or user.is_active != 1:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Usuário inativo ou inexistente")
     return user
@@ -47,25 +55,53 @@ def require_root_access(min_level: str) -> Callable:
     def _dep(
         root_id: int = Path(..., ge=1),
         current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db),
+        db: Session = Depends(get_read_db),
     ) -> int:
         if current_user.is_superuser == 1:
             return root_id
 
-        perm = (
-            db.query(RootFolderPermission)
-            .filter(
-                RootFolderPermission.root_folder_id == root_id,
-                RootFolderPermission.user_id == current_user.id,
-            )
-            .first()
-        )
-        if not perm:
+        have = root_access_levels(db, current_user).get(root_id)
+        if have is None:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Sem permissão para este diretório raiz")
 
-        have = perm.access_level
         if _ACCESS_ORDER.get(have, 0) < _ACCESS_ORDER[min_level]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Nível de acesso insuficiente")
         return root_id
 
     return _dep
+
+
+def root_access_levels(db: Session, user: User) -> Dict[int, str]:
+    """Mapa root_id -> access_level do usuário (cacheado; não modificar)."""
+    cached = auth_cache.root_access_cache.get(user.id)
+    if cached is not None:
+        return cached
+    levels = dict(
+        db.query(RootFolderPermission.root_id, RootFolderPermission.access_level)
+        .filter(RootFolderPermission.user_id == user.id)
+        .all()
+    )
+    auth_cache.root_access_cache.put(user.id, levels)
+    return levels
+
+
+def has_root_access(db: Session, user: User, root_id: int, min_level: str = "reader") -> bool:
+    if user.is_superuser == 1:
+        return True
+    have = root_access_levels(db, user).get(root_id)
+    return have is not None and _ACCESS_ORDER.get(have, 0) >= _ACCESS_ORDER[min_level]
+
+
+def readable_root_ids(db: Session, user: User) -> Optional[Tuple[int, ...]]:
+    """Raízes em que o usuário tem qualquer nível de acesso, ordenadas.
+    None = superuser (todas as raízes, sem filtro)."""
+    if user.is_superuser == 1:
+        return None
+    return tuple(sorted(root_access_levels(db, user)))
+
+
+def get_readable_root_ids(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+) -> Optional[Tuple[int, ...]]:
+    return readable_root_ids(db, current_user)
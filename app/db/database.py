@@ -3,22 +3,88 @@
 app/db/database.py
 - Engine + Session dependency
 - init_db (ORM + FTS5: docs + map)
+- SQLite: pragmas aplicados em cada conexão (SQLITE_*). Em WAL, leitores não
+  esperam o escritor: a busca continua respondendo durante scan/indexação.
+- Duas engines: `engine` (escrita, get_db) e `read_engine` (somente leitura,
+  query_only, pool próprio de DB_READ_POOL_SIZE conexões, get_read_db).
+- serialized_writer(): scan/indexação gravam um por vez neste processo, em vez
+  de disputar o lock do SQLite até estourar o busy_timeout.
+- create_sqlite_engine(): mesmos pragmas para outros arquivos (shards do índice),
+  com bancos anexados em cada conexão.
 """
 
 from __future__ import annotations
 
-from sqlalchemy import create_engine
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
 
 from app.core.config import settings
 
+IS_SQLITE = settings.DATABASE_URL.startswith("sqlite")
+
 # SQLite needs check_same_thread=False for FastAPI (multi-thread)
 connect_args = {}
-if settings.DATABASE_URL.startswith("sqlite"):
+if IS_SQLITE:
     connect_args = {"check_same_thread": False}
 
+
+def _sqlite_pragmas(read_only: bool) -> list:
+    pragmas = [
+        f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}",
+        f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA cache_size={-int(settings.SQLITE_CACHE_SIZE_MB) * 1024}",  # negativo = KiB
+        f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE_MB) * 1024 * 1024}",
+        f"PRAGMA temp_store={settings.SQLITE_TEMP_STORE}",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=1")
+    else:
+        # journal_mode fica gravado no arquivo; só o escritor precisa pedir
+        pragmas.insert(0, f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+    return pragmas
+
+
+def _install_pragmas(target, read_only: bool, attach: Optional[Dict[str, str]] = None) -> None:
+    pragmas = _sqlite_pragmas(read_only)
+
+    @event.listens_for(target, "connect")
+    def _on_connect(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        try:
+            for pragma in pragmas:
+                cur.execute(pragma)
+            for alias, path in (attach or {}).items():
+                cur.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+        finally:
+            cur.close()
+
+
 engine = create_engine(settings.DATABASE_URL, connect_args=connect_args, future=True)
+if IS_SQLITE:
+    _install_pragmas(engine, read_only=False)
+    read_engine = create_engine(
+        settings.DATABASE_URL, connect_args=connect_args, future=True,
+        pool_size=settings.DB_READ_POOL_SIZE, max_overflow=settings.DB_READ_POOL_SIZE,
+    )
+    _install_pragmas(read_engine, read_only=True)
+else:
+    read_engine = engine
+
+
+def create_sqlite_engine(path: str, read_only: bool, attach: Optional[Dict[str, str]] = None, **kwargs):
+    """Engine de outro arquivo SQLite com os pragmas SQLITE_*; `attach`
+    ({alias: arquivo}) é anexado em cada conexão nova."""
+    eng = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, future=True, **kwargs)
+    _install_pragmas(eng, read_only=read_only, attach=attach)
+    return eng
+
+
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+ReadSessionLocal = sessionmaker(bind=read_engine, autoflush=False, autocommit=False, future=True)
 Base = declarative_base()
 
 def get_db() -> Session:
@@ -27,3 +93,26 @@ def get_db() -> Session:
         yield db
     finally:
         db.close()
+
+def get_read_db() -> Session:
+    """Sessão somente leitura para endpoints de consulta (busca, arquivos, download)."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+_writer_lock = threading.Lock()
+
+@contextmanager
+def serialized_writer(poll: Optional[Callable[[], None]] = None, interval: float = 1.0) -> Iterator[None]:
+    """Um scan/indexação por vez. Enquanto espera, chama `poll` a cada `interval`
+    segundos (pode levantar exceção para desistir, ex.: job cancelado)."""
+    while not _writer_lock.acquire(timeout=interval):
+        if poll is not None:
+            poll()
+    try:
+        yield
+    finally:
+        _writer_lock.release()
@@ -3,31 +3,53 @@
 app/db/init_db.py
 - Cria tabelas ORM
 - Garante FTS5 (docs) e tabela map (compatível com seu projeto atual)
+- Índice trigram (files_trgm) de nome/caminho, sincronizado com files por triggers
+- Vocabulário do FTS5 (docs_vocab) e termos para autocompletar (suggest_terms)
+- Layout do índice (INDEX_SHARDS): ao mudar, reconstrói o índice de conteúdo
+- Triggers que alimentam a fila de indexação (index_queue) a partir de files
+- Dedup por conteúdo passou a exigir o mesmo nome: docs antigos compartilhados
+  entre nomes diferentes voltam à fila (uma vez)
 - Seed do usuário admin (env)
+- Vários workers (uvicorn --workers N) iniciam juntos: um inicializa por vez
+  (trava init_db em job_locks), os outros encontram tudo pronto.
 """
 
+import logging
+
 from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.schema import CreateTable
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
 from app.core.security import hash_password
 from app.db.database import engine, Base, SessionLocal
-from app.models.models import User
+from app.models.models import JobLock, User
+from app.services.index_store import DOCS_DDL
+
+log = logging.getLogger(__name__)
 
 def init_db() -> None:
+    from app.services.work_locks import work_locks
+
+    # IF NOT EXISTS é atômico no SQLite; create_all (consulta e depois cria) não é
+    with engine.begin() as conn:
+        conn.execute(CreateTable(JobLock.__table__, if_not_exists=True))
+    with work_locks.hold(["init_db"]):
+        _init_db()
+
+def _init_db() -> None:
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    # create_all não cria índices novos em tabelas que já existem
+    for table in Base.metadata.sorted_tables:
+        for idx in table.indexes:
+            idx.create(bind=engine, checkfirst=True)
 
     # FTS5 + map (mantém o que já existia)
     with engine.connect() as conn:
         conn.execute(text("PRAGMA foreign_keys=ON;"))
-        conn.execute(text("""
-            CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5(
-                content,
-                filename,
-                ext,
-                tokenize='unicode61'
-            );
-        """))
+        conn.execute(text(DOCS_DDL[0]))
         conn.execute(text("""
             CREATE TABLE IF NOT EXISTS map (
                 file_id INTEGER UNIQUE,
@@ -36,10 +58,142 @@ def init_db() -> None:
                 FOREIGN KEY(file_id) REFERENCES files(id) ON DELETE CASCADE
             );
         """))
+        # um docs pode ser compartilhado por vários arquivos (dedup por conteúdo)
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_map_doc_rowid ON map(doc_rowid);"))
         conn.commit()
 
+    _ensure_files_trigram()
+    _ensure_suggest_terms()
+    _ensure_index_layout()
+    _ensure_index_queue_triggers()
+    _ensure_dedup_by_name()
     _seed_admin()
 
+# conteúdo externo: o índice guarda só os trigramas; name/path são lidos de files
+_TRIGRAM_DDL = (
+    """
+    CREATE VIRTUAL TABLE files_trgm USING fts5(
+        name, path, content='files', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS files_trgm_ai AFTER INSERT ON files BEGIN
+        INSERT INTO files_trgm(rowid, name, path) VALUES (new.id, new.name, new.path);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS files_trgm_ad AFTER DELETE ON files BEGIN
+        INSERT INTO files_trgm(files_trgm, rowid, name, path) VALUES ('delete', old.id, old.name, old.path);
+    END
+    """,
+    # o upsert do scan regrava name mesmo sem mudança: só reindexa se mudou de fato
+    """
+    CREATE TRIGGER IF NOT EXISTS files_trgm_au AFTER UPDATE OF name, path ON files
+    WHEN old.name IS NOT new.name OR old.path IS NOT new.path BEGIN
+        INSERT INTO files_trgm(files_trgm, rowid, name, path) VALUES ('delete', old.id, old.name, old.path);
+        INSERT INTO files_trgm(rowid, name, path) VALUES (new.id, new.name, new.path);
+    END
+    """,
+)
+
+def _ensure_files_trigram() -> None:
+    """Cria files_trgm + triggers; na primeira vez, indexa os arquivos já existentes."""
+    with engine.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='files_trgm'"
+        )).first()
+        if exists:
+            return
+        try:
+            conn.execute(text(_TRIGRAM_DDL[0]))
+        except OperationalError as e:
+            # SQLite < 3.34 não tem o tokenizer trigram: busca por nome cai no LIKE
+            log.warning("índice trigram indisponível: %s", e.orig)
+            return
+        for ddl in _TRIGRAM_DDL[1:]:
+            conn.execute(text(ddl))
+        conn.execute(text("INSERT INTO files_trgm(files_trgm) VALUES ('rebuild')"))
+
+def _ensure_index_layout() -> None:
+    """INDEX_SHARDS mudou: o índice de conteúdo do layout anterior é descartado e
+    tudo volta para a fila (a varredura roda em _ensure_index_queue_triggers)."""
+    from app.services.shards import switch_layout_if_changed
+
+    db: Session = SessionLocal()
+    try:
+        if switch_layout_if_changed(db):
+            db.execute(text("DELETE FROM app_meta WHERE key = 'index_queue_exts'"))
+            db.commit()
+    finally:
+        db.close()
+
+def _ensure_index_queue_triggers() -> None:
+    """Recria a cada início: a lista de extensões segue os extratores carregados."""
+    from app.services.extractors import SUPPORTED_EXTS
+    from app.services.index_queue import sweep_if_exts_changed, trigger_ddl
+
+    with engine.begin() as conn:
+        for ddl in trigger_ddl(SUPPORTED_EXTS):
+            conn.execute(text(ddl))
+    # banco anterior à fila ou extrator novo: enfileira o que ainda não foi indexado
+    db: Session = SessionLocal()
+    try:
+        sweep_if_exts_changed(db, SUPPORTED_EXTS)
+    finally:
+        db.close()
+
+def _ensure_dedup_by_name() -> None:
+    """Uma vez: arquivos que compartilhavam docs com outro de nome diferente voltam
+    à fila (forçados) e ganham docs com o próprio nome."""
+    from app.services.extractors import SUPPORTED_EXTS
+    from app.services.index_queue import QueueLease
+    from app.services.index_store import files_with_foreign_filename
+
+    db: Session = SessionLocal()
+    try:
+        if db.execute(text("SELECT 1 FROM app_meta WHERE key = 'dedup_by_name'")).first():
+            return
+        file_ids = files_with_foreign_filename(db)
+        if file_ids:
+            log.info("dedup por nome: %d arquivos voltam à fila", len(file_ids))
+            QueueLease(db, sorted(SUPPORTED_EXTS), file_ids=file_ids).sweep(force=True)
+        db.execute(text("INSERT INTO app_meta(key, value) VALUES ('dedup_by_name', 1)"))
+        db.commit()
+    finally:
+        db.close()
+
+def _add_missing_columns() -> None:
+    """create_all não altera tabelas existentes: adiciona colunas novas (anuláveis) dos modelos."""
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table.name})"))}
+            for col in table.columns:
+                if col.name not in existing and col.nullable:
+                    coltype = col.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {coltype}"))
+
+def _ensure_suggest_terms() -> None:
+    """docs_vocab (fts5vocab) + suggest_terms; na primeira vez, já preenche."""
+    with engine.begin() as conn:
+        conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS docs_vocab USING fts5vocab(docs, row)"))
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='suggest_terms'"
+        )).first()
+        if exists:
+            return
+        conn.execute(text("""
+            CREATE TABLE suggest_terms (
+                term TEXT PRIMARY KEY,
+                docs INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """))
+    db: Session = SessionLocal()
+    try:
+        from app.services.suggest import refresh_suggest_terms
+        refresh_suggest_terms(db)
+    finally:
+        db.close()
+
 def _seed_admin() -> None:
     db: Session = SessionLocal()
     try:
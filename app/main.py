@@ -11,6 +11,9 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.db.init_db import init_db
 from app.api.router import api_router
+from app.services.jobs import job_manager
+from app.services.watcher import watch_manager
+from app.services.work_locks import work_locks
 
 def create_app() -> FastAPI:
     app = FastAPI(title=settings.APP_NAME)
@@ -21,11 +24,23 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "X-Search-Truncated"],
     )
 
     @app.on_event("startup")
     def _startup():
         init_db()
+        # retoma jobs pendentes e inicia o monitor de progresso
+        job_manager.start()
+        # WATCH_ENABLED: acompanha as raízes locais (inotify/polling)
+        watch_manager.start()
+
+    @app.on_event("shutdown")
+    def _shutdown():
+        watch_manager.shutdown()
+        job_manager.shutdown()
+        # libera já as travas deste processo (senão venceriam em LOCK_TTL_SEC)
+        work_locks.release_all()
 
     @app.get("/health")
     def health():
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
 from sqlalchemy import (
-    Column, Integer, String, DateTime, BigInteger, func,
-    UniqueConstraint, ForeignKey, Index
+    Column, Integer, String, DateTime, BigInteger, Float, Text, func,
+    UniqueConstraint, ForeignKey, Index, text
 )
 from sqlalchemy.orm import relationship
 
@@ -24,6 +24,7 @@ class RootFolder(Base):
 
     files = relationship("File", back_populates="root", cascade="all, delete-orphan")
     permissions = relationship("RootFolderPermission", back_populates="root", cascade="all, delete-orphan")
+    scan_dirs = relationship("ScanDir", back_populates="root", cascade="all, delete-orphan")
 
 class File(Base):
     __tablename__ = "files"
@@ -31,6 +32,10 @@ class File(Base):
         UniqueConstraint("root_id", "path", name="uq_file_root_path"),
         Index("ix_files_root_id", "root_id"),
         Index("ix_files_name", "name"),
+        Index("ix_files_root_mtime", "root_id", "mtime"),
+        Index("ix_files_root_ext", "root_id", "ext"),  # contagem de candidatos da indexação
+        Index("ix_files_quick_hash", "quick_hash"),
+        Index("ix_files_content_hash", "content_hash"),
     )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -40,11 +45,78 @@ class File(Base):
     ext = Column(String(32), nullable=True)
     size = Column(BigInteger, nullable=True)
     mtime = Column(BigInteger, nullable=True)  # epoch seconds
+    # dedup na indexação (calculados só quando há outro arquivo do mesmo tamanho);
+    # o scan zera os dois quando size/mtime mudam
+    quick_hash = Column(String(40), nullable=True)
+    content_hash = Column(String(64), nullable=True)
     created_at = Column(DateTime, nullable=False, server_default=func.now())
     updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
 
     root = relationship("RootFolder", back_populates="files")
 
+class ScanDir(Base):
+    """Cache por diretório do último scan (poda do scan incremental)."""
+    __tablename__ = "scan_dirs"
+    __table_args__ = (
+        UniqueConstraint("root_id", "path", name="uq_scan_dir_root_path"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    root_id = Column(Integer, ForeignKey("root_folders.id", ondelete="CASCADE"), nullable=False)
+    path = Column(String(2048), nullable=False)
+    parent = Column(String(2048), nullable=True)  # NULL = a própria raiz
+    mtime_ns = Column(BigInteger, nullable=True)
+    child_count = Column(Integer, nullable=True)  # entradas na listagem (arquivos + subdiretórios)
+    files_count = Column(Integer, nullable=True)  # arquivos do próprio diretório (após filtro de ext)
+    total_size_bytes = Column(BigInteger, nullable=True)
+    ext_key = Column(String(255), nullable=True)  # filtro de extensões usado ("*" = todas)
+    scanned_at = Column(DateTime, nullable=True)
+
+    root = relationship("RootFolder", back_populates="scan_dirs")
+
+class AppMeta(Base):
+    """Chave/valor de controle interno (ex.: index_generation)."""
+    __tablename__ = "app_meta"
+
+    key = Column(String(64), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+class ExtractStatus(Base):
+    """Arquivos cuja última extração não foi completa (limite, tempo ou erro)."""
+    __tablename__ = "extract_status"
+    __table_args__ = (
+        Index("ix_extract_status_status", "status"),
+    )
+
+    file_id = Column(Integer, ForeignKey("files.id", ondelete="CASCADE"), primary_key=True)
+    # truncated | timeout | too_large | error
+    status = Column(String(16), nullable=False)
+    detail = Column(Text, nullable=True)
+    fingerprint = Column(String(64), nullable=True)  # size-mtime da tentativa
+    chars = Column(Integer, nullable=True)  # texto indexado (parcial)
+    elapsed_ms = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
+
+class IndexQueue(Base):
+    """Fila persistente de indexação (ver app/services/index_queue.py)."""
+    __tablename__ = "index_queue"
+
+    file_id = Column(Integer, ForeignKey("files.id", ondelete="CASCADE"), primary_key=True)
+    root_id = Column(Integer, nullable=False)
+    # 0 = novo, 1 = modificado, 2 = nova tentativa após erro
+    priority = Column(Integer, nullable=False, default=0)
+    mtime = Column(BigInteger, nullable=True)  # desempate: mais recentes primeiro
+    force = Column(Integer, nullable=False, default=0)  # extrai mesmo com fingerprint igual (reindex_all, retry)
+    attempts = Column(Integer, nullable=False, default=0)
+    not_before = Column(Float, nullable=False, default=0)  # epoch: espera da nova tentativa
+    lease_owner = Column(String(64), nullable=True)  # execução que reservou o arquivo
+    lease_until = Column(Float, nullable=True)  # epoch: lease vencido volta para a fila
+    last_error = Column(Text, nullable=True)
+    enqueued_at = Column(DateTime, nullable=False, server_default=func.now())
+
+# ordem de consumo da fila: prioridade, depois mais recentes
+Index("ix_index_queue_order", IndexQueue.priority, IndexQueue.mtime.desc())
+
 # ---------------- Auth ----------------
 
 class User(Base):
@@ -86,3 +158,49 @@ class RootFolderPermission(Base):
 
     root = relationship("RootFolder", back_populates="permissions")
     user = relationship("User", back_populates="permissions")
+
+# ---------------- Jobs (scan/indexação em background) ----------------
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_status", "status"),
+        Index("ix_jobs_root", "root_id"),
+        # no máximo um job ativo por trabalho: o segundo pedido se junta a ele
+        Index("ux_jobs_active_work", "work_key", unique=True,
+              sqlite_where=text("status IN ('queued', 'running')")),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(16), nullable=False)  # scan | index
+    root_id = Column(Integer, ForeignKey("root_folders.id", ondelete="SET NULL"), nullable=True)
+    params = Column(Text, nullable=True)  # JSON com os parâmetros da execução
+    work_key = Column(Text, nullable=True)  # kind + params normalizados
+
+    # queued | running | done | failed | cancelled | interrupted
+    status = Column(String(16), nullable=False, default="queued")
+    cancel_requested = Column(Integer, nullable=False, default=0)
+
+    # progresso (atualizado periodicamente enquanto roda)
+    processed = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=True)  # estimativa, usada no ETA
+    counters = Column(Text, nullable=True)  # JSON: candidates/inserted/indexed/errors...
+    result = Column(Text, nullable=True)  # JSON final
+    error = Column(Text, nullable=True)
+
+    created_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+
+class JobLock(Base):
+    """Trava entre processos (scan:<root_id>, index:<n>, watch:<root_id>), com validade
+    renovada por heartbeat enquanto o dono estiver vivo."""
+    __tablename__ = "job_locks"
+
+    key = Column(String(64), primary_key=True)
+    owner = Column(String(128), nullable=False)  # host:pid:uuid do processo
+    job_id = Column(Integer, nullable=True)
+    acquired_at = Column(Float, nullable=False)  # epoch
+    expires_at = Column(Float, nullable=False)
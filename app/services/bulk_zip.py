@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+app/services/bulk_zip.py
+- ZIP montado durante o envio (várias files de uma vez), memória constante:
+  o zipfile escreve num buffer que é esvaziado a cada ~1 MB (sem seek; cada
+  entrada leva data descriptor e o diretório central vai no fim).
+- Formatos já comprimidos (PDF, Office, imagens, vídeos, zip...) vão STORED:
+  recomprimir custa CPU e quase não reduz.
+- Seleção: lista de ids, consulta FTS (mesmos filtros da busca) ou pasta
+  (prefixo de caminho dentro de uma raiz). Resolvida antes do envio: o gerador
+  só toca o disco, não o banco.
+- Arquivo que sumiu do disco é pulado e listado em _nao_incluidos.txt no fim.
+  Erro de leitura no meio de um arquivo: o cabeçalho e parte dos dados já
+  foram enviados, então a entrada fecha com o que foi lido (o ZIP continua
+  válido) e o arquivo entra na lista como incompleto.
+- ZIP64: decidido na abertura pelo tamanho do fstat, que pode mudar durante o
+  envio. Entradas a partir de ZIP64_FROM já vão em ZIP64; as menores param em
+  MAX_PLAIN_ENTRY (cabem sem ZIP64 mesmo se o arquivo crescer).
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import time
+import zipfile
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from app.services.search import SearchFilters, match_file_ids
+
+CHUNK_SIZE = 1024 * 1024
+
+STORED_EXTS = {
+    ".zip", ".7z", ".rar", ".gz", ".tgz", ".bz2", ".xz", ".zst",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic",
+    ".mp3", ".mp4", ".m4a", ".mov", ".avi", ".mkv", ".wmv",
+    ".pdf", ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp", ".dwg",
+}
+
+SKIPPED_NAME = "_nao_incluidos.txt"
+
+ZIP64_FROM = 1 << 30
+# abaixo do limite do ZIP sem ZIP64 (4 GiB) com folga para o DEFLATE
+MAX_PLAIN_ENTRY = 3 << 30
+
+
+@dataclass
+class ZipEntry:
+    file_id: int
+    root_id: int
+    path: str
+    arcname: str
+
+
+_FILES_BY_ID = text("""
+    SELECT f.id, f.root_id, f.path, r.path AS root_path
+    FROM files f JOIN root_folders r ON r.id = f.root_id
+    WHERE f.id IN :ids
+""").bindparams(bindparam("ids", expanding=True))
+
+# faixa [prefixo, prefixo + U+10FFFF) usa o índice único (root_id, path)
+_FILES_IN_FOLDER = text("""
+    SELECT f.id, f.root_id, f.path, r.path AS root_path
+    FROM files f JOIN root_folders r ON r.id = f.root_id
+    WHERE f.root_id = :root_id AND f.path >= :lo AND f.path < :hi
+    ORDER BY f.path
+    LIMIT :n
+""")
+
+
+def _relative(path: str, root_path: str) -> str:
+    rel = path[len(root_path):] if path.startswith(root_path) else os.path.basename(path)
+    return rel.replace("\\", "/").lstrip("/")
+
+
+def _entries(rows: Sequence, base: Optional[str] = None) -> List[ZipEntry]:
+    """Nomes no ZIP relativos à raiz (ou a `base`); com mais de uma raiz, cada
+    uma vira uma pasta."""
+    multi_root = base is None and len({r.root_id for r in rows}) > 1
+    out: List[ZipEntry] = []
+    used: Dict[str, int] = {}
+    for r in rows:
+        arc = _relative(r.path, base if base is not None else r.root_path)
+        if multi_root:
+            top = os.path.basename(r.root_path.replace("\\", "/").rstrip("/")) or f"raiz{r.root_id}"
+            arc = f"{top}/{arc}"
+        n = used.get(arc.lower(), 0)
+        used[arc.lower()] = n + 1
+        if n:
+            stem, ext = os.path.splitext(arc)
+            arc = f"{stem} ({n + 1}){ext}"
+        out.append(ZipEntry(file_id=r.id, root_id=r.root_id, path=r.path, arcname=arc))
+    return out
+
+
+def entries_by_ids(db: Session, file_ids: Iterable[int]) -> List[ZipEntry]:
+    ids = list(dict.fromkeys(file_ids))
+    rows = db.execute(_FILES_BY_ID, {"ids": ids}).fetchall() if ids else []
+    order = {fid: i for i, fid in enumerate(ids)}
+    rows.sort(key=lambda r: order[r.id])
+    return _entries(rows)
+
+
+def entries_by_query(db: Session, q: str, filters: SearchFilters, limit: int) -> List[ZipEntry]:
+    return entries_by_ids(db, match_file_ids(db, q, filters, limit))
+
+
+def entries_by_folder(db: Session, root_id: int, folder: str, limit: int) -> List[ZipEntry]:
+    # separador no fim: "proj1" não pega "proj10"
+    sep = "\\" if "\\" in folder else "/"
+    base = folder.rstrip("\\/")
+    prefix = base + sep
+    rows = db.execute(_FILES_IN_FOLDER, {
+        "root_id": root_id, "lo": prefix, "hi": prefix + "\U0010ffff", "n": limit,
+    }).fetchall()
+    # nomes relativos à pasta pedida, não à raiz
+    return _entries(rows, base=base)
+
+
+class _Sink(io.RawIOBase):
+    """Destino sem seek para o zipfile; o gerador drena o que acumulou."""
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._buf += b
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def pending(self) -> int:
+        return len(self._buf)
+
+    def drain(self) -> bytes:
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+
+def _zip_info(arcname: str, st: os.stat_result) -> zipfile.ZipInfo:
+    # ZIP não representa datas antes de 1980
+    date_time = time.localtime(max(st.st_mtime, 315532800))[:6]
+    info = zipfile.ZipInfo(arcname, date_time=date_time)
+    ext = os.path.splitext(arcname)[1].lower()
+    info.compress_type = zipfile.ZIP_STORED if ext in STORED_EXTS else zipfile.ZIP_DEFLATED
+    return info
+
+
+def iter_zip(entries: Sequence[ZipEntry]) -> Iterator[bytes]:
+    sink = _Sink()
+    skipped: List[str] = []
+    with zipfile.ZipFile(sink, mode="w", allowZip64=True) as zf:
+        for e in entries:
+            try:
+                fh = open(e.path, "rb")
+                st = os.fstat(fh.fileno())
+            except OSError as ex:
+                skipped.append(f"{e.path}\t{ex.strerror or ex}")
+                continue
+            zip64 = st.st_size >= ZIP64_FROM
+            room = None if zip64 else MAX_PLAIN_ENTRY
+            with fh, zf.open(_zip_info(e.arcname, st), mode="w", force_zip64=zip64) as out:
+                try:
+                    for block in iter(lambda: fh.read(CHUNK_SIZE), b""):
+                        if room is not None:
+                            if len(block) > room:
+                                out.write(block[:room])
+                                skipped.append(f"{e.path}\tincompleto: cresceu durante o envio")
+                                break
+                            room -= len(block)
+                        out.write(block)
+                        if sink.pending() >= CHUNK_SIZE:
+                            yield sink.drain()
+                except OSError as ex:
+                    skipped.append(f"{e.path}\tincompleto: {ex.strerror or ex}")
+            if sink.pending():
+                yield sink.drain()
+        if skipped:
+            zf.writestr(SKIPPED_NAME, "\r\n".join(skipped) + "\r\n")
+    yield sink.drain()
@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+"""
+app/services/extractors.py
+- Extração de texto por tipo de arquivo: registro extensão -> extrator.
+- Embutidos: PDF, DOCX, PPTX, XLSX, TXT, CSV, ODT/ODS/ODP, RTF, HTML, EML.
+- As bibliotecas de parsing (PyPDF2, python-docx, python-pptx, openpyxl) só são
+  importadas no primeiro uso: a API, que importa este módulo via routers/jobs,
+  não paga esse custo de inicialização nem de memória.
+- Formatos novos: @register_extractor(".ext") num módulo próprio, listado em
+  INDEX_EXTRACTOR_PLUGINS (carregado também nos processos de extração).
+- Funções de nível de módulo: podem rodar em threads ou processos.
+- Cada extrator é um gerador de trechos; extract_file consome com limites
+  (tamanho do arquivo, caracteres, páginas) e nunca guarda mais que
+  max_chars de texto. Quem estoura um limite volta com status
+  truncated/too_large em vez de estourar memória.
+- Tempo: extract_file só confere o prazo entre trechos (devolve o texto
+  parcial com status timeout). Um parser travado dentro de uma chamada não é
+  interrompido aqui: o prazo duro é do pipeline do indexer, que mata o
+  processo de extração.
+"""
+
+import csv
+import importlib
+import os
+import re
+import time
+import zipfile
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from typing import Callable, Dict, Optional, Set, Tuple
+from xml.etree import ElementTree
+
+from app.core.config import settings
+
+# ext -> (gerador(path, limits), separador entre trechos)
+EXTRACTORS: Dict[str, Tuple[Callable, str]] = {}
+SUPPORTED_EXTS: Set[str] = set()
+
+# incrementar quando a saída de algum extrator mudar (invalida o cache de texto)
+EXTRACTOR_VERSION = 1
+
+# --------- limites por arquivo ---------
+@dataclass
+class ExtractLimits:
+    max_file_bytes: int = 200 * 1024 * 1024  # acima disso nem abre (indexa só o nome)
+    max_chars: int = 2_000_000  # texto guardado por arquivo
+    max_pages: int = 2000  # páginas de PDF / slides de PPTX
+    max_cells: int = 10000  # células de XLSX
+    max_rows: int = 100000  # linhas de CSV
+    max_message_bytes: int = 32 * 1024 * 1024  # EML entregue ao parser de e-mail
+    # prazo por arquivo: aqui, só entre trechos; o pipeline do indexer mata o
+    # processo que passar de timeout_sec + folga
+    timeout_sec: float = 60.0
+
+
+@dataclass
+class ExtractResult:
+    content: Optional[str]  # None = falha (nada indexado)
+    status: str = "ok"  # ok | truncated | timeout | too_large | error
+    detail: Optional[str] = None
+    elapsed_ms: int = 0
+
+
+# o gerador avisa que parou por limite próprio (páginas, células, linhas)
+TRUNCATED = object()
+READ_BLOCK_CHARS = 256 * 1024
+
+
+def register_extractor(*exts: str, sep: str = "\n"):
+    """Decorador: registra um gerador de trechos de texto para as extensões dadas."""
+    def deco(fn):
+        for ext in exts:
+            ext = ext.lower()
+            EXTRACTORS[ext] = (fn, sep)
+            SUPPORTED_EXTS.add(ext)
+        return fn
+    return deco
+
+
+# --------- extratores (geradores de trechos de texto) ---------
+@register_extractor(".txt", sep="")
+def iter_txt(path, limits):
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for block in iter(lambda: f.read(READ_BLOCK_CHARS), ""):
+            yield block
+
+@register_extractor(".pdf")
+def iter_pdf(path, limits):
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    for i, page in enumerate(reader.pages):
+        if i >= limits.max_pages:
+            yield TRUNCATED
+            return
+        yield page.extract_text() or ""
+
+@register_extractor(".docx")
+def iter_docx(path, limits):
+    from docx import Document
+
+    doc = Document(path)
+    for p in doc.paragraphs:
+        yield p.text
+
+@register_extractor(".pptx")
+def iter_pptx(path, limits):
+    from pptx import Presentation
+
+    prs = Presentation(path)
+    for i, slide in enumerate(prs.slides):
+        if i >= limits.max_pages:
+            yield TRUNCATED
+            return
+        for shape in slide.shapes:
+            if hasattr(shape, "text"):
+                yield shape.text
+
+@register_extractor(".xlsx")
+def iter_xlsx(path, limits):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        total = 0
+        for ws in wb.worksheets:
+            for row in ws.iter_rows(values_only=True):
+                if total > limits.max_cells:
+                    yield TRUNCATED
+                    return
+                for cell in row:
+                    if cell is not None:
+                        yield str(cell)
+                        total += 1
+    finally:
+        wb.close()
+
+@register_extractor(".csv")
+def iter_csv(path, limits):
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        reader = csv.reader(f)
+        for i, row in enumerate(reader):
+            if i > limits.max_rows:
+                yield TRUNCATED
+                return
+            yield " ".join([str(x) for x in row if x is not None])
+
+# OpenDocument: texto de parágrafos/títulos do content.xml, lido em streaming
+_ODF_TEXT = "{urn:oasis:names:tc:opendocument:xmlns:text:1.0}"
+_ODF_BLOCKS = {_ODF_TEXT + "p", _ODF_TEXT + "h"}
+
+@register_extractor(".odt", ".ods", ".odp")
+def iter_odf(path, limits):
+    with zipfile.ZipFile(path) as zf, zf.open("content.xml") as f:
+        depth = 0
+        for event, elem in ElementTree.iterparse(f, events=("start", "end")):
+            if elem.tag not in _ODF_BLOCKS:
+                continue
+            if event == "start":
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 0:
+                # só o bloco mais externo (parágrafos aninhados em frames/notas vêm junto)
+                yield "".join(elem.itertext())
+                elem.clear()
+
+
+# RTF: remove grupos de controle e decodifica \'hh e \uN (sem dependências)
+_RTF_TOKEN = re.compile(
+    r"\\([a-z]{1,32})(-?\d{1,10})?[ ]?|\\'([0-9a-fA-F]{2})|\\([^a-zA-Z])|([{}])|[\r\n]+|([^\\{}\r\n]+)"
+)
+_RTF_SKIP_DESTS = {
+    "fonttbl", "colortbl", "stylesheet", "info", "pict", "object", "header", "footer",
+    "headerl", "headerr", "footerl", "footerr", "listtable", "listoverridetable",
+    "rsidtbl", "generator", "themedata", "colorschememapping", "datastore", "latentstyles",
+    "xmlnstbl", "fldinst", "filetbl", "revtbl",
+}
+# maior palavra de controle: "\" + 32 letras + "-" + 10 dígitos + espaço
+_RTF_CARRY_CHARS = 45
+_RTF_BREAKS = {"par": "\n", "line": "\n", "sect": "\n", "page": "\n", "row": "\n", "tab": "\t", "cell": " "}
+
+@register_extractor(".rtf", sep="")
+def iter_rtf(path, limits):
+    stack = []
+    skip = False
+    uc = 1  # caracteres de fallback após \uN
+    pending_skip = 0
+    codepage = "cp1252"
+    out = []
+    carry = ""
+    with open(path, "r", encoding="latin-1") as f:
+        while True:
+            block = f.read(READ_BLOCK_CHARS)
+            data = carry + block
+            carry = ""
+            if block:
+                # token de controle pode estar cortado no fim do bloco: se o último
+                # "\" abre um token (não faz par "\\" com o anterior) e está perto
+                # do fim, ele e o que segue vão para o próximo bloco
+                cut = data.rfind("\\", max(0, len(data) - _RTF_CARRY_CHARS))
+                start = cut
+                while start > 0 and data[start - 1] == "\\":
+                    start -= 1
+                if cut >= 0 and (cut - start) % 2 == 0:
+                    data, carry = data[:cut], data[cut:]
+            elif not data:
+                break
+            for m in _RTF_TOKEN.finditer(data):
+                word, arg, hexcode, symbol, brace, text = m.groups()
+                if brace == "{":
+                    stack.append((skip, uc))
+                    continue
+                if brace == "}":
+                    if stack:
+                        skip, uc = stack.pop()
+                    continue
+                if symbol == "*":
+                    skip = True
+                    continue
+                if skip:
+                    continue
+                if word:
+                    if word in _RTF_SKIP_DESTS:
+                        skip = True
+                    elif word == "ansicpg" and arg:
+                        codepage = f"cp{arg}"
+                    elif word == "uc" and arg:
+                        uc = int(arg)
+                    elif word == "u" and arg:
+                        out.append(chr(int(arg) % 0x10000))
+                        pending_skip = uc
+                    elif word in _RTF_BREAKS:
+                        out.append(_RTF_BREAKS[word])
+                        if word == "par" and len(out) > 256:
+                            yield "".join(out)
+                            out = []
+                    continue
+                if pending_skip:
+                    # descarta o caractere de fallback do \uN
+                    if hexcode or (text and len(text) <= pending_skip):
+                        pending_skip -= 1 if hexcode else len(text)
+                        continue
+                    if text:
+                        text = text[pending_skip:]
+                        pending_skip = 0
+                if hexcode:
+                    try:
+                        out.append(bytes([int(hexcode, 16)]).decode(codepage))
+                    except (LookupError, UnicodeDecodeError):
+                        out.append(bytes([int(hexcode, 16)]).decode("cp1252", errors="ignore"))
+                elif symbol:
+                    out.append({"~": " ", "_": "-"}.get(symbol, symbol if symbol in "\\{}" else ""))
+                elif text:
+                    out.append(text)
+            if out:
+                yield "".join(out)
+                out = []
+            if not block:
+                break
+
+
+# HTML: só o texto visível (sem script/style), alimentado em blocos
+class _HTMLText(HTMLParser):
+    _SKIP = {"script", "style", "noscript", "template"}
+    _BLOCK = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "title", "td", "th"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP:
+            self._skip_depth += 1
+        elif tag in self._BLOCK:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+    def take(self):
+        text, self.parts = "".join(self.parts), []
+        return text
+
+
+def html_to_text(html):
+    p = _HTMLText()
+    p.feed(html)
+    p.close()
+    return p.take()
+
+@register_extractor(".html", ".htm", sep="")
+def iter_html(path, limits):
+    p = _HTMLText()
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for block in iter(lambda: f.read(READ_BLOCK_CHARS), ""):
+            p.feed(block)
+            yield p.take()
+    p.close()
+    yield p.take()
+
+
+# EML: cabeçalhos principais + corpo texto (ou HTML convertido) + nomes de anexos
+@register_extractor(".eml")
+def iter_eml(path, limits):
+    from email import policy
+    from email.feedparser import BytesFeedParser
+
+    # o parser guarda a mensagem inteira (anexos inclusos) em memória: só recebe
+    # até max_message_bytes; o resto da mensagem fica de fora (status truncated)
+    parser = BytesFeedParser(policy=policy.default)
+    fed = 0
+    cut = False
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_BLOCK_CHARS), b""):
+            room = limits.max_message_bytes - fed
+            if len(block) > room:
+                parser.feed(block[:room])
+                cut = True
+                break
+            parser.feed(block)
+            fed += len(block)
+    msg = parser.close()
+    for header in ("subject", "from", "to", "cc", "date"):
+        if msg[header]:
+            yield f"{header.capitalize()}: {msg[header]}"
+    for part in msg.walk():
+        if part.is_multipart():
+            continue
+        filename = part.get_filename()
+        if filename:
+            yield filename
+            continue
+        ctype = part.get_content_type()
+        if ctype not in ("text/plain", "text/html"):
+            continue
+        try:
+            body = part.get_content()
+        except (LookupError, UnicodeDecodeError):
+            body = part.get_payload(decode=True).decode("utf-8", errors="ignore")
+        yield html_to_text(body) if ctype == "text/html" else body
+    if cut:
+        yield TRUNCATED
+
+
+def _load_plugins():
+    for name in (settings.INDEX_EXTRACTOR_PLUGINS or "").split(","):
+        name = name.strip()
+        if name:
+            importlib.import_module(name)
+
+
+def _collect(pieces, sep, limits, deadline):
+    """Consome o gerador até acabar ou estourar max_chars / prazo; memória <= max_chars."""
+    parts = []
+    size = 0
+    status = "ok"
+    try:
+        for piece in pieces:
+            if piece is TRUNCATED:
+                status = "truncated"
+                break
+            room = limits.max_chars - size
+            if len(piece) > room:
+                parts.append(piece[:room])
+                status = "truncated"
+                break
+            parts.append(piece)
+            size += len(piece) + len(sep)
+            if time.monotonic() > deadline:
+                status = "timeout"
+                break
+    finally:
+        pieces.close()
+    return sep.join(parts), status
+
+
+def extract_file(path, ext, limits=None):
+    limits = limits or ExtractLimits()
+    t0 = time.monotonic()
+    entry = EXTRACTORS.get((ext or "").lower())
+    if entry is None:
+        return ExtractResult(content="")
+    gen, sep = entry
+    try:
+        size = os.path.getsize(path)
+        if size > limits.max_file_bytes:
+            return ExtractResult(content="", status="too_large", detail=f"{size} bytes")
+        content, status = _collect(gen(path, limits), sep, limits, t0 + limits.timeout_sec)
+        detail = None
+    except Exception as e:
+        # arquivo malformado: indexa só o nome (como antes), mas registra o motivo
+        content, status, detail = "", "error", f"{type(e).__name__}: {e}"[:500]
+    return ExtractResult(content=content, status=status, detail=detail,
+                         elapsed_ms=int((time.monotonic() - t0) * 1000))
+
+def extract_text(path, ext):
+    return extract_file(path, ext).content
+
+def extract_many(items, limits=None):
+    """Extrai um grupo de (path, ext) — unidade de trabalho enviada aos processos."""
+    out = []
+    for path, ext in items:
+        try:
+            out.append(extract_file(path, ext, limits))
+        except Exception as e:
+            out.append(ExtractResult(content=None, status="error", detail=str(e)[:500]))
+    return out
+
+
+_load_plugins()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+app/services/filename_index.py
+- Busca por trecho de nome/caminho usando files_trgm (FTS5, tokenizer trigram).
+- files_trgm é de conteúdo externo (rowid = files.id) e os triggers criados em
+  init_db o mantêm em dia a cada insert/update/delete do scan.
+- Trechos com menos de 3 caracteres não formam trigrama: caem numa varredura
+  de files (LIKE), como antes.
+- Também fornece a expressão de boost por código de projeto da busca.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+TRIGRAM_MIN = 3
+FIELDS = ("name", "path")
+MODES = ("substring", "prefix")
+
+_enabled: Optional[bool] = None
+
+
+def trigram_enabled(db: Session) -> bool:
+    """files_trgm existe? (SQLite sem tokenizer trigram não cria a tabela)"""
+    global _enabled
+    if _enabled is None:
+        _enabled = db.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='files_trgm'"
+        )).first() is not None
+    return _enabled
+
+
+def fts_match(field: str, fragment: str) -> str:
+    """Expressão MATCH para o trecho literal numa coluna (aspas escapadas)."""
+    return f'{field} : "{fragment.replace(chr(34), chr(34) * 2)}"'
+
+
+def like_pattern(fragment: str, prefix: bool = False) -> str:
+    escaped = fragment.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{escaped}%" if prefix else f"%{escaped}%"
+
+
+def project_boost_sql(db: Session, project: Optional[str]) -> Tuple[str, Dict[str, Any]]:
+    """Boost de 10.0 para arquivos com o código do projeto no nome.
+
+    Com trigram, o conjunto de ids é resolvido uma vez pelo índice (subconsulta
+    não correlacionada) em vez de um LIKE por linha encontrada.
+    """
+    if not project:
+        return "0.0", {}
+    if trigram_enabled(db) and len(project) >= TRIGRAM_MIN:
+        sql = ("(CASE WHEN f.id IN (SELECT rowid FROM files_trgm WHERE files_trgm MATCH :project_match)"
+               " THEN 10.0 ELSE 0.0 END)")
+        return sql, {"project_match": fts_match("name", project)}
+    sql = "(CASE WHEN f.name LIKE :project_like ESCAPE '\\' THEN 10.0 ELSE 0.0 END)"
+    return sql, {"project_like": like_pattern(project)}
+
+
+_FIND_TRGM = """
+    SELECT f.id, f.root_id, f.path, f.name, f.ext, f.size, f.mtime
+    FROM files_trgm
+    JOIN files f ON f.id = files_trgm.rowid
+    WHERE files_trgm MATCH :match
+    {where}
+    ORDER BY files_trgm.rowid DESC
+    LIMIT :n
+"""
+_FIND_SCAN = """
+    SELECT f.id, f.root_id, f.path, f.name, f.ext, f.size, f.mtime
+    FROM files f
+    WHERE {col} LIKE :pattern ESCAPE '\\'
+    {where}
+    ORDER BY f.id DESC
+    LIMIT :n
+"""
+
+
+def find_files(
+    db: Session,
+    fragment: str,
+    field: str = "name",
+    mode: str = "substring",
+    root_ids: Optional[Sequence[int]] = None,
+    limit: int = 50,
+) -> List[Any]:
+    """Arquivos cujo nome (ou caminho) contém / começa com o trecho, sem
+    diferenciar maiúsculas. Mais novos no índice primeiro. root_ids=None: todas
+    as raízes."""
+    fragment = fragment.strip()
+    if field not in FIELDS:
+        raise ValueError(f"Campo inválido: {field}")
+    if mode not in MODES:
+        raise ValueError(f"Modo inválido: {mode}")
+    if not fragment or (root_ids is not None and not root_ids):
+        return []
+
+    col = f"f.{field}"
+    where: List[str] = []
+    params: Dict[str, Any] = {"n": limit}
+    if root_ids is not None:
+        where.append("AND f.root_id IN :root_ids")
+        params["root_ids"] = list(root_ids)
+
+    if trigram_enabled(db) and len(fragment) >= TRIGRAM_MIN:
+        if mode == "prefix":
+            # trigram acha o trecho em qualquer posição; o início é conferido aqui
+            where.append(f"AND {col} LIKE :pattern ESCAPE '\\'")
+            params["pattern"] = like_pattern(fragment, prefix=True)
+        params["match"] = fts_match(field, fragment)
+        sql = _FIND_TRGM.format(where="\n".join(where))
+    else:
+        params["pattern"] = like_pattern(fragment, prefix=(mode == "prefix"))
+        sql = _FIND_SCAN.format(col=col, where="\n".join(where))
+
+    stmt = text(sql)
+    if root_ids is not None:
+        stmt = stmt.bindparams(bindparam("root_ids", expanding=True))
+    return db.execute(stmt, params).fetchall()
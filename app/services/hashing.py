@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+app/services/hashing.py
+- Hash de conteúdo para deduplicação na indexação.
+- quick_hash: tamanho + início + fim do arquivo (barato, filtro prévio).
+- content_hash: SHA-256 do arquivo inteiro, lido em blocos (memória constante).
+"""
+
+import hashlib
+import os
+
+QUICK_BYTES = 64 * 1024
+READ_BLOCK = 1024 * 1024
+
+
+def quick_hash(path: str, size: int) -> str:
+    h = hashlib.sha1(str(size).encode("ascii"))
+    with open(path, "rb") as f:
+        h.update(f.read(QUICK_BYTES))
+        if size > 2 * QUICK_BYTES:
+            f.seek(-QUICK_BYTES, os.SEEK_END)
+            h.update(f.read(QUICK_BYTES))
+    return h.hexdigest()
+
+
+def content_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+app/services/index_queue.py
+- Fila persistente de indexação (index_queue), alimentada pelo scan: triggers
+  em files enfileiram arquivos novos (prioridade 0) e modificados (1: tamanho
+  ou mtime mudou). Extensões sem extrator nem entram.
+- Ordem: prioridade e, dentro dela, mtime mais recente. Extração com erro ou
+  timeout volta como nova tentativa (2), com espera INDEX_RETRY_BACKOFF_SEC * 2^n,
+  até INDEX_RETRY_MAX_ATTEMPTS tentativas.
+- Cada execução reserva lotes com lease (dono + validade). O checkpoint tira
+  da fila o que ficou pronto na mesma transação que grava docs/map: execução
+  cancelada ou derrubada recomeça do que faltou, sem reextrair nada. O lease
+  é renovado no checkpoint e a cada arquivo (renew_if_due); o de um processo
+  que morreu vence após INDEX_LEASE_SEC.
+- Varredura (sweep): enfileira o que mudou sem passar pelos triggers. Roda na
+  inicialização quando a lista de extensões muda (banco anterior à fila,
+  extrator/plugin novo); custa uma passada em files x map.
+"""
+
+from __future__ import annotations
+
+import os
+import socket
+import time
+import uuid
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+PRIORITY_NEW = 0
+PRIORITY_MODIFIED = 1
+PRIORITY_RETRY = 2
+
+# falhas que podem passar numa nova tentativa (arquivo travado, servidor lento);
+# too_large/truncated dependem só do arquivo e dos limites
+RETRY_STATUSES = ("error", "timeout")
+
+CLAIM_BATCH = 500
+
+# mesmo formato de f"{size}-{mtime}" do Python (None vira 'None')
+FP_SQL = "COALESCE(f.size, 'None') || '-' || COALESCE(f.mtime, 'None')"
+CHANGED_SQL = f"(m.file_id IS NULL OR m.fingerprint IS NOT ({FP_SQL}))"
+
+
+def trigger_ddl(exts: Iterable[str]) -> List[str]:
+    """Triggers que alimentam a fila (recriados a cada início: a lista de extensões
+    acompanha os extratores/plugins carregados)."""
+    ext_list = ", ".join("'" + e.replace("'", "''") + "'" for e in sorted(exts)) or "NULL"
+    upsert = """
+        INSERT INTO index_queue (file_id, root_id, priority, mtime, force, attempts, not_before)
+        VALUES (new.id, new.root_id, {prio}, new.mtime, 0, 0, 0)
+        ON CONFLICT(file_id) DO UPDATE SET
+            priority = MIN(priority, excluded.priority), mtime = excluded.mtime, attempts = 0,
+            not_before = 0, lease_owner = NULL, lease_until = NULL, last_error = NULL;
+    """
+    # lease zerado: a execução que estava com o arquivo não o tira da fila no checkpoint
+    return [
+        "DROP TRIGGER IF EXISTS index_queue_ai",
+        "DROP TRIGGER IF EXISTS index_queue_au",
+        "DROP TRIGGER IF EXISTS index_queue_ad",
+        f"""
+        CREATE TRIGGER index_queue_ai AFTER INSERT ON files
+        WHEN new.ext IN ({ext_list}) BEGIN {upsert.format(prio=PRIORITY_NEW)} END
+        """,
+        f"""
+        CREATE TRIGGER index_queue_au AFTER UPDATE OF size, mtime ON files
+        WHEN new.ext IN ({ext_list}) AND (old.size IS NOT new.size OR old.mtime IS NOT new.mtime)
+        BEGIN {upsert.format(prio=PRIORITY_MODIFIED)} END
+        """,
+        """
+        CREATE TRIGGER index_queue_ad AFTER DELETE ON files BEGIN
+            DELETE FROM index_queue WHERE file_id = old.id;
+        END
+        """,
+    ]
+
+
+# {scope}: f.root_id IN :scope (raízes) ou f.id IN :scope (lista de arquivos);
+# {qscope}: o mesmo pela fila. CROSS JOIN fixa a fila como laço externo: ela é
+# percorrida na ordem de ix_index_queue_order e o LIMIT para cedo.
+_SWEEP = f"""
+    INSERT INTO index_queue (file_id, root_id, priority, mtime, force, attempts, not_before)
+    SELECT f.id, f.root_id, CASE WHEN m.file_id IS NULL THEN {PRIORITY_NEW} ELSE {PRIORITY_MODIFIED} END,
+           f.mtime, 0, 0, 0
+    FROM files f
+    LEFT JOIN map m ON m.file_id = f.id
+    WHERE {{scope}} AND f.ext IN :exts AND {CHANGED_SQL}
+      AND NOT EXISTS (SELECT 1 FROM extract_status s WHERE s.file_id = f.id AND s.fingerprint = {FP_SQL})
+    ON CONFLICT(file_id) DO NOTHING
+"""
+_ENQUEUE_ALL = f"""
+    INSERT INTO index_queue (file_id, root_id, priority, mtime, force, attempts, not_before)
+    SELECT f.id, f.root_id, {PRIORITY_MODIFIED}, f.mtime, 1, 0, 0
+    FROM files f
+    WHERE {{scope}} AND f.ext IN :exts
+    ON CONFLICT(file_id) DO UPDATE SET force = 1, attempts = 0, not_before = 0
+"""
+_COUNT_FILES = "SELECT COUNT(*) FROM files f WHERE {scope} AND f.ext IN :exts"
+_READY = "q.not_before <= :now AND (q.lease_until IS NULL OR q.lease_until < :now)"
+_COUNT_READY = f"""
+    SELECT COUNT(*) FROM index_queue q CROSS JOIN files f ON f.id = q.file_id
+    WHERE {{qscope}} AND f.ext IN :exts AND {_READY}
+"""
+_CLAIM = f"""
+    UPDATE index_queue SET lease_owner = :owner, lease_until = :until
+    WHERE file_id IN (
+        SELECT q.file_id FROM index_queue q CROSS JOIN files f ON f.id = q.file_id
+        WHERE {{qscope}} AND f.ext IN :exts AND {_READY}
+        ORDER BY q.priority, q.mtime DESC, q.file_id
+        LIMIT :n
+    )
+    RETURNING file_id
+"""
+_CLAIMED = text(f"""
+    SELECT f.id, f.root_id, f.path, f.name, f.ext, f.size, f.mtime, m.doc_rowid,
+           q.force, q.attempts, {CHANGED_SQL} AS changed
+    FROM index_queue q
+    JOIN files f ON f.id = q.file_id
+    LEFT JOIN map m ON m.file_id = f.id
+    WHERE q.file_id IN :ids AND q.lease_owner = :owner
+    ORDER BY q.priority, q.mtime DESC, q.file_id
+""").bindparams(bindparam("ids", expanding=True))
+
+_DONE = text("DELETE FROM index_queue WHERE file_id = :fid AND lease_owner = :owner")
+_RETRY = text(f"""
+    UPDATE index_queue SET priority = {PRIORITY_RETRY}, force = 1, attempts = :attempts,
+        not_before = :not_before, last_error = :error, lease_owner = NULL, lease_until = NULL
+    WHERE file_id = :fid AND lease_owner = :owner
+""")
+_RENEW = text("UPDATE index_queue SET lease_until = :until WHERE file_id = :fid AND lease_owner = :owner")
+_RELEASE = text("""
+    UPDATE index_queue SET lease_owner = NULL, lease_until = NULL
+    WHERE file_id = :fid AND lease_owner = :owner
+""")
+
+_QUEUE_STATUS = text(f"""
+    SELECT
+        SUM(CASE WHEN priority = {PRIORITY_NEW} THEN 1 ELSE 0 END),
+        SUM(CASE WHEN priority = {PRIORITY_MODIFIED} THEN 1 ELSE 0 END),
+        SUM(CASE WHEN priority = {PRIORITY_RETRY} THEN 1 ELSE 0 END),
+        SUM(CASE WHEN lease_until >= :now THEN 1 ELSE 0 END),
+        SUM(CASE WHEN not_before > :now THEN 1 ELSE 0 END)
+    FROM index_queue
+    WHERE :root_id IS NULL OR root_id = :root_id
+""")
+
+_STMTS: Dict[Tuple[str, str], object] = {}
+
+
+def _stmt(sql: str, by_file: bool):
+    key = (sql, "file" if by_file else "root")
+    stmt = _STMTS.get(key)
+    if stmt is None:
+        if by_file:
+            scope, qscope = "f.id IN :scope", "q.file_id IN :scope"
+        else:
+            scope, qscope = "f.root_id IN :scope", "q.root_id IN :scope"
+        stmt = text(sql.format(scope=scope, qscope=qscope)).bindparams(
+            bindparam("scope", expanding=True), bindparam("exts", expanding=True)
+        )
+        _STMTS[key] = stmt
+    return stmt
+
+
+def retry_delay(attempts: int) -> float:
+    """Espera antes da tentativa de número `attempts + 1` (exponencial)."""
+    return settings.INDEX_RETRY_BACKOFF_SEC * (2 ** max(0, attempts - 1))
+
+
+def queue_status(db: Session, root_id: Optional[int] = None) -> Dict[str, int]:
+    row = db.execute(_QUEUE_STATUS, {"now": time.time(), "root_id": root_id}).one()
+    new, modified, retry, leased, waiting = (v or 0 for v in row)
+    return {"new": new, "modified": modified, "retry": retry, "leased": leased, "waiting": waiting}
+
+
+_GET_SWEPT = text("SELECT value FROM app_meta WHERE key = 'index_queue_exts'")
+_SET_SWEPT = text("""
+    INSERT INTO app_meta(key, value) VALUES ('index_queue_exts', :v)
+    ON CONFLICT(key) DO UPDATE SET value = excluded.value
+""")
+
+
+def sweep_if_exts_changed(db: Session, exts: Iterable[str]) -> None:
+    """Na inicialização: varre tudo se a lista de extensões dos triggers mudou."""
+    exts = sorted(exts)
+    signature = zlib.crc32(",".join(exts).encode())
+    if db.execute(_GET_SWEPT).scalar() == signature:
+        return
+    root_ids = [r for (r,) in db.execute(text("SELECT id FROM root_folders"))]
+    if root_ids:
+        QueueLease(db, exts, root_ids=root_ids).sweep()
+    db.execute(_SET_SWEPT, {"v": signature})
+    db.commit()
+
+
+class QueueLease:
+    """
+    Reserva da fila por uma execução de indexação, restrita a raízes ou a uma
+    lista de arquivos (watcher) e às extensões da execução.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        exts: Sequence[str],
+        root_ids: Optional[Sequence[int]] = None,
+        file_ids: Optional[Sequence[int]] = None,
+    ):
+        self.db = db
+        self.exts = list(exts)
+        self.by_file = file_ids is not None
+        scope = list(file_ids) if self.by_file else list(root_ids or [])
+        # lista de arquivos em blocos (limite de parâmetros do SQLite)
+        step = CLAIM_BATCH if self.by_file else max(1, len(scope))
+        self._scopes = [scope[i:i + step] for i in range(0, len(scope), step)]
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # reservados e ainda não finalizados (renovação e liberação)
+        self.outstanding: Set[int] = set()
+        self._renewed = 0.0
+
+    def _each(self, sql: str, **params) -> Iterator:
+        stmt = _stmt(sql, self.by_file)
+        for scope in self._scopes:
+            yield self.db.execute(stmt, {"scope": scope, "exts": self.exts, **params})
+
+    def sweep(self, force: bool = False) -> None:
+        """Enfileira o que mudou fora dos triggers; force=True enfileira tudo (reindex_all)."""
+        for _ in self._each(_ENQUEUE_ALL if force else _SWEEP):
+            pass
+        self.db.commit()
+
+    def count_files(self) -> int:
+        return sum(r.scalar() or 0 for r in self._each(_COUNT_FILES))
+
+    def count_ready(self) -> int:
+        return sum(r.scalar() or 0 for r in self._each(_COUNT_READY, now=time.time()))
+
+    def claimed(self, limit: Optional[int] = None) -> Iterator[Row]:
+        """Reserva lotes de CLAIM_BATCH na ordem da fila e devolve as linhas para indexar."""
+        remaining = limit
+        stmt = _stmt(_CLAIM, self.by_file)
+        for scope in self._scopes:
+            while remaining is None or remaining > 0:
+                n = CLAIM_BATCH if remaining is None else min(CLAIM_BATCH, remaining)
+                now = time.time()
+                ids = [fid for (fid,) in self.db.execute(stmt, {
+                    "scope": scope, "exts": self.exts, "now": now,
+                    "owner": self.owner, "until": now + settings.INDEX_LEASE_SEC, "n": n,
+                }).fetchall()]
+                self.db.commit()
+                if not ids:
+                    break
+                self.outstanding.update(ids)
+                self._renewed = now
+                rows = self.db.execute(_CLAIMED, {"ids": ids, "owner": self.owner}).fetchall()
+                if remaining is not None:
+                    remaining -= len(ids)
+                yield from rows
+
+    def checkpoint(self, done: Sequence[int], retries: Sequence[Tuple[int, int, str, Optional[str]]]) -> None:
+        """
+        Dentro da transação do lote (quem chama faz o commit): tira da fila o que
+        ficou pronto e reagenda as falhas. retries = (file_id, tentativas anteriores, status, detalhe).
+        """
+        now = time.time()
+        gone = [{"fid": fid, "owner": self.owner} for fid in done]
+        again = []
+        for fid, attempts, status, detail in retries:
+            attempts += 1
+            if attempts >= settings.INDEX_RETRY_MAX_ATTEMPTS:
+                # desiste: continua em extract_status; volta à fila se o arquivo mudar
+                gone.append({"fid": fid, "owner": self.owner})
+                continue
+            again.append({
+                "fid": fid, "owner": self.owner, "attempts": attempts,
+                "not_before": now + retry_delay(attempts), "error": f"{status}: {detail or ''}"[:500],
+            })
+        if gone:
+            self.db.execute(_DONE, gone)
+        if again:
+            self.db.execute(_RETRY, again)
+        self.outstanding.difference_update(fid for fid in done)
+        self.outstanding.difference_update(fid for fid, *_ in retries)
+        self._renew(now)
+
+    def renew_if_due(self) -> None:
+        """
+        Fora do checkpoint (a cada arquivo, pelo progresso da execução): um lote
+        que demora mais que INDEX_LEASE_SEC para fechar (PDFs grandes, extração
+        lenta) não deixa o lease vencer. Grava numa transação própria; quem
+        chama não pode ter escrita pendente (entre lotes não há).
+        """
+        if self._renew(time.time()):
+            self.db.commit()
+
+    def _renew(self, now: float) -> bool:
+        # no máximo a cada INDEX_LEASE_SEC / 3
+        if not self.outstanding or now - self._renewed <= settings.INDEX_LEASE_SEC / 3:
+            return False
+        until = now + settings.INDEX_LEASE_SEC
+        self.db.execute(_RENEW, [{"fid": fid, "owner": self.owner, "until": until} for fid in self.outstanding])
+        self._renewed = now
+        return True
+
+    def release(self) -> None:
+        """Devolve à fila o que foi reservado e não terminou (cancelamento, erro, limit)."""
+        if self.outstanding:
+            self.db.execute(_RELEASE, [{"fid": fid, "owner": self.owner} for fid in self.outstanding])
+            self.outstanding.clear()
+        self.db.commit()
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+app/services/index_store.py
+- Acesso às tabelas do índice full-text: docs (FTS5) e map (file_id -> docs.rowid).
+- Remoção em cascata de arquivos (files + map + docs + extract_status), usada pelo scan.
+- Um docs pode ser compartilhado por vários arquivos de mesmo conteúdo e mesmo
+  nome: só é apagado quando nenhuma linha de map aponta mais para ele.
+- Geração do índice (app_meta.index_generation): incrementada por quem altera
+  files/docs (scan, indexação, remoção de raiz); caches de busca usam o valor
+  na chave, então qualquer mudança os invalida.
+- DocStore: docs no banco principal ou, com INDEX_SHARDS, no shard da raiz do
+  arquivo (ver shards); map fica sempre no principal.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.services import shards
+
+# executemany em blocos: mantém cada transação grande mas com memória limitada
+PURGE_CHUNK = 5000
+
+DOCS_DDL = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5(
+        content,
+        filename,
+        ext,
+        tokenize='unicode61'
+    )
+    """,
+    "CREATE VIRTUAL TABLE IF NOT EXISTS docs_vocab USING fts5vocab(docs, row)",
+)
+
+_SEL_DOC_ROWIDS = text("""
+    SELECT DISTINCT f.root_id, m.doc_rowid FROM map m JOIN files f ON f.id = m.file_id
+    WHERE m.file_id IN :fids
+""").bindparams(bindparam("fids", expanding=True))
+_DEL_MAP_OF_FILE = text("DELETE FROM map WHERE file_id = :fid")
+_DEL_FILE = text("DELETE FROM files WHERE id = :fid")
+_DEL_STATUS_OF_FILE = text("DELETE FROM extract_status WHERE file_id = :fid")
+_DEL_ORPHAN_DOC = text("""
+    DELETE FROM docs WHERE rowid = :rowid
+    AND NOT EXISTS (SELECT 1 FROM map WHERE doc_rowid = :rowid)
+""")
+# num shard, o mesmo rowid pode existir em outra raiz: só conta map da raiz do shard
+_DEL_ORPHAN_SHARD_DOC = text("""
+    DELETE FROM docs WHERE rowid = :rowid
+    AND NOT EXISTS (
+        SELECT 1 FROM map JOIN files f ON f.id = map.file_id
+        WHERE map.doc_rowid = :rowid AND f.root_id = :root_id
+    )
+""")
+_INS_DOCS = text("INSERT INTO docs(content, filename, ext) VALUES (:content, :filename, :ext)")
+_SEL_DOC_FILENAME = text("SELECT filename FROM docs WHERE rowid = :rowid")
+# docs com o nome de outro arquivo (dedup anterior à regra de mesmo nome)
+_SEL_FOREIGN_FILENAME = text("""
+    SELECT m.file_id FROM map m
+    JOIN files f ON f.id = m.file_id
+    JOIN docs ON docs.rowid = m.doc_rowid
+    WHERE (:root_id IS NULL OR f.root_id = :root_id) AND docs.filename IS NOT f.name
+""")
+
+
+_GET_GENERATION = text("SELECT value FROM app_meta WHERE key = 'index_generation'")
+_BUMP_GENERATION = text("""
+    INSERT INTO app_meta(key, value) VALUES ('index_generation', 1)
+    ON CONFLICT(key) DO UPDATE SET value = value + 1
+""")
+
+
+def get_index_generation(db: Session) -> int:
+    return db.execute(_GET_GENERATION).scalar() or 0
+
+
+def bump_index_generation(db: Session) -> None:
+    """Chamar depois de gravar mudanças em files/map/docs (faz commit)."""
+    db.execute(_BUMP_GENERATION)
+    db.commit()
+
+
+def files_with_foreign_filename(db: Session) -> List[int]:
+    """Arquivos cujo docs traz o nome de outro arquivo: a busca pelo nome erra para eles."""
+    def one(conn, root_id: Optional[int]) -> List[int]:
+        return [fid for (fid,) in conn.execute(_SEL_FOREIGN_FILENAME, {"root_id": root_id})]
+
+    if not shards.enabled():
+        return one(db, None)
+    roots = [r for r in shards.all_root_ids(db) if shards.shard_exists(r)]
+    return [fid for _, fids in shards.fan_out(roots, one) for fid in fids]
+
+
+def delete_orphan_docs(db: Session, rowids: Iterable[Optional[int]]) -> None:
+    """Apaga os docs indicados que ficaram sem referência em map (chamar após atualizar map)."""
+    params = [{"rowid": r} for r in set(rowids) if r is not None]
+    if params:
+        db.execute(_DEL_ORPHAN_DOC, params)
+
+
+class DocStore:
+    """
+    Grava docs onde o layout manda. Ordem de uso por lote:
+    insert() ... before_commit(órfãos) -> db.commit() -> after_commit(órfãos).
+    Órfãos = (root_id, docs.rowid) que podem ter ficado sem map.
+    - Único: tudo na transação de `db`.
+    - Shards: docs novos são confirmados no shard antes do map que aponta para
+      eles; docs antigos só saem do shard depois que o map deixou de apontar.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.sharded = shards.enabled()
+        self._conns: Dict[int, Connection] = {}
+
+    def _shard(self, root_id: int) -> Connection:
+        conn = self._conns.get(root_id)
+        if conn is None:
+            conn = self._conns[root_id] = shards.writer(root_id)
+        return conn
+
+    def insert(self, root_id: int, content: str, filename: str, ext: str) -> int:
+        params = {"content": content, "filename": filename, "ext": ext}
+        target = self._shard(root_id) if self.sharded else self.db
+        return target.execute(_INS_DOCS, params).lastrowid
+
+    def filename(self, root_id: int, rowid: int) -> Optional[str]:
+        target = self._shard(root_id) if self.sharded else self.db
+        return target.execute(_SEL_DOC_FILENAME, {"rowid": rowid}).scalar()
+
+    def before_commit(self, orphans: Iterable[Tuple[int, Optional[int]]]) -> None:
+        if not self.sharded:
+            delete_orphan_docs(self.db, (rowid for _, rowid in orphans))
+            return
+        for conn in self._conns.values():
+            conn.commit()
+
+    def after_commit(self, orphans: Iterable[Tuple[int, Optional[int]]]) -> None:
+        if not self.sharded:
+            return
+        by_root: Dict[int, set] = {}
+        for root_id, rowid in orphans:
+            if rowid is not None:
+                by_root.setdefault(root_id, set()).add(rowid)
+        for root_id, rowids in by_root.items():
+            if not shards.shard_exists(root_id):
+                continue
+            conn = self._shard(root_id)
+            conn.execute(_DEL_ORPHAN_SHARD_DOC, [{"rowid": r, "root_id": root_id} for r in rowids])
+            conn.commit()
+
+    def close(self) -> None:
+        conns, self._conns = self._conns, {}
+        for conn in conns.values():
+            conn.rollback()
+            conn.close()
+
+
+def purge_files(db: Session, file_ids: Iterable[int]) -> int:
+    """
+    Remove arquivos e tudo que aponta para eles no índice (docs e map).
+    Não depende de PRAGMA foreign_keys: o FTS5 não tem cascata.
+    Faz commit a cada bloco. Retorna quantos arquivos foram removidos.
+    """
+    ids: List[int] = list(file_ids)
+    total = 0
+    store = DocStore(db)
+    try:
+        for i in range(0, len(ids), PURGE_CHUNK):
+            chunk = ids[i:i + PURGE_CHUNK]
+            params = [{"fid": fid} for fid in chunk]
+            orphans = [tuple(r) for r in db.execute(_SEL_DOC_ROWIDS, {"fids": chunk})]
+            db.execute(_DEL_MAP_OF_FILE, params)
+            store.before_commit(orphans)
+            db.execute(_DEL_STATUS_OF_FILE, params)
+            db.execute(_DEL_FILE, params)
+            db.commit()
+            store.after_commit(orphans)
+            total += len(params)
+    finally:
+        store.close()
+    return total
@@ -0,0 +1,739 @@
+# -*- coding: utf-8 -*-
+"""
+app/services/indexer.py
+- Indexação de conteúdo de 'files' em FTS5 (docs) com controle incremental via 'map'.
+- Usado pelo endpoint /index/run (modo síncrono) e pelos jobs em background.
+- Pipeline: a extração (CPU-bound, PyPDF2/python-docx são Python puro) roda
+  em INDEX_WORKERS processos; os resultados voltam na ordem em que ficam
+  prontos e uma única thread grava docs + map em lote. Arquivo que passa do
+  prazo (parser travado) tem o processo morto e substituído.
+- Texto já extraído antes (mesmo caminho + fingerprint) vem do cache em disco
+  (text_cache) sem passar pelo pipeline.
+- Dedup (INDEX_DEDUP): arquivos de conteúdo idêntico (SHA-256) compartilham uma
+  única linha de docs; cada um mantém sua linha em map, então a busca continua
+  devolvendo todos os caminhos.
+- Candidatos vêm da fila persistente (index_queue): novos, depois modificados,
+  depois novas tentativas; cada lote gravado tira seus arquivos da fila na
+  mesma transação (retomada exata após cancelamento ou queda).
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from multiprocessing.connection import wait as mp_wait
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.services import shards
+from app.services.extractors import SUPPORTED_EXTS, ExtractLimits, ExtractResult, extract_file, extract_many
+from app.services.hashing import content_hash, quick_hash
+from app.services.index_queue import RETRY_STATUSES, QueueLease
+from app.services.index_store import DocStore, bump_index_generation
+from app.services.suggest import refresh_suggest_terms
+from app.services.text_cache import CACHED_EXTS, TextCache, get_text_cache
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+
+# arquivos pequenos vão em grupos para o processo (amortiza o custo de IPC)
+CHUNK_MAX_FILES = 32
+CHUNK_MAX_BYTES = 1024 * 1024
+
+
+@dataclass
+class IndexStats:
+    candidates: int = 0
+    indexed: int = 0
+    skipped: int = 0
+    errors: int = 0
+    cached: int = 0  # indexados com texto vindo do cache (subconjunto de indexed)
+    deduped: int = 0  # indexados apontando para docs de conteúdo idêntico (subconjunto de indexed)
+    limited: int = 0  # parou em limite (truncated/timeout/too_large), ver extract_status
+    retried: int = 0  # erro/timeout reagendado na fila (subconjunto de indexed + errors)
+    pending: int = 0  # a processar nesta execução (já com limit aplicado)
+
+    @property
+    def processed(self) -> int:
+        return self.indexed + self.skipped + self.errors
+
+
+@dataclass
+class _Task:
+    file_id: int
+    root_id: int
+    path: str
+    name: str
+    ext: str
+    size: int
+    fingerprint: str
+    old_rowid: Optional[int]
+    attempts: int = 0  # tentativas anteriores (fila)
+    quick_hash: Optional[str] = None
+    content_hash: Optional[str] = None
+
+
+@dataclass
+class _Extracted:
+    task: _Task
+    content: Optional[str]  # None = falha na extração
+    from_cache: bool = False
+    status: str = "ok"  # ver ExtractResult
+    detail: Optional[str] = None
+    elapsed_ms: int = 0
+
+    @classmethod
+    def of(cls, task: _Task, res: ExtractResult) -> "_Extracted":
+        return cls(task=task, content=res.content, status=res.status, detail=res.detail, elapsed_ms=res.elapsed_ms)
+
+
+def limits_from_settings() -> ExtractLimits:
+    return ExtractLimits(
+        max_file_bytes=settings.INDEX_MAX_FILE_MB * 1024 * 1024,
+        max_chars=settings.INDEX_MAX_CHARS,
+        max_pages=settings.INDEX_MAX_PAGES,
+        timeout_sec=settings.INDEX_FILE_TIMEOUT_SEC,
+    )
+
+
+def resolve_workers(workers: Optional[int] = None) -> int:
+    n = settings.INDEX_WORKERS if workers is None else workers
+    if n <= 0:
+        n = os.cpu_count() or 1
+    return n
+
+
+# prazo duro = INDEX_FILE_TIMEOUT_SEC + folga: antes disso o próprio extrator
+# para entre trechos e devolve o texto parcial
+HARD_TIMEOUT_GRACE_SEC = 5.0
+
+
+def _worker_main(conn, limits: ExtractLimits) -> None:
+    """Processo de extração: recebe grupos de (path, ext) e devolve um resultado por arquivo, na ordem."""
+    while True:
+        try:
+            items = conn.recv()
+        except EOFError:
+            return
+        if items is None:
+            return
+        for item in items:
+            conn.send(extract_many([item], limits)[0])
+
+
+class _Worker:
+    """Um processo de extração com um grupo por vez; o pai sabe qual arquivo está em andamento."""
+
+    def __init__(self, ctx, limits: ExtractLimits):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child, limits), daemon=True, name="index-extract")
+        self.proc.start()
+        child.close()
+        self.tasks: List[_Task] = []  # grupo em andamento: o primeiro é o arquivo atual
+        self.started = 0.0  # quando o arquivo atual começou (relógio do pai)
+
+    def send(self, tasks: List[_Task]) -> None:
+        self.tasks = list(tasks)
+        self.started = time.monotonic()
+        self.conn.send([(t.path, t.ext) for t in tasks])
+
+    def kill(self) -> None:
+        self.proc.kill()
+        self.proc.join(timeout=5)
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.proc.join(timeout=5)
+        if self.proc.is_alive():
+            self.proc.kill()
+            self.proc.join(timeout=5)
+        self.conn.close()
+
+
+class _ExtractionPipeline:
+    """
+    Processos 'spawn' (seguro com threads no processo pai e igual no Windows),
+    cada um com um grupo de arquivos por vez; no máximo workers *
+    INDEX_QUEUE_FACTOR grupos entre fila e processos (memória limitada).
+    Prazo duro por arquivo: o pai cronometra o arquivo em andamento em cada
+    processo; passou de timeout_sec + HARD_TIMEOUT_GRACE_SEC (parser travado
+    dentro de uma chamada), o processo é morto, o arquivo fica com
+    status=timeout e o resto do grupo vai para um processo novo.
+    workers == 1 com timeout_sec <= 0 (sem prazo): extrai na própria thread.
+    """
+
+    def __init__(self, workers: int, limits: ExtractLimits):
+        self.workers = workers
+        self.limits = limits
+        self.window = max(1, workers * settings.INDEX_QUEUE_FACTOR)
+        self.local = workers <= 1 and limits.timeout_sec <= 0
+        self.hard_timeout = limits.timeout_sec + HARD_TIMEOUT_GRACE_SEC if limits.timeout_sec > 0 else None
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs: List[_Worker] = []
+        self._queue: Deque[List[_Task]] = deque()
+        self._chunk: List[_Task] = []
+        self._chunk_bytes = 0
+
+    def __enter__(self) -> "_ExtractionPipeline":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for w in self._procs:
+            if w.tasks:
+                # interrompido no meio de um grupo: não espera o arquivo acabar
+                w.kill()
+            else:
+                w.stop()
+        self._procs = []
+        self._queue.clear()
+
+    def submit(self, task: _Task) -> Iterator[_Extracted]:
+        """Enfileira a tarefa; devolve o que já terminou (bloqueia só com a janela cheia)."""
+        if self.local:
+            yield _run_local(task, self.limits)
+            return
+        self._chunk.append(task)
+        self._chunk_bytes += task.size or 0
+        if len(self._chunk) >= CHUNK_MAX_FILES or self._chunk_bytes >= CHUNK_MAX_BYTES:
+            self._send_chunk()
+        yield from self._collect(block=self._backlog() >= self.window)
+
+    def drain(self) -> Iterator[_Extracted]:
+        self._send_chunk()
+        while self._backlog():
+            yield from self._collect(block=True)
+
+    def _busy(self) -> List[_Worker]:
+        return [w for w in self._procs if w.tasks]
+
+    def _backlog(self) -> int:
+        return len(self._queue) + len(self._busy())
+
+    def _send_chunk(self) -> None:
+        if not self._chunk:
+            return
+        self._queue.append(self._chunk)
+        self._chunk, self._chunk_bytes = [], 0
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._queue:
+            idle = next((w for w in self._procs if not w.tasks), None)
+            if idle is None:
+                if len(self._procs) >= self.workers:
+                    return
+                idle = _Worker(self._ctx, self.limits)
+                self._procs.append(idle)
+            idle.send(self._queue.popleft())
+
+    def _retire(self, w: _Worker, res: ExtractResult) -> _Extracted:
+        """Processo morto (travou ou caiu): o arquivo atual fica com `res`, o resto do grupo volta à fila."""
+        task, rest = w.tasks[0], w.tasks[1:]
+        w.tasks = []
+        w.kill()
+        self._procs.remove(w)
+        if rest:
+            self._queue.appendleft(rest)
+        return _Extracted.of(task, res)
+
+    def _collect(self, block: bool) -> Iterator[_Extracted]:
+        while True:
+            busy = self._busy()
+            if not busy:
+                return
+            timeout = 0.0
+            if block:
+                timeout = None
+                if self.hard_timeout is not None:
+                    now = time.monotonic()
+                    timeout = max(0.0, min(w.started + self.hard_timeout - now for w in busy))
+            ready = mp_wait([w.conn for w in busy], timeout=timeout)
+            out: List[_Extracted] = []
+            for w in busy:
+                if w.conn not in ready:
+                    continue
+                try:
+                    res = w.conn.recv()
+                except (EOFError, OSError) as e:
+                    out.append(self._retire(w, ExtractResult(
+                        content=None, status="error", detail=f"processo de extração encerrado: {e!r}"[:500])))
+                    continue
+                out.append(_Extracted.of(w.tasks.pop(0), res))
+                w.started = time.monotonic()
+            if self.hard_timeout is not None:
+                now = time.monotonic()
+                for w in self._busy():
+                    if now - w.started > self.hard_timeout:
+                        log.warning("extração passou de %.0fs, processo encerrado: %s", self.hard_timeout, w.tasks[0].path)
+                        out.append(self._retire(w, ExtractResult(
+                            content="", status="timeout",
+                            detail=f"sem resposta em {self.hard_timeout:.0f}s (processo encerrado)",
+                            elapsed_ms=int((now - w.started) * 1000))))
+            self._dispatch()
+            yield from out
+            if out or not block:
+                return
+
+
+def _run_local(task: _Task, limits: ExtractLimits) -> _Extracted:
+    try:
+        return _Extracted.of(task, extract_file(task.path, task.ext, limits))
+    except Exception as e:
+        return _Extracted(task=task, content=None, status="error", detail=str(e)[:500])
+
+
+_UPSERT_MAP = text("""
+    INSERT INTO map(file_id, doc_rowid, fingerprint) VALUES (:fid, :rowid, :fp)
+    ON CONFLICT(file_id) DO UPDATE SET doc_rowid = excluded.doc_rowid, fingerprint = excluded.fingerprint
+""")
+_SET_HASHES = text("UPDATE files SET quick_hash = :qh, content_hash = :ch WHERE id = :fid")
+_UPSERT_STATUS = text("""
+    INSERT INTO extract_status(file_id, status, detail, fingerprint, chars, elapsed_ms, updated_at)
+    VALUES (:fid, :status, :detail, :fp, :chars, :elapsed_ms, CURRENT_TIMESTAMP)
+    ON CONFLICT(file_id) DO UPDATE SET
+        status = excluded.status, detail = excluded.detail, fingerprint = excluded.fingerprint,
+        chars = excluded.chars, elapsed_ms = excluded.elapsed_ms, updated_at = excluded.updated_at
+""")
+_DEL_STATUS = text("DELETE FROM extract_status WHERE file_id = :fid")
+
+
+class _DocWriter:
+    """
+    Único escritor: acumula resultados e grava docs + map numa transação por lote
+    (com INDEX_SHARDS, docs vai antes para o shard da raiz; ver DocStore).
+    Arquivos duplicados entram só em map, apontando para o docs do arquivo "líder".
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        cache: Optional[TextCache] = None,
+        batch_size: int = BATCH_SIZE,
+        queue: Optional[QueueLease] = None,
+    ):
+        self.db = db
+        self.store = DocStore(db)
+        self.cache = cache
+        self.batch_size = batch_size
+        # checkpoint da fila no mesmo commit de docs/map
+        self.queue = queue
+        self._skipped: List[int] = []
+        self.retried = 0
+        self._batch: List[_Extracted] = []
+        # file_id do líder (ainda no lote) -> duplicados que vão apontar para o mesmo docs
+        self._followers: Dict[int, List[_Task]] = {}
+        # duplicados de um docs já gravado: (tarefa, rowid)
+        self._aliases: List[Tuple[_Task, int]] = []
+        self._hashes: Dict[int, dict] = {}
+        # extract_status: falhas/limites a registrar
+        self._failed: List[_Extracted] = []
+        # docs.rowid dos possíveis líderes já gravados (tarefas que passaram pelo quick_hash)
+        self.rowid_of: Dict[int, int] = {}
+
+    def close(self) -> None:
+        self.store.close()
+
+    def _pending(self) -> int:
+        return (len(self._batch) + len(self._aliases) + len(self._failed) + len(self._skipped)
+                + sum(len(v) for v in self._followers.values()))
+
+    def skip(self, file_id: int) -> None:
+        """Estava na fila mas o fingerprint já confere com map: só sai da fila."""
+        self._skipped.append(file_id)
+        self._maybe_flush()
+
+    def add(self, item: _Extracted) -> None:
+        self._batch.append(item)
+        self._track_hash(item.task)
+        self._maybe_flush()
+
+    def add_failed(self, item: _Extracted) -> None:
+        """Extração falhou: nada vai para docs/map (tenta de novo na próxima execução)."""
+        self._failed.append(item)
+        self._maybe_flush()
+
+    def add_alias(self, task: _Task, rowid: int) -> None:
+        self._aliases.append((task, rowid))
+        self._track_hash(task)
+        self._maybe_flush()
+
+    def follow(self, task: _Task, leader: _Task) -> None:
+        """`task` tem o mesmo conteúdo de `leader`, que já passou por add()."""
+        if leader.file_id in self.rowid_of:
+            self.add_alias(task, self.rowid_of[leader.file_id])
+        else:
+            self._followers.setdefault(leader.file_id, []).append(task)
+            self._track_hash(task)
+            self._maybe_flush()
+
+    def set_hashes(self, file_id: int, qh: Optional[str], ch: Optional[str]) -> None:
+        self._hashes[file_id] = {"fid": file_id, "qh": qh, "ch": ch}
+
+    def _track_hash(self, task: _Task) -> None:
+        if task.quick_hash is not None:
+            self.set_hashes(task.file_id, task.quick_hash, task.content_hash)
+
+    def _maybe_flush(self) -> None:
+        if self._pending() >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._batch and not self._aliases and not self._hashes and not self._failed and not self._skipped:
+            return
+        batch, self._batch = self._batch, []
+        failed, self._failed = self._failed, []
+        aliases, self._aliases = self._aliases, []
+        hashes, self._hashes = list(self._hashes.values()), {}
+        done, self._skipped = self._skipped, []
+        retries: List[Tuple[int, int, str, Optional[str]]] = []
+        map_rows, orphans = [], []
+        status_rows, cleared = [], []
+
+        def _status(t: _Task, it: Optional[_Extracted]) -> None:
+            # duplicados herdam o status do líder; alias só aponta para docs completo (sem extract_status)
+            if it is None or it.status == "ok":
+                cleared.append({"fid": t.file_id})
+            else:
+                status_rows.append({
+                    "fid": t.file_id, "status": it.status, "detail": it.detail, "fp": t.fingerprint,
+                    "chars": len(it.content) if it.content is not None else None, "elapsed_ms": it.elapsed_ms,
+                })
+            if it is not None and it.status in RETRY_STATUSES:
+                retries.append((t.file_id, t.attempts, it.status, it.detail))
+            else:
+                done.append(t.file_id)
+
+        for it in failed:
+            _status(it.task, it)
+        for it in batch:
+            t = it.task
+            rowid = self.store.insert(t.root_id, it.content, t.name, t.ext)
+            map_rows.append({"fid": t.file_id, "rowid": rowid, "fp": t.fingerprint})
+            orphans.append((t.root_id, t.old_rowid))
+            _status(t, it)
+            if t.quick_hash is not None:
+                self.rowid_of[t.file_id] = rowid
+            for f in self._followers.pop(t.file_id, []):
+                map_rows.append({"fid": f.file_id, "rowid": rowid, "fp": f.fingerprint})
+                orphans.append((f.root_id, f.old_rowid))
+                _status(f, it)
+        for t, rowid in aliases:
+            map_rows.append({"fid": t.file_id, "rowid": rowid, "fp": t.fingerprint})
+            orphans.append((t.root_id, t.old_rowid))
+            _status(t, None)
+        # mapear file_id -> docs.rowid com fingerprint
+        if map_rows:
+            self.db.execute(_UPSERT_MAP, map_rows)
+        if hashes:
+            self.db.execute(_SET_HASHES, hashes)
+        if cleared:
+            self.db.execute(_DEL_STATUS, cleared)
+        if status_rows:
+            self.db.execute(_UPSERT_STATUS, status_rows)
+        # fingerprint mudou (ou reindexação forçada): docs antigo sai se ninguém mais aponta para ele
+        self.store.before_commit(orphans)
+        if self.queue is not None:
+            self.queue.checkpoint(done, retries)
+        self.retried += len(retries)
+        self.db.commit()
+        self.store.after_commit(orphans)
+        if self.cache is not None:
+            self._update_cache(batch)
+
+    def _update_cache(self, batch: List[_Extracted]) -> None:
+        fresh, hits = [], []
+        for it in batch:
+            t = it.task
+            # só texto completo: truncado/timeout depende dos limites da execução
+            if t.ext not in CACHED_EXTS or it.status != "ok":
+                continue
+            if it.from_cache:
+                hits.append((t.path, t.fingerprint))
+            else:
+                fresh.append((t.path, t.fingerprint, it.content))
+        try:
+            self.cache.put_many(fresh, hits)
+        except Exception:
+            # cache é só otimização: falha nele não derruba a indexação
+            log.warning("falha ao gravar cache de texto", exc_info=True)
+
+
+# --------- Dedup por conteúdo ---------
+# abaixo disso extrair é mais barato que ler o arquivo para hash
+DEDUP_MIN_SIZE = 4096
+# quantos arquivos com o mesmo quick_hash consultar no banco
+DEDUP_PROBE = 8
+
+_SEL_DUP_SIZES = text("""
+    SELECT size FROM files
+    WHERE ext IN :exts AND size >= :min_size
+    GROUP BY size HAVING COUNT(*) > 1
+""").bindparams(bindparam("exts", expanding=True))
+
+_SEL_SAME_QUICK = text("""
+    SELECT f.id, f.path, f.name, f.size, f.mtime, f.content_hash,
+           CASE WHEN s.file_id IS NULL THEN m.doc_rowid END AS doc_rowid, m.fingerprint
+    FROM files f
+    LEFT JOIN map m ON m.file_id = f.id
+    LEFT JOIN extract_status s ON s.file_id = f.id
+    WHERE f.quick_hash = :qh AND f.size = :size AND f.id != :fid
+      AND (:root_id IS NULL OR f.root_id = :root_id)
+    LIMIT :n
+""")
+
+
+class _Deduper:
+    """
+    Decide se um arquivo repete o conteúdo de outro já indexado (ou desta execução).
+    Filtros em cascata: tamanho repetido -> quick_hash repetido -> SHA-256 igual.
+    Arquivos de tamanho único nunca são lidos aqui.
+    Só compartilha docs entre arquivos de mesmo nome: docs.filename pontua na
+    busca e tem de valer para todos os arquivos que apontam para a linha.
+    Com INDEX_SHARDS, só compara arquivos da mesma raiz (docs.rowid é por shard).
+    """
+
+    def __init__(self, db: Session, writer: _DocWriter, exts: List[str], reuse_existing: bool = True):
+        self.db = db
+        self.writer = writer
+        # False em reindex_all: docs antigos não servem (reconstrução), só compartilha dentro da execução
+        self.reuse_existing = reuse_existing
+        self.per_root = shards.enabled()
+        self.dup_sizes: Set[int] = {
+            size for (size,) in db.execute(_SEL_DUP_SIZES, {"exts": exts, "min_size": DEDUP_MIN_SIZE})
+        }
+        # (raiz, size, quick_hash) -> tarefas desta execução (raiz = None sem shards)
+        self._by_quick: Dict[Tuple[Optional[int], int, str], List[_Task]] = {}
+        # (raiz, content_hash, nome) -> primeira tarefa desta execução com esse conteúdo e nome
+        self._leaders: Dict[Tuple[Optional[int], str, str], _Task] = {}
+
+    def check(self, task: _Task) -> Union[None, int, _Task]:
+        """None = extrair normalmente; int = docs.rowid existente; _Task = líder desta execução."""
+        if task.size < DEDUP_MIN_SIZE or task.size not in self.dup_sizes:
+            return None
+        try:
+            task.quick_hash = quick_hash(task.path, task.size)
+        except OSError:
+            return None
+        scope = task.root_id if self.per_root else None
+        same_run = self._by_quick.setdefault((scope, task.size, task.quick_hash), [])
+        same_db = self.db.execute(_SEL_SAME_QUICK, {
+            "qh": task.quick_hash, "size": task.size, "fid": task.file_id, "root_id": scope, "n": DEDUP_PROBE,
+        }).fetchall()
+        peers = list(same_run)
+        same_run.append(task)
+        if not peers and not same_db:
+            return None
+
+        try:
+            task.content_hash = content_hash(task.path)
+        except OSError:
+            return None
+        # colegas desta execução que ainda não tinham hash completo
+        for peer in peers:
+            if peer.content_hash is None and self._hash_task(peer):
+                self._leaders.setdefault((scope, peer.content_hash, peer.name), peer)
+        leader = self._leaders.get((scope, task.content_hash, task.name))
+        if leader is not None:
+            return leader
+
+        for row in same_db if self.reuse_existing else ():
+            # só reaproveita docs que corresponde ao estado atual do outro arquivo
+            if row.doc_rowid is None or row.name != task.name or row.fingerprint != f"{row.size}-{row.mtime}":
+                continue
+            other_hash = row.content_hash or self._hash_row(row, task.quick_hash)
+            # docs gravado antes do dedup por nome pode ter o nome de outro arquivo
+            if other_hash == task.content_hash and \
+                    self.writer.store.filename(task.root_id, row.doc_rowid) == task.name:
+                return row.doc_rowid
+
+        self._leaders[(scope, task.content_hash, task.name)] = task
+        return None
+
+    def _hash_task(self, task: _Task) -> bool:
+        try:
+            task.content_hash = content_hash(task.path)
+        except OSError:
+            return False
+        self.writer.set_hashes(task.file_id, task.quick_hash, task.content_hash)
+        return True
+
+    def _hash_row(self, row: Row, qh: str) -> Optional[str]:
+        # arquivo indexado antes só com quick_hash: confere se não mudou desde então
+        try:
+            st = os.stat(row.path)
+            if st.st_size != row.size or int(st.st_mtime) != row.mtime:
+                return None
+            h = content_hash(row.path)
+        except OSError:
+            return None
+        self.writer.set_hashes(row.id, qh, h)
+        return h
+
+
+_LIMIT_STATUSES = ("truncated", "timeout", "too_large")
+
+
+def run_index(
+    db: Session,
+    root_id: Optional[int] = None,
+    ext_filter: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+    reindex_all: bool = False,
+    progress: Optional[Callable[[IndexStats], None]] = None,
+    workers: Optional[int] = None,
+    file_ids: Optional[List[int]] = None,
+    refresh_suggest: bool = True,
+) -> IndexStats:
+    """
+    Indexa os arquivos da fila. `progress` é chamado a cada arquivo
+    (pode levantar exceção para interromper; os lotes já gravados ficam no banco
+    e saem da fila, o resto volta para ela).
+    candidates = arquivos que passam nos filtros; skipped = os que não estão
+    prontos na fila (inalterados ou esperando nova tentativa); `limit` vale para
+    os que serão processados. Sem root_id, todas as raízes. Com `file_ids`, só
+    esses arquivos (root_id é ignorado). refresh_suggest=False deixa
+    suggest_terms para a próxima indexação completa (lotes pequenos e
+    frequentes do watcher).
+    """
+    exts = ext_filter or sorted(SUPPORTED_EXTS)
+    changed_only = not reindex_all
+
+    if file_ids is not None:
+        lease = QueueLease(db, exts, file_ids=list(dict.fromkeys(file_ids)))
+    else:
+        if root_id is not None:
+            root_ids = [root_id]
+        else:
+            root_ids = [r for (r,) in db.execute(text("SELECT id FROM root_folders ORDER BY id"))]
+        lease = QueueLease(db, exts, root_ids=root_ids)
+    if reindex_all:
+        lease.sweep(force=True)
+    total, pending = lease.count_files(), lease.count_ready()
+    stats = IndexStats(
+        candidates=total,
+        skipped=max(0, total - pending),
+        pending=pending if limit is None else min(pending, limit),
+    )
+    if progress:
+        progress(stats)
+
+    cache = get_text_cache()
+    writer = _DocWriter(db, cache, queue=lease)
+
+    def _progress() -> None:
+        # entre checkpoints o lease também é renovado (lote lento não o deixa vencer)
+        lease.renew_if_due()
+        if progress:
+            progress(stats)
+
+    deduper = _Deduper(db, writer, exts, reuse_existing=changed_only) if settings.INDEX_DEDUP else None
+    # líder ainda em extração -> duplicados esperando por ele
+    waiting: Dict[int, List[_Task]] = {}
+    # líderes cuja extração já terminou: file_id -> sucesso
+    extracted: Dict[int, bool] = {}
+
+    def _store(item: _Extracted) -> None:
+        followers = waiting.pop(item.task.file_id, [])
+        if item.task.quick_hash is not None:
+            extracted[item.task.file_id] = item.content is not None
+        if item.status in _LIMIT_STATUSES:
+            stats.limited += 1
+        if item.content is None:
+            # mesmo conteúdo, mesma falha
+            writer.add_failed(item)
+            for t in followers:
+                writer.add_failed(_Extracted(task=t, content=None, status=item.status, detail=item.detail))
+            stats.errors += 1 + len(followers)
+        else:
+            writer.add(item)
+            stats.indexed += 1
+            if item.from_cache:
+                stats.cached += 1
+            for t in followers:
+                writer.follow(t, item.task)
+            stats.indexed += len(followers)
+            stats.deduped += len(followers)
+        _progress()
+
+    def _share(task: _Task, target: Union[int, _Task]) -> None:
+        if isinstance(target, int):
+            writer.add_alias(task, target)
+        elif target.file_id in extracted:
+            if not extracted[target.file_id]:
+                writer.add_failed(_Extracted(task=task, content=None, status="error",
+                                             detail="mesmo conteúdo de um arquivo cuja extração falhou"))
+                stats.errors += 1
+                _progress()
+                return
+            writer.follow(task, target)
+        else:
+            waiting.setdefault(target.file_id, []).append(task)
+            return
+        stats.indexed += 1
+        stats.deduped += 1
+        _progress()
+
+    try:
+        with _ExtractionPipeline(resolve_workers(workers), limits_from_settings()) as pipeline:
+            for f in lease.claimed(limit):
+                if changed_only and not f.force and not f.changed:
+                    writer.skip(f.id)
+                    stats.pending -= 1
+                    stats.skipped += 1
+                    _progress()
+                    continue
+                task = _Task(
+                    file_id=f.id, root_id=f.root_id, path=f.path, name=f.name, ext=f.ext or "", size=f.size or 0,
+                    fingerprint=f"{f.size}-{f.mtime}", old_rowid=f.doc_rowid, attempts=f.attempts or 0,
+                )
+                if deduper is not None:
+                    target = deduper.check(task)
+                    if target is not None:
+                        _share(task, target)
+                        continue
+                if cache is not None and task.ext in CACHED_EXTS:
+                    content = cache.get(task.path, task.fingerprint)
+                    if content is not None:
+                        _store(_Extracted(task=task, content=content, from_cache=True))
+                        continue
+                for item in pipeline.submit(task):
+                    _store(item)
+
+            for item in pipeline.drain():
+                _store(item)
+    except Exception:
+        # interrompido (ex.: cancelamento): grava o que já foi extraído, devolve o resto à fila
+        try:
+            writer.flush()
+            lease.release()
+            bump_index_generation(db)
+        except Exception:
+            db.rollback()
+        finally:
+            writer.close()
+        raise
+
+    try:
+        writer.flush()
+    finally:
+        writer.close()
+    lease.release()
+    stats.retried = writer.retried
+    if stats.indexed:
+        if refresh_suggest:
+            refresh_suggest_terms(db)
+        bump_index_generation(db)
+    return stats
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+app/services/jobs.py
+- Execução de scan/indexação em background (pool de threads).
+- Estado persistido na tabela 'jobs': sobrevive a restart (jobs 'queued' são
+  retomados; 'running' sem heartbeat viram 'interrupted').
+- Progresso ao vivo fica em memória (JobContext) e é gravado periodicamente
+  por uma thread monitora, fora da transação do job: o job nunca espera por
+  uma escrita de progresso.
+- Cancelamento: flag cancel_requested no banco (vale entre processos) +
+  evento em memória; o job para no próximo ponto de progresso. Trava perdida
+  (work_locks) usa o mesmo evento: o job termina como interrupted.
+- Vários processos (uvicorn --workers N): pedir o mesmo trabalho (tipo +
+  parâmetros) de novo devolve o job ativo em vez de criar outro (índice único
+  parcial em work_key); ao rodar, o job espera sua trava (scan:<root_id> ou
+  uma vaga index:<n>, ver work_locks).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func, or_, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import SessionLocal, serialized_writer
+from app.models.models import Job, RootFolder
+from app.services import shards
+from app.services.indexer import IndexStats, run_index
+from app.services.scanner import ScanStats, run_root_scan
+from app.services.work_locks import LockLost, index_keys, scan_key, work_locks
+
+log = logging.getLogger(__name__)
+
+FINAL_STATUSES = ("done", "failed", "cancelled", "interrupted")
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobContext:
+    """Progresso ao vivo de um job em execução neste processo."""
+
+    def __init__(self, job_id: int, kind: str):
+        self.job_id = job_id
+        self.kind = kind
+        self.started = time.time()
+        self.processed = 0
+        self.total: Optional[int] = None
+        self.counters: Dict[str, int] = {}
+        self.cancel_event = threading.Event()
+        # True quando o cancelamento veio do desligamento do servidor
+        self.shutdown = False
+        # trava perdida durante a execução (outro processo assumiu o trabalho)
+        self.lost_lock: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def update(self, processed: Optional[int] = None, total: Optional[int] = None, **counters: int) -> None:
+        with self._lock:
+            if processed is not None:
+                self.processed = processed
+            if total is not None:
+                self.total = total
+            self.counters.update(counters)
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"processed": self.processed, "total": self.total, "counters": dict(self.counters)}
+
+    def lock_lost(self, key: str) -> None:
+        """on_lost de work_locks: para o job no próximo ponto de progresso."""
+        self.lost_lock = key
+        self.cancel_event.set()
+
+
+# --------- Executores por tipo de job ---------
+def _run_scan(db: Session, ctx: JobContext, params: Dict[str, Any]) -> Dict[str, Any]:
+    rf = db.query(RootFolder).filter(RootFolder.id == params["root_id"]).first()
+    # estimativa para ETA: quantidade de arquivos do último scan
+    ctx.update(total=rf.files_count if rf else None)
+
+    def progress(stats: ScanStats) -> None:
+        ctx.update(processed=stats.files_count, **asdict(stats))
+
+    rf, stats = run_root_scan(db, params["root_id"], params.get("ext"), params.get("mode") or "incremental", progress)
+    ctx.update(processed=stats.files_count, **asdict(stats))
+    result = asdict(stats)
+    result.update(root_id=rf.id, root_path=rf.path, last_scan_at=rf.last_scan_at.isoformat())
+    return result
+
+
+def _run_index(db: Session, ctx: JobContext, params: Dict[str, Any]) -> Dict[str, Any]:
+    def progress(stats: IndexStats) -> None:
+        ctx.update(processed=stats.processed, total=stats.skipped + stats.pending, **asdict(stats))
+
+    if params.get("rebuild_shard"):
+        # POST /index/shards/{root_id}/rebuild: shard vazio + reindexação forçada da raiz
+        shards.reset_shard(db, params["root_id"])
+    stats = run_index(
+        db,
+        root_id=params.get("root_id"),
+        ext_filter=params.get("ext"),
+        limit=params.get("limit"),
+        reindex_all=bool(params.get("reindex_all")),
+        progress=progress,
+    )
+    return asdict(stats)
+
+
+_RUNNERS: Dict[str, Callable[[Session, JobContext, Dict[str, Any]], Dict[str, Any]]] = {
+    "scan": _run_scan,
+    "index": _run_index,
+}
+
+
+def _lock_keys(kind: str, params: Dict[str, Any]) -> List[str]:
+    return scan_key(params["root_id"]) if kind == "scan" else index_keys()
+
+
+def work_key(kind: str, params: Dict[str, Any]) -> str:
+    return f"{kind}:{json.dumps(params, sort_keys=True)}"
+
+
+# --------- Gerenciador ---------
+_CLAIM = text("""
+    UPDATE jobs SET status = 'running', started_at = :now, heartbeat_at = :now
+    WHERE id = :id AND status = 'queued'
+""")
+_PROGRESS = text("""
+    UPDATE jobs SET processed = :processed, total = :total, counters = :counters, heartbeat_at = :now
+    WHERE id = :id
+""")
+_FINISH = text("""
+    UPDATE jobs SET status = :status, processed = :processed, total = :total, counters = :counters,
+                    result = :result, error = :error, finished_at = :now, heartbeat_at = :now
+    WHERE id = :id
+""")
+
+
+class JobManager:
+    def __init__(self) -> None:
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._live: Dict[int, JobContext] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+
+    # ----- ciclo de vida -----
+    def start(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                return
+            self._stop.clear()
+            self._pool = ThreadPoolExecutor(max_workers=max(1, settings.JOB_WORKERS), thread_name_prefix="job")
+            self._monitor = threading.Thread(target=self._monitor_loop, name="job-monitor", daemon=True)
+            self._monitor.start()
+        self._recover()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+            for ctx in self._live.values():
+                ctx.shutdown = True
+                ctx.cancel_event.set()
+        self._stop.set()
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _recover(self) -> None:
+        db = SessionLocal()
+        try:
+            self._sweep(db)
+            queued = db.query(Job.id).filter(Job.status == "queued").order_by(Job.id.asc()).all()
+        finally:
+            db.close()
+        for (job_id,) in queued:
+            self._schedule(job_id)
+
+    # ----- API -----
+    def submit(self, db: Session, kind: str, params: Dict[str, Any], root_id: Optional[int] = None,
+               user_id: Optional[int] = None) -> Job:
+        """Enfileira o job; se o mesmo trabalho já está na fila ou rodando (em
+        qualquer processo), devolve esse job."""
+        if kind not in _RUNNERS:
+            raise ValueError(f"Tipo de job inválido: {kind}")
+        key = work_key(kind, params)
+        while True:
+            active = db.query(Job).filter(Job.work_key == key, Job.status.in_(ACTIVE_STATUSES)).first()
+            if active is not None:
+                return active
+            job = Job(kind=kind, root_id=root_id, params=json.dumps(params), work_key=key,
+                      status="queued", created_by=user_id)
+            db.add(job)
+            try:
+                db.commit()
+                break
+            except IntegrityError:
+                # outro processo criou o mesmo job entre a consulta e o insert
+                db.rollback()
+        db.refresh(job)
+        self._schedule(job.id)
+        return job
+
+    def cancel(self, db: Session, job: Job) -> None:
+        if job.status in FINAL_STATUSES:
+            return
+        db.query(Job).filter(Job.id == job.id).update({Job.cancel_requested: 1}, synchronize_session=False)
+        # ainda não começou: encerra direto (condicional, o job pode ter acabado de ser pego)
+        db.query(Job).filter(Job.id == job.id, Job.status == "queued").update(
+            {Job.status: "cancelled", Job.finished_at: datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+        db.refresh(job)
+        ctx = self._live.get(job.id)
+        if ctx is not None:
+            ctx.cancel_event.set()
+
+    def live(self, job_id: int) -> Optional[Dict[str, Any]]:
+        ctx = self._live.get(job_id)
+        return ctx.snapshot() if ctx is not None else None
+
+    # ----- execução -----
+    def _schedule(self, job_id: int) -> None:
+        if self._pool is None:
+            self.start()
+        self._pool.submit(self._run, job_id)
+
+    def _run(self, job_id: int) -> None:
+        db = SessionLocal()
+        try:
+            # claim atômico: se outro processo (ou outra thread, ex.: o job
+            # agendado pelo submit e de novo pelo _recover) já pegou, não faz
+            # nada — e não mexe no JobContext de quem está rodando
+            claimed = db.execute(_CLAIM, {"id": job_id, "now": datetime.utcnow()}).rowcount == 1
+            db.commit()
+        except Exception:
+            db.close()
+            raise
+        if not claimed:
+            db.close()
+            return
+        try:
+            job = db.query(Job).filter(Job.id == job_id).first()
+            kind, params = job.kind, json.loads(job.params or "{}")
+            ctx = JobContext(job_id, kind)
+            if job.cancel_requested:
+                ctx.cancel_event.set()
+            with self._lock:
+                self._live[job_id] = ctx
+
+            status, result, error = "done", None, None
+            try:
+                # trava entre processos (rebuild de shard esvazia o shard: todas as
+                # vagas index:<n>), depois um scan/indexação gravando por vez
+                # neste processo; cancelável enquanto espera
+                hold = work_locks.hold_all if params.get("rebuild_shard") else work_locks.hold
+                with hold(_lock_keys(kind, params), job_id=job_id, poll=ctx.update, on_lost=ctx.lock_lost):
+                    with serialized_writer(poll=ctx.update):
+                        result = _RUNNERS[kind](db, ctx, params)
+            except JobCancelled:
+                # o que foi processado até aqui é consistente: mantém
+                db.commit()
+                status = "interrupted" if ctx.shutdown or ctx.lost_lock else "cancelled"
+                if ctx.lost_lock:
+                    error = str(LockLost(ctx.lost_lock))
+            except Exception as e:
+                db.rollback()
+                log.exception("job %s falhou", job_id)
+                status, error = "failed", str(e)
+
+            snap = ctx.snapshot()
+            db.execute(_FINISH, {
+                "id": job_id,
+                "status": status,
+                "processed": snap["processed"],
+                "total": snap["total"],
+                "counters": json.dumps(snap["counters"]),
+                "result": json.dumps(result) if result is not None else None,
+                "error": error,
+                "now": datetime.utcnow(),
+            })
+            db.commit()
+        finally:
+            with self._lock:
+                self._live.pop(job_id, None)
+            db.close()
+
+    # ----- monitor: grava progresso, lê cancelamentos, varre órfãos -----
+    def _monitor_loop(self) -> None:
+        last_sweep = time.time()
+        while not self._stop.wait(max(0.2, settings.JOB_FLUSH_SEC)):
+            db = SessionLocal()
+            try:
+                self._flush(db)
+                if time.time() - last_sweep > settings.JOB_STALE_SEC / 2:
+                    self._sweep(db)
+                    last_sweep = time.time()
+            except OperationalError:
+                # banco ocupado (ex.: lote grande sendo gravado): tenta no próximo ciclo
+                db.rollback()
+            except Exception:
+                db.rollback()
+                log.exception("falha no monitor de jobs")
+            finally:
+                db.close()
+
+    def _flush(self, db: Session) -> None:
+        with self._lock:
+            live = list(self._live.values())
+        if not live:
+            return
+        now = datetime.utcnow()
+        for ctx in live:
+            snap = ctx.snapshot()
+            db.execute(_PROGRESS, {
+                "id": ctx.job_id,
+                "processed": snap["processed"],
+                "total": snap["total"],
+                "counters": json.dumps(snap["counters"]),
+                "now": now,
+            })
+        db.commit()
+        # cancelamento pedido por outro processo
+        ids = [ctx.job_id for ctx in live]
+        cancelled = db.query(Job.id).filter(Job.id.in_(ids), Job.cancel_requested == 1).all()
+        for (job_id,) in cancelled:
+            ctx = self._live.get(job_id)
+            if ctx is not None:
+                ctx.cancel_event.set()
+
+    def _sweep(self, db: Session) -> None:
+        """Jobs 'running' sem heartbeat recente (de outro processo que morreu) viram 'interrupted'."""
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=settings.JOB_STALE_SEC)
+        with self._lock:
+            live_ids = list(self._live)
+        q = db.query(Job).filter(
+            Job.status == "running",
+            or_(Job.heartbeat_at.is_(None), Job.heartbeat_at < cutoff),
+        )
+        if live_ids:
+            q = q.filter(~Job.id.in_(live_ids))
+        q.update(
+            {
+                Job.status: "interrupted",
+                Job.finished_at: now,
+                Job.error: func.coalesce(Job.error, "sem heartbeat (processo encerrado?)"),
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+
+
+job_manager = JobManager()
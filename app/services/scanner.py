@@ -0,0 +1,498 @@
+# -*- coding: utf-8 -*-
+"""
+app/services/scanner.py
+- Motor de varredura de diretórios para o scan de RootFolder.
+- Lista diretórios em paralelo (os.scandir) num pool de threads limitado,
+  reaproveitando os metadados da listagem (sem os.stat extra por arquivo no Windows/UNC).
+- Um único consumidor (a thread que chama iter_tree) recebe as listagens,
+  agenda os subdiretórios e grava no banco: o SQLite continua com um só escritor.
+- Gravação set-based: o estado atual da raiz é carregado uma vez em memória
+  (path -> (size, mtime)) e só o que mudou vai para o banco, em executemany
+  com INSERT ... ON CONFLICT(root_id, path) DO UPDATE.
+- Arquivos que sumiram do disco são removidos ao final (files, map e docs),
+  só quando o diretório acima mais próximo visto neste scan foi listado por
+  inteiro: abaixo de diretório podado, com erro ou com entradas ilegíveis,
+  nada é apagado.
+- Modo incremental: diretórios cujo mtime não mudou desde o último scan
+  (tabela scan_dirs) não são listados; usamos os totais guardados.
+  Observação: o mtime de um diretório muda quando entram/saem/renomeiam
+  entradas, mas não quando um arquivo é regravado no lugar. Para pegar
+  esses casos existe o modo "full".
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import RootFolder
+from app.services.index_store import bump_index_generation, purge_files
+
+SCAN_MODES = ("incremental", "full")
+
+
+@dataclass
+class FileEntry:
+    name: str
+    path: str
+    size: int
+    mtime: int  # epoch seconds
+
+
+@dataclass
+class CachedDir:
+    mtime_ns: int
+    files_count: int
+    total_size_bytes: int
+    children: List[str] = field(default_factory=list)
+
+
+@dataclass
+class DirListing:
+    path: str
+    parent: Optional[str] = None
+    # mtime do diretório em ns (precisão total: evita perder mudanças no mesmo segundo)
+    mtime_ns: Optional[int] = None
+    files: List[FileEntry] = field(default_factory=list)
+    # (path, mtime_ns) — mtime_ns pode ser None quando não veio da listagem
+    subdirs: List[Tuple[str, Optional[int]]] = field(default_factory=list)
+    # arquivos cujo stat falhou (contam como candidatos com erro)
+    file_errors: int = 0
+    # erro ao listar o próprio diretório (permissão, rede, etc.)
+    error: Optional[str] = None
+    # True: mtime igual ao do cache, diretório não foi listado
+    pruned: bool = False
+
+    @property
+    def child_count(self) -> int:
+        return len(self.files) + len(self.subdirs) + self.file_errors
+
+
+def _list_dir(
+    path: str,
+    parent: Optional[str],
+    mtime_ns: Optional[int],
+    cache: Optional[Mapping[str, CachedDir]],
+) -> DirListing:
+    listing = DirListing(path=path, parent=parent, mtime_ns=mtime_ns)
+    try:
+        if listing.mtime_ns is None:
+            listing.mtime_ns = os.stat(path).st_mtime_ns
+
+        cached = cache.get(path) if cache else None
+        if cached is not None and cached.mtime_ns == listing.mtime_ns:
+            # nada entrou/saiu deste diretório: só descemos nos filhos conhecidos
+            # (scan_dirs, inclusive os sem cache, e pastas dos arquivos em files)
+            listing.pruned = True
+            listing.subdirs = [(child, None) for child in cached.children]
+            return listing
+
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        # mesmo comportamento do os.walk(followlinks=False)
+                        if not entry.is_symlink():
+                            try:
+                                sub_mtime = entry.stat(follow_symlinks=False).st_mtime_ns
+                            except OSError:
+                                sub_mtime = None
+                            listing.subdirs.append((entry.path, sub_mtime))
+                        continue
+                except OSError:
+                    pass
+                try:
+                    # no Windows o stat vem da própria listagem (sem ida extra ao servidor)
+                    st = entry.stat()
+                    listing.files.append(FileEntry(
+                        name=entry.name,
+                        path=entry.path,
+                        size=int(st.st_size),
+                        mtime=int(st.st_mtime),
+                    ))
+                except OSError:
+                    listing.file_errors += 1
+    except OSError as e:
+        listing.error = str(e)
+    return listing
+
+
+def iter_tree(
+    base_path: str,
+    workers: Optional[int] = None,
+    cache: Optional[Mapping[str, CachedDir]] = None,
+) -> Iterator[DirListing]:
+    """
+    Percorre base_path listando diretórios concorrentemente.
+    As listagens são entregues na ordem em que ficam prontas; quem consome
+    é a única thread que toca no banco. Com `cache`, diretórios de mtime
+    inalterado voltam como pruned=True, sem listagem.
+    """
+    workers = max(1, workers or settings.SCAN_WORKERS)
+    done: "queue.Queue[DirListing]" = queue.Queue()
+
+    def _task(path: str, parent: Optional[str], mtime_ns: Optional[int]) -> None:
+        try:
+            listing = _list_dir(path, parent, mtime_ns, cache)
+        except Exception as e:  # nunca deixa o consumidor esperando para sempre
+            listing = DirListing(path=path, parent=parent, error=str(e))
+        done.put(listing)
+
+    pending = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan") as pool:
+        pool.submit(_task, base_path, None, None)
+        pending += 1
+        try:
+            while pending:
+                listing = done.get()
+                pending -= 1
+                for sub, sub_mtime in listing.subdirs:
+                    pool.submit(_task, sub, listing.path, sub_mtime)
+                    pending += 1
+                yield listing
+        finally:
+            # consumidor abortou (erro/cancelamento): descarta o que ainda não começou
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+# --------- Gravação em lote ---------
+_SEL_ROOT_FILES = text("SELECT path, id, size, mtime FROM files WHERE root_id = :root_id")
+
+_UPSERT_FILE = text("""
+    INSERT INTO files (root_id, path, name, ext, size, mtime)
+    VALUES (:root_id, :path, :name, :ext, :size, :mtime)
+    ON CONFLICT(root_id, path) DO UPDATE SET
+        name = excluded.name,
+        ext = excluded.ext,
+        quick_hash = CASE WHEN files.size IS excluded.size AND files.mtime IS excluded.mtime
+                          THEN files.quick_hash END,
+        content_hash = CASE WHEN files.size IS excluded.size AND files.mtime IS excluded.mtime
+                            THEN files.content_hash END,
+        size = excluded.size,
+        mtime = excluded.mtime,
+        updated_at = CURRENT_TIMESTAMP
+""")
+
+
+def load_file_index(db: Session, root_id: int) -> Dict[str, Tuple[int, Optional[int], Optional[int]]]:
+    """Estado atual da raiz: path -> (id, size, mtime), numa única consulta."""
+    rows = db.execute(_SEL_ROOT_FILES, {"root_id": root_id})
+    return {path: (fid, size, mtime) for path, fid, size, mtime in rows}
+
+
+class FileBatchWriter:
+    """
+    Acumula inserts/updates de 'files' e grava em executemany.
+    Cada flush é uma transação grande (SCAN_BATCH_SIZE linhas).
+    """
+
+    def __init__(self, db: Session, root_id: int, batch_size: Optional[int] = None):
+        self.db = db
+        self.root_id = root_id
+        self.batch_size = max(1, batch_size or settings.SCAN_BATCH_SIZE)
+        self._rows: List[dict] = []
+
+    def add(self, entry: FileEntry, ext: str) -> None:
+        self._rows.append({
+            "root_id": self.root_id,
+            "path": entry.path,
+            "name": entry.name,
+            "ext": ext,
+            "size": entry.size,
+            "mtime": entry.mtime,
+        })
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._rows:
+            self.db.execute(_UPSERT_FILE, self._rows)
+            self._rows = []
+        self.db.commit()
+
+
+# --------- Cache de diretórios (scan_dirs) ---------
+_SEL_SCAN_DIRS = text("""
+    SELECT path, parent, mtime_ns, files_count, total_size_bytes, ext_key
+    FROM scan_dirs WHERE root_id = :root_id
+""")
+
+_UPSERT_SCAN_DIR = text("""
+    INSERT INTO scan_dirs (root_id, path, parent, mtime_ns, child_count, files_count, total_size_bytes, ext_key, scanned_at)
+    VALUES (:root_id, :path, :parent, :mtime_ns, :child_count, :files_count, :total_size_bytes, :ext_key, CURRENT_TIMESTAMP)
+    ON CONFLICT(root_id, path) DO UPDATE SET
+        parent = excluded.parent,
+        mtime_ns = excluded.mtime_ns,
+        child_count = excluded.child_count,
+        files_count = excluded.files_count,
+        total_size_bytes = excluded.total_size_bytes,
+        ext_key = excluded.ext_key,
+        scanned_at = excluded.scanned_at
+""")
+
+_DEL_SCAN_DIR = text("DELETE FROM scan_dirs WHERE root_id = :root_id AND path = :path")
+
+
+def ext_key_for(ext_filter: Optional[List[str]]) -> str:
+    # os totais guardados só valem para o mesmo filtro de extensões
+    return ",".join(sorted(ext_filter)) if ext_filter else "*"
+
+
+def load_dir_cache(
+    db: Session, root_id: int, ext_key: str, file_paths: Iterable[str] = (),
+) -> Tuple[Dict[str, CachedDir], set]:
+    """Retorna (cache utilizável para este filtro, todos os paths conhecidos).
+
+    Os filhos de um diretório em cache vêm de scan_dirs (inclusive linhas sem
+    cache, ex.: diretório que deu erro) e das pastas dos arquivos em
+    `file_paths`: um diretório podado sempre desce em toda subpasta que ainda
+    tem arquivos no banco.
+    """
+    cache: Dict[str, CachedDir] = {}
+    parents: Dict[str, Optional[str]] = {}
+    known = set()
+    for path, parent, mtime_ns, files_count, total_size, key in db.execute(_SEL_SCAN_DIRS, {"root_id": root_id}):
+        known.add(path)
+        parents[path] = parent
+        if key == ext_key and mtime_ns is not None:
+            cache[path] = CachedDir(mtime_ns=mtime_ns, files_count=files_count or 0, total_size_bytes=total_size or 0)
+    by_key = {_dir_key(path): path for path in cache}
+    children: Dict[str, set] = {path: set() for path in cache}
+    for path, parent in parents.items():
+        if parent is not None and parent in cache:
+            children[parent].add(path)
+    # pastas com arquivos no banco: liga cada uma (e as intermediárias) ao ancestral em cache
+    seen = set()
+    for fpath in file_paths:
+        child = os.path.dirname(fpath)
+        while child not in seen:
+            seen.add(child)
+            parent = os.path.dirname(child)
+            if parent == child:
+                break
+            cached_parent = by_key.get(_dir_key(parent))
+            if cached_parent is not None:
+                children[cached_parent].add(child)
+            child = parent
+    for path, kids in children.items():
+        cache[path].children = sorted(kids)
+    return cache, known
+
+
+# --------- Scan completo de uma raiz ---------
+@dataclass
+class ScanStats:
+    candidates: int = 0
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+    errors: int = 0
+    total_size_bytes: int = 0
+    files_count: int = 0
+    pruned_dirs: int = 0
+    deleted: int = 0
+
+
+def _dir_key(path: str) -> str:
+    # "/dados/" e "/dados" são o mesmo diretório para comparação
+    return path.rstrip("\\/") or path
+
+
+# situação de cada diretório visto num scan
+_DIR_LISTED = "listed"  # listado por inteiro
+_DIR_PARTIAL = "partial"  # listado, mas com entradas ilegíveis
+_DIR_PRUNED = "pruned"  # mtime inalterado, não listado
+_DIR_ERROR = "error"  # não deu para listar
+
+
+def _is_gone(path: str, dir_status: Mapping[str, str]) -> bool:
+    """Arquivo não visto sumiu do disco? Decide o diretório acima mais próximo
+    visto neste scan: listado por inteiro = sim (o arquivo, ou a pasta do
+    caminho até ele, não estava na listagem); qualquer outro caso = não."""
+    d = os.path.dirname(path)
+    while True:
+        status = dir_status.get(_dir_key(d))
+        if status is not None:
+            return status == _DIR_LISTED
+        parent = os.path.dirname(d)
+        if parent == d:
+            return False
+        d = parent
+
+
+def _uncached_dir_row(root_id: int, listing: DirListing, ext_key: str) -> dict:
+    return {
+        "root_id": root_id,
+        "path": listing.path,
+        "parent": listing.parent,
+        "mtime_ns": None,
+        "child_count": listing.child_count,
+        "files_count": 0,
+        "total_size_bytes": 0,
+        "ext_key": ext_key,
+    }
+
+
+def scan_tree(
+    db: Session,
+    root_id: int,
+    base_path: str,
+    ext_filter: Optional[List[str]] = None,
+    mode: str = "incremental",
+    progress: Optional[Callable[[ScanStats], None]] = None,
+) -> ScanStats:
+    """
+    Varre base_path e sincroniza 'files' e 'scan_dirs' da raiz.
+    Não atualiza as stats em root_folders (ver run_root_scan).
+    `progress` é chamado a cada diretório; se levantar exceção o scan para
+    (o que já foi gravado fica, nada é apagado).
+    """
+    if mode not in SCAN_MODES:
+        raise ValueError(f"Modo de scan inválido: {mode}")
+
+    stats = ScanStats()
+    ext_key = ext_key_for(ext_filter)
+
+    # Estado atual da raiz (uma consulta cada) e escritor em lote
+    existing = load_file_index(db, root_id)
+    dir_cache, known_dirs = load_dir_cache(db, root_id, ext_key, existing)
+    writer = FileBatchWriter(db, root_id)
+
+    dir_rows: List[dict] = []
+    visited = set()
+
+    # Detecção de removidos: tudo que existia e não aparecer na listagem.
+    # Só apaga se o diretório mais próximo visto neste scan foi listado por
+    # inteiro (ver _is_gone); podados, com erro ou parciais protegem o que
+    # está abaixo deles.
+    unseen = set(existing)
+    dir_status: Dict[str, str] = {}
+
+    # Caminhamento: listagem paralela (os.scandir), gravação só nesta thread
+    for listing in iter_tree(base_path, cache=dir_cache if mode == "incremental" else None):
+        if progress:
+            progress(stats)
+
+        if listing.error is not None:
+            # diretório inacessível: conta como erro e segue (sem apagar nada abaixo dele)
+            stats.errors += 1
+            dir_status[_dir_key(listing.path)] = _DIR_ERROR
+            # linha sem cache (mtime_ns NULL): o pai continua sabendo deste filho
+            visited.add(listing.path)
+            dir_rows.append(_uncached_dir_row(root_id, listing, ext_key))
+            continue
+
+        if listing.pruned:
+            # diretório inalterado: soma os totais guardados
+            cached = dir_cache[listing.path]
+            stats.files_count += cached.files_count
+            stats.total_size_bytes += cached.total_size_bytes
+            stats.pruned_dirs += 1
+            visited.add(listing.path)
+            dir_status[_dir_key(listing.path)] = _DIR_PRUNED
+            continue
+
+        stats.candidates += listing.file_errors
+        stats.errors += listing.file_errors
+        dir_status[_dir_key(listing.path)] = _DIR_PARTIAL if listing.file_errors else _DIR_LISTED
+
+        dir_files = 0
+        dir_size = 0
+        for entry in listing.files:
+            stats.candidates += 1
+            unseen.discard(entry.path)
+            extn = os.path.splitext(entry.name)[1].lower()
+            if ext_filter and extn not in ext_filter:
+                stats.skipped += 1
+                continue
+
+            dir_files += 1
+            dir_size += entry.size
+
+            # Diff contra o mapa em memória: só grava o que mudou
+            prev = existing.get(entry.path)
+            if prev is None:
+                writer.add(entry, extn)
+                stats.inserted += 1
+            elif prev[1:] != (entry.size, entry.mtime):
+                writer.add(entry, extn)
+                stats.updated += 1
+            else:
+                stats.skipped += 1
+
+        stats.files_count += dir_files
+        stats.total_size_bytes += dir_size
+
+        # diretório com arquivos ilegíveis não entra no cache: será relistado
+        visited.add(listing.path)
+        if listing.file_errors:
+            dir_rows.append(_uncached_dir_row(root_id, listing, ext_key))
+        else:
+            dir_rows.append({
+                "root_id": root_id,
+                "path": listing.path,
+                "parent": listing.parent,
+                "mtime_ns": listing.mtime_ns,
+                "child_count": listing.child_count,
+                "files_count": dir_files,
+                "total_size_bytes": dir_size,
+                "ext_key": ext_key,
+            })
+
+    writer.flush()
+
+    # Remove do banco (e do índice) o que sumiu do disco
+    gone = [existing[path][0] for path in unseen if _is_gone(path, dir_status)]
+    stats.deleted = purge_files(db, gone)
+
+    # Atualiza o cache de diretórios: o que foi listado e o que sumiu
+    if dir_rows:
+        db.execute(_UPSERT_SCAN_DIR, dir_rows)
+    stale = known_dirs - visited
+    if stale:
+        db.execute(_DEL_SCAN_DIR, [{"root_id": root_id, "path": p} for p in stale])
+    db.commit()
+    return stats
+
+
+def _bump_quietly(db: Session) -> None:
+    try:
+        bump_index_generation(db)
+    except Exception:
+        db.rollback()
+
+
+def run_root_scan(
+    db: Session,
+    root_id: int,
+    ext_filter: Optional[List[str]] = None,
+    mode: str = "incremental",
+    progress: Optional[Callable[[ScanStats], None]] = None,
+) -> Tuple[RootFolder, ScanStats]:
+    """Scan de uma raiz cadastrada + atualização das stats em root_folders."""
+    rf = db.query(RootFolder).filter(RootFolder.id == root_id).first()
+    if not rf:
+        raise LookupError(f"Root não encontrado: {root_id}")
+
+    try:
+        stats = scan_tree(db, rf.id, rf.path, ext_filter=ext_filter, mode=mode, progress=progress)
+    except Exception:
+        # interrompido: o que já foi gravado pode ter mudado resultados de busca
+        _bump_quietly(db)
+        raise
+
+    rf.files_count = stats.files_count
+    rf.total_size_bytes = stats.total_size_bytes
+    rf.last_scan_at = datetime.utcnow()
+    db.commit()
+    if stats.inserted or stats.updated or stats.deleted:
+        bump_index_generation(db)
+    return rf, stats
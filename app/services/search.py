@@ -0,0 +1,605 @@
+# -*- coding: utf-8 -*-
+"""
+app/services/search.py
+- Consulta FTS5 (docs) unindo files via map, com filtros de metadados.
+- Permissão dentro do SQL: root_ids (raízes legíveis) vira f.root_id IN (...)
+  na mesma consulta do MATCH — sem filtrar em Python depois.
+- Ordenações:
+  - relevance: bm25() com peso por coluna (content / filename). O FTS5 entrega
+    as linhas já em ordem de rank (ORDER BY rank), então o LIMIT para assim que
+    a página fecha, depois dos filtros — sem ordenar todos os acertos.
+    Consultas muito amplas: só os SEARCH_MAX_SCORED acertos mais recentes
+    (maior docs.rowid) são pontuados; o piso de rowid vai no cursor, então as
+    páginas seguintes usam a mesma janela. A janela é contada depois dos
+    filtros e da permissão (mesmo WHERE da busca), e search_docs avisa quando
+    ficou acerto de fora (truncated).
+  - recent: boost por código de projeto no nome (via files_trgm) + mtime.
+- Paginação por cursor opaco (keyset), estável em páginas profundas; o cursor
+  carrega um hash da consulta e é recusado se usado com outros filtros.
+- snippet() só é calculado para as linhas da página.
+- Facetas (ext, raiz, ano do mtime, faixa de tamanho): uma passada sobre o
+  conjunto filtrado (CTE materializada, agregada 4x), limitada aos
+  SEARCH_FACET_MAX_ROWS acertos mais recentes.
+- INDEX_SHARDS: cada raiz tem seu docs (shards); a consulta roda em cada shard
+  envolvido (em paralelo) com o mesmo SQL e os top-k são juntados aqui. Na
+  relevância a chave ganha a raiz, (rank, raiz, rowid, file_id), e o cursor
+  guarda o piso de cada shard. O bm25 usa as estatísticas de cada shard.
+- Espaços em q são normalizados (normalize_query) na entrada de cada função:
+  chave de cache, hash do cursor e MATCH veem a mesma consulta.
+- search_cached: páginas em cache LRU (SEARCH_CACHE_SIZE/TTL). A chave inclui
+  os filtros (com as raízes do usuário) e a geração do índice, que muda a cada varredura/indexação — resultados de um
+  índice antigo nunca são servidos.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import json
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.services import shards
+from app.services.filename_index import project_boost_sql
+from app.services.index_store import get_index_generation
+
+ORDERS = ("relevance", "recent")
+
+# maior rowid do SQLite: keyset de shard anterior à raiz do cursor não deixa passar empate
+_MAX_ROWID = 2 ** 63 - 1
+
+
+class InvalidQuery(ValueError):
+    """Consulta FTS5 com erro de sintaxe ou cursor inválido."""
+
+
+@dataclass
+class SearchFilters:
+    exts: Optional[List[str]] = None
+    root_id: Optional[int] = None
+    since_epoch: Optional[int] = None
+    until_epoch: Optional[int] = None
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+    project: Optional[str] = None
+    # permissão: raízes legíveis pelo usuário (None = todas)
+    root_ids: Optional[List[int]] = None
+
+
+@dataclass
+class SearchHit:
+    file_id: int
+    doc_rowid: int
+    path: str
+    name: str
+    ext: Optional[str]
+    size: Optional[int]
+    mtime: Optional[int]
+    score: float
+    snippet: str = ""
+
+
+@dataclass
+class FacetCount:
+    value: Any
+    count: int
+
+
+@dataclass
+class SearchFacets:
+    total: int  # acertos contados (== SEARCH_FACET_MAX_ROWS quando truncated)
+    truncated: bool
+    ext: List[FacetCount] = field(default_factory=list)
+    root_id: List[FacetCount] = field(default_factory=list)
+    year: List[FacetCount] = field(default_factory=list)
+    size: List[FacetCount] = field(default_factory=list)
+
+
+# --------- filtros ---------
+def _filters_sql(f: SearchFilters) -> Tuple[str, Dict[str, Any]]:
+    parts: List[str] = []
+    params: Dict[str, Any] = {}
+    if f.exts:
+        parts.append("AND f.ext IN :exts")
+        params["exts"] = list(f.exts)
+    if f.root_id is not None:
+        parts.append("AND f.root_id = :root_id")
+        params["root_id"] = f.root_id
+    if f.root_ids is not None:
+        parts.append("AND f.root_id IN :root_ids")
+        params["root_ids"] = list(f.root_ids)
+    if f.since_epoch is not None:
+        parts.append("AND f.mtime >= :since_epoch")
+        params["since_epoch"] = f.since_epoch
+    if f.until_epoch is not None:
+        parts.append("AND f.mtime <= :until_epoch")
+        params["until_epoch"] = f.until_epoch
+    if f.min_size is not None:
+        parts.append("AND f.size >= :min_size")
+        params["min_size"] = f.min_size
+    if f.max_size is not None:
+        parts.append("AND f.size <= :max_size")
+        params["max_size"] = f.max_size
+    return "\n".join(parts), params
+
+
+def _stmt(sql: str, params: Dict[str, Any]):
+    stmt = text(sql)
+    for name in ("exts", "root_ids"):
+        if name in params:
+            stmt = stmt.bindparams(bindparam(name, expanding=True))
+    return stmt
+
+
+def normalize_query(q: str) -> str:
+    """Espaços repetidos não mudam o MATCH (são só separadores): uma forma só da consulta."""
+    return " ".join(q.split())
+
+
+# --------- cursor ---------
+def _query_hash(q: str, order: str, filters: SearchFilters) -> str:
+    key = [q, order, asdict(filters)]
+    if shards.enabled():
+        # cursor de um layout não vale no outro
+        key.append("shards")
+    raw = json.dumps(key, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def encode_cursor(qhash: str, key: List[Any]) -> str:
+    raw = json.dumps({"h": qhash, "k": key}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, qhash: str) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        key = data["k"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidQuery("Cursor inválido")
+    if data.get("h") != qhash:
+        raise InvalidQuery("Cursor não corresponde a esta consulta")
+    return key
+
+
+# --------- consultas ---------
+_BASE_FROM = """
+    FROM docs
+    JOIN map ON map.doc_rowid = docs.rowid
+    JOIN files f ON f.id = map.file_id
+    WHERE docs MATCH :q
+"""
+_COLS = "docs.rowid AS doc_rowid, f.id AS file_id, f.path, f.name, f.ext, f.size, f.mtime"
+
+# relevance: chave (rank, doc_rowid, file_id) crescente; rank do bm25 é negativo (menor = melhor)
+_RELEVANCE_SQL = """
+    SELECT {cols}, docs.rank AS rank
+    {base}
+    AND docs.rowid >= :floor
+    AND docs.rank MATCH :rank_fn
+    {filters}
+    {keyset}
+    ORDER BY docs.rank
+    LIMIT :n
+"""
+_RELEVANCE_KEYSET = """
+    AND docs.rank >= :c_rank
+    AND (docs.rank > :c_rank OR docs.rowid > :c_rowid OR (docs.rowid = :c_rowid AND f.id > :c_fid))
+"""
+# "+" impede o FTS5 de ler "rank = ?" como configuração da função de rank
+_RELEVANCE_TIES_SQL = """
+    SELECT {cols}, docs.rank AS rank
+    {base}
+    AND docs.rowid >= :floor
+    AND docs.rank MATCH :rank_fn
+    AND +docs.rank = :tie
+    {filters}
+    {keyset}
+    ORDER BY docs.rowid, f.id
+"""
+# piso da janela de pontuação: acima do (N+1)-ésimo acerto mais recente, com os
+# mesmos filtros da busca (FTS5 percorre por rowid sem pontuar)
+_SCORE_FLOOR_SQL = """
+    SELECT docs.rowid
+    {base}
+    {filters}
+    ORDER BY docs.rowid DESC
+    LIMIT 1 OFFSET :n
+"""
+
+# recent: chave (boost, mtime, file_id) decrescente
+_MTIME = "COALESCE(f.mtime, 0)"
+_RECENT_SQL = """
+    SELECT {cols}, {boost} AS boost
+    {base}
+    {filters}
+    {keyset}
+    ORDER BY boost DESC, {mtime} DESC, f.id DESC
+    LIMIT :n
+"""
+_RECENT_KEYSET = """
+    AND ({boost} < :c_boost OR ({boost} = :c_boost AND ({mtime} < :c_mtime OR ({mtime} = :c_mtime AND f.id < :c_fid))))
+"""
+
+_SNIPPETS = text("""
+    SELECT rowid, snippet(docs, 0, '[', ']', ' ... ', 8)
+    FROM docs WHERE docs MATCH :q AND rowid IN :rowids
+""").bindparams(bindparam("rowids", expanding=True))
+
+
+# facetas: a CTE é lida 4 vezes, MATERIALIZED garante um único MATCH
+SIZE_BUCKETS = (
+    ("0-100KB", 100 * 1024),
+    ("100KB-1MB", 1024 ** 2),
+    ("1-10MB", 10 * 1024 ** 2),
+    ("10-100MB", 100 * 1024 ** 2),
+    ("100MB+", None),
+)
+_SIZE_BUCKET = "CASE WHEN size IS NULL THEN NULL {whens} END".format(
+    whens=" ".join(
+        f"WHEN size < {limit} THEN '{label}'" if limit else f"ELSE '{label}'"
+        for label, limit in SIZE_BUCKETS
+    )
+)
+_FACETS_SQL = """
+    WITH m AS MATERIALIZED (
+        SELECT f.ext, f.root_id, f.mtime, f.size
+        {base}
+        {filters}
+        ORDER BY docs.rowid DESC
+        LIMIT :cap
+    )
+    SELECT 'ext' AS facet, ext AS value, COUNT(*) AS n FROM m GROUP BY 2
+    UNION ALL
+    SELECT 'root_id', root_id, COUNT(*) FROM m GROUP BY 2
+    UNION ALL
+    SELECT 'year', CAST(strftime('%Y', mtime, 'unixepoch', 'localtime') AS INTEGER), COUNT(*) FROM m GROUP BY 2
+    UNION ALL
+    SELECT 'size', {bucket}, COUNT(*) FROM m GROUP BY 2
+"""
+
+# mensagens do SQLite/FTS5 para expressão MATCH malformada
+_FTS_QUERY_ERRORS = ("fts5", "syntax error", "unterminated string", "no such column", "unknown special query")
+
+
+def rank_function() -> str:
+    # colunas de docs: content, filename, ext (ext não pontua)
+    return f"bm25({float(settings.SEARCH_WEIGHT_CONTENT)}, {float(settings.SEARCH_WEIGHT_FILENAME)}, 0.0)"
+
+
+def _hit(row, score: float) -> SearchHit:
+    return SearchHit(
+        file_id=row.file_id, doc_rowid=row.doc_rowid, path=row.path, name=row.name,
+        ext=row.ext, size=row.size, mtime=row.mtime, score=score,
+    )
+
+
+def _score_floor(db: Session, q: str, filters: SearchFilters) -> int:
+    """0 = todos os acertos são pontuados; senão, menor rowid pontuado (há acertos abaixo dele)."""
+    if settings.SEARCH_MAX_SCORED <= 0:
+        return 0
+    filters_sql, params = _filters_sql(filters)
+    sql = _SCORE_FLOOR_SQL.format(base=_BASE_FROM, filters=filters_sql)
+    beyond = db.execute(_stmt(sql, params), {**params, "q": q, "n": settings.SEARCH_MAX_SCORED}).scalar()
+    return beyond + 1 if beyond is not None else 0
+
+
+def _relevance_rows(db: Session, q: str, filters: SearchFilters, limit: int, floor: int,
+                    after: Optional[Tuple[float, int, int]]) -> List[Any]:
+    """Até limit+1 linhas (ou mais, com empate no corte) em ordem (rank, doc_rowid, file_id)."""
+    filters_sql, params = _filters_sql(filters)
+    params.update(q=q, rank_fn=rank_function(), floor=floor)
+    keyset = ""
+    if after is not None:
+        keyset = _RELEVANCE_KEYSET
+        params.update(c_rank=float(after[0]), c_rowid=int(after[1]), c_fid=int(after[2]))
+
+    sql = _RELEVANCE_SQL.format(cols=_COLS, base=_BASE_FROM, filters=filters_sql, keyset=keyset)
+    rows = db.execute(_stmt(sql, {**params}), {**params, "n": limit + 1}).fetchall()
+
+    # empate de rank no corte da página: traz o grupo inteiro em ordem total
+    # (rowid, file_id) para o cursor não pular nem repetir linhas
+    if len(rows) > limit and rows[limit].rank == rows[limit - 1].rank:
+        tie = rows[limit].rank
+        head = [r for r in rows if r.rank != tie]
+        sql = _RELEVANCE_TIES_SQL.format(cols=_COLS, base=_BASE_FROM, filters=filters_sql, keyset=keyset)
+        rows = head + db.execute(_stmt(sql, params), {**params, "tie": tie}).fetchall()
+    return sorted(rows, key=lambda r: (r.rank, r.doc_rowid, r.file_id))
+
+
+def _search_relevance(db: Session, q: str, filters: SearchFilters, limit: int,
+                      after: Optional[List[Any]]) -> Tuple[List[SearchHit], Optional[List[Any]], bool]:
+    floor = int(after[3]) if after is not None else _score_floor(db, q, filters)
+    rows = _relevance_rows(db, q, filters, limit, floor, after[:3] if after is not None else None)
+
+    page = rows[:limit]
+    hits = [_hit(r, round(-r.rank, 4)) for r in page]
+    next_key = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_key = [last.rank, last.doc_rowid, last.file_id, floor]
+    return hits, next_key, floor > 0
+
+
+def _recent_rows(db: Session, q: str, filters: SearchFilters, limit: int, after: Optional[List[Any]],
+                 boost: str, boost_params: Dict[str, Any]) -> List[Any]:
+    """Até limit+1 linhas em ordem (boost, mtime, file_id) decrescente."""
+    filters_sql, params = _filters_sql(filters)
+    params.update(q=q, **boost_params)
+    keyset = ""
+    if after is not None:
+        keyset = _RECENT_KEYSET.format(boost=boost, mtime=_MTIME)
+        params.update(c_boost=float(after[0]), c_mtime=int(after[1]), c_fid=int(after[2]))
+
+    sql = _RECENT_SQL.format(cols=_COLS, boost=boost, mtime=_MTIME, base=_BASE_FROM,
+                             filters=filters_sql, keyset=keyset)
+    return db.execute(_stmt(sql, params), {**params, "n": limit + 1}).fetchall()
+
+
+def _search_recent(db: Session, q: str, filters: SearchFilters, limit: int,
+                   after: Optional[List[Any]]) -> Tuple[List[SearchHit], Optional[List[Any]], bool]:
+    boost, boost_params = project_boost_sql(db, filters.project)
+    rows = _recent_rows(db, q, filters, limit, after, boost, boost_params)
+
+    page = rows[:limit]
+    hits = [_hit(r, float(r.boost or 0.0)) for r in page]
+    next_key = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_key = [last.boost, last.mtime or 0, last.file_id]
+    return hits, next_key, False
+
+
+# --------- INDEX_SHARDS: uma consulta por shard, top-k juntado aqui ---------
+def _shard_filters(filters: SearchFilters, root_id: int) -> SearchFilters:
+    # a raiz do shard já passou pela checagem de permissão (target_roots)
+    return replace(filters, root_id=root_id, root_ids=None)
+
+
+def _search_relevance_sharded(
+    db: Session, q: str, filters: SearchFilters, limit: int, after: Optional[List[Any]],
+) -> Tuple[List[Tuple[int, SearchHit]], Optional[List[Any]], bool]:
+    """Chave (rank, raiz, doc_rowid, file_id); cursor = chave + pisos por shard."""
+    roots = shards.target_roots(db, filters.root_id, filters.root_ids)
+    floors = {int(k): v for k, v in after[4].items()} if after is not None else {}
+
+    def one(sdb: Session, rid: int) -> Tuple[int, List[Any]]:
+        shard_filters = _shard_filters(filters, rid)
+        floor = floors.get(rid)
+        if floor is None:
+            floor = _score_floor(sdb, q, shard_filters)
+        key = None
+        if after is not None:
+            c_rank, c_root, c_rowid, c_fid = after[0], int(after[1]), after[2], after[3]
+            if rid > c_root:
+                key = (c_rank, -1, -1)  # mesmo rank ainda vem depois do cursor
+            elif rid < c_root:
+                key = (c_rank, _MAX_ROWID, _MAX_ROWID)  # só rank pior
+            else:
+                key = (c_rank, c_rowid, c_fid)
+        return floor, _relevance_rows(sdb, q, shard_filters, limit, floor, key)
+
+    results = shards.fan_out(roots, one)
+    floors = {rid: floor for rid, (floor, _) in results}
+    rows = sorted(
+        ((rid, r) for rid, (_, shard_rows) in results for r in shard_rows),
+        key=lambda x: (x[1].rank, x[0], x[1].doc_rowid, x[1].file_id),
+    )
+    page = rows[:limit]
+    hits = [(rid, _hit(r, round(-r.rank, 4))) for rid, r in page]
+    next_key = None
+    if len(rows) > limit:
+        rid, last = page[-1]
+        next_key = [last.rank, rid, last.doc_rowid, last.file_id, {str(k): v for k, v in floors.items()}]
+    return hits, next_key, any(floor > 0 for floor in floors.values())
+
+
+def _search_recent_sharded(
+    db: Session, q: str, filters: SearchFilters, limit: int, after: Optional[List[Any]],
+) -> Tuple[List[Tuple[int, SearchHit]], Optional[List[Any]], bool]:
+    """file_id é único entre raízes: a chave (boost, mtime, file_id) já é total."""
+    roots = shards.target_roots(db, filters.root_id, filters.root_ids)
+    boost, boost_params = project_boost_sql(db, filters.project)
+    results = shards.fan_out(
+        roots, lambda sdb, rid: _recent_rows(sdb, q, _shard_filters(filters, rid), limit, after, boost, boost_params)
+    )
+    rows = sorted(
+        ((rid, r) for rid, shard_rows in results for r in shard_rows),
+        key=lambda x: (x[1].boost or 0.0, x[1].mtime or 0, x[1].file_id),
+        reverse=True,
+    )
+    page = rows[:limit]
+    hits = [(rid, _hit(r, float(r.boost or 0.0))) for rid, r in page]
+    next_key = None
+    if len(rows) > limit:
+        last = page[-1][1]
+        next_key = [last.boost, last.mtime or 0, last.file_id]
+    return hits, next_key, False
+
+
+def _attach_snippets_sharded(q: str, hits: List[Tuple[int, SearchHit]]) -> None:
+    by_root: Dict[int, List[SearchHit]] = {}
+    for rid, h in hits:
+        by_root.setdefault(rid, []).append(h)
+    shards.fan_out(list(by_root), lambda sdb, rid: _attach_snippets(sdb, q, by_root[rid]))
+
+
+def _attach_snippets(db: Session, q: str, hits: List[SearchHit]) -> None:
+    rowids = sorted({h.doc_rowid for h in hits})
+    if not rowids:
+        return
+    snippets = dict(db.execute(_SNIPPETS, {"q": q, "rowids": rowids}).fetchall())
+    for h in hits:
+        h.snippet = snippets.get(h.doc_rowid) or ""
+
+
+@contextmanager
+def _match_errors():
+    # erro de sintaxe na expressão MATCH (aspas, operadores) não é erro do servidor
+    try:
+        yield
+    except OperationalError as e:
+        msg = str(e.orig).lower()
+        if any(marker in msg for marker in _FTS_QUERY_ERRORS):
+            raise InvalidQuery(f"Consulta inválida: {e.orig}")
+        raise
+
+
+def search_docs(
+    db: Session,
+    q: str,
+    filters: SearchFilters,
+    order: str = "relevance",
+    limit: int = 50,
+    cursor: Optional[str] = None,
+) -> Tuple[List[SearchHit], Optional[str], bool]:
+    """Uma página de resultados, cursor da próxima (None = acabou) e truncated:
+    True quando a consulta passou de SEARCH_MAX_SCORED acertos e os mais
+    antigos ficaram fora da relevância."""
+    if order not in ORDERS:
+        raise InvalidQuery(f"Ordenação inválida: {order}")
+    q = normalize_query(q)
+    qhash = _query_hash(q, order, filters)
+    after = decode_cursor(cursor, qhash) if cursor else None
+    with _match_errors():
+        if shards.enabled():
+            run = _search_relevance_sharded if order == "relevance" else _search_recent_sharded
+            pairs, next_key, truncated = run(db, q, filters, limit, after)
+            _attach_snippets_sharded(q, pairs)
+            hits = [h for _, h in pairs]
+        else:
+            run = _search_relevance if order == "relevance" else _search_recent
+            hits, next_key, truncated = run(db, q, filters, limit, after)
+            _attach_snippets(db, q, hits)
+    next_cursor = encode_cursor(qhash, next_key) if next_key is not None else None
+    return hits, next_cursor, truncated
+
+
+def search_facets(db: Session, q: str, filters: SearchFilters) -> SearchFacets:
+    """Contagens por ext, raiz, ano e faixa de tamanho sobre o mesmo conjunto da busca."""
+    q = normalize_query(q)
+    cap = settings.SEARCH_FACET_MAX_ROWS
+
+    def count(sdb: Session, f: SearchFilters) -> List[Any]:
+        filters_sql, params = _filters_sql(f)
+        sql = _FACETS_SQL.format(base=_BASE_FROM, filters=filters_sql, bucket=_SIZE_BUCKET)
+        return sdb.execute(_stmt(sql, params), {**params, "q": q, "cap": cap}).fetchall()
+
+    with _match_errors():
+        if shards.enabled():
+            # SEARCH_FACET_MAX_ROWS vale por shard; truncated se algum shard chegou nele
+            roots = shards.target_roots(db, filters.root_id, filters.root_ids)
+            per_shard = [rows for _, rows in shards.fan_out(
+                roots, lambda sdb, rid: count(sdb, _shard_filters(filters, rid)))]
+        else:
+            per_shard = [count(db, filters)]
+
+    merged: Dict[Tuple[str, Any], int] = {}
+    truncated = False
+    for rows in per_shard:
+        for facet, value, n in rows:
+            merged[(facet, value)] = merged.get((facet, value), 0) + n
+        truncated |= cap > 0 and sum(n for facet, _, n in rows if facet == "root_id") >= cap
+
+    groups: Dict[str, List[FacetCount]] = {"ext": [], "root_id": [], "year": [], "size": []}
+    for (facet, value), n in merged.items():
+        if value is not None:
+            groups[facet].append(FacetCount(value=value, count=n))
+    total = sum(n for (facet, _), n in merged.items() if facet == "root_id")
+
+    top = settings.SEARCH_FACET_MAX_VALUES
+    groups["ext"].sort(key=lambda c: (-c.count, c.value))
+    groups["root_id"].sort(key=lambda c: (-c.count, c.value))
+    groups["year"].sort(key=lambda c: -c.value)
+    order = {label: i for i, (label, _) in enumerate(SIZE_BUCKETS)}
+    groups["size"].sort(key=lambda c: order[c.value])
+    return SearchFacets(
+        total=total,
+        truncated=truncated,
+        ext=groups["ext"][:top],
+        root_id=groups["root_id"][:top],
+        year=groups["year"][:top],
+        size=groups["size"],
+    )
+
+
+
+_MATCH_FILE_IDS = """
+    SELECT f.id
+    {base}
+    {filters}
+    ORDER BY docs.rowid DESC, f.id
+    LIMIT :n
+"""
+
+
+def match_file_ids(db: Session, q: str, filters: SearchFilters, limit: int) -> List[int]:
+    """Ids de todos os arquivos que casam (sem ranking nem snippet), até `limit`.
+    Com INDEX_SHARDS, raiz por raiz (ordem de root_id)."""
+    q = normalize_query(q)
+
+    def ids(sdb: Session, f: SearchFilters) -> List[int]:
+        filters_sql, params = _filters_sql(f)
+        sql = _MATCH_FILE_IDS.format(base=_BASE_FROM, filters=filters_sql)
+        return [fid for (fid,) in sdb.execute(_stmt(sql, params), {**params, "q": q, "n": limit})]
+
+    with _match_errors():
+        if not shards.enabled():
+            return ids(db, filters)
+        roots = shards.target_roots(db, filters.root_id, filters.root_ids)
+        found = shards.fan_out(roots, lambda sdb, rid: ids(sdb, _shard_filters(filters, rid)))
+    return [fid for _, shard_ids in found for fid in shard_ids][:limit]
+
+
+search_cache = LRUCache("search", settings.SEARCH_CACHE_SIZE, settings.SEARCH_CACHE_TTL_SEC)
+
+
+def search_cached(
+    db: Session,
+    q: str,
+    filters: SearchFilters,
+    order: str = "relevance",
+    limit: int = 50,
+    cursor: Optional[str] = None,
+) -> Tuple[List[SearchHit], Optional[str], bool]:
+    """search_docs com cache. filters.root_ids faz parte da chave: usuários com
+    raízes diferentes não dividem entradas."""
+    q = normalize_query(q)
+    if not search_cache.enabled:
+        return search_docs(db, q, filters, order, limit, cursor)
+    key = (
+        q, order, json.dumps(asdict(filters), sort_keys=True, default=str),
+        limit, cursor, get_index_generation(db),
+    )
+    cached = search_cache.get(key)
+    if cached is not None:
+        return cached
+    result = search_docs(db, q, filters, order, limit, cursor)
+    search_cache.put(key, result)
+    return result
+
+
+def search_facets_cached(db: Session, q: str, filters: SearchFilters) -> SearchFacets:
+    """search_facets com cache; não depende de ordenação nem de cursor (vale para todas as páginas)."""
+    q = normalize_query(q)
+    if not search_cache.enabled:
+        return search_facets(db, q, filters)
+    key = (
+        "facets", q, json.dumps(asdict(filters), sort_keys=True, default=str),
+        get_index_generation(db),
+    )
+    cached = search_cache.get(key)
+    if cached is not None:
+        return cached
+    result = search_facets(db, q, filters)
+    search_cache.put(key, result)
+    return result
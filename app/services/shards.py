@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+app/services/shards.py
+- Layout opcional do índice (INDEX_SHARDS=true): o docs (FTS5) de cada raiz
+  num arquivo próprio, INDEX_SHARD_DIR/root_<id>.db. files, map, fila,
+  extract_status e suggest_terms continuam no banco principal.
+- Cada conexão de shard abre o arquivo do shard e anexa o banco principal como
+  "lib": nomes sem prefixo resolvem sozinhos (docs é o do shard; files, map e
+  files_trgm vêm do principal), então o SQL da busca é o mesmo nos dois layouts.
+  Um shard por conexão: sem o limite de ATTACH (10) e sem ATTACH no meio de
+  transação.
+- map.doc_rowid só faz sentido dentro do shard da raiz do arquivo: consultas
+  num shard filtram f.root_id, e o dedup não cruza raízes.
+- Busca numa raiz abre só o shard dela; em várias, fan_out() roda uma thread
+  por shard (SEARCH_SHARD_WORKERS) e quem chama junta os top-k.
+- Escrita: docs vai para o shard e é confirmado antes do map (principal) que
+  aponta para ele. Queda entre os dois commits deixa docs sem referência no
+  shard: invisível na busca, some no rebuild.
+- reset_shard(): esvazia o shard (e map da raiz) e compacta o arquivo; o
+  rebuild é reset + reindexação forçada da raiz. drop_shard(): apaga o arquivo
+  (raiz removida).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import IS_SQLITE, create_sqlite_engine, engine
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# alias do banco principal dentro das conexões de shard
+LIB = "lib"
+
+_CLEAR_MAP_OF_ROOT = text("DELETE FROM map WHERE file_id IN (SELECT id FROM files WHERE root_id = :root_id)")
+_ROOT_IDS = text("SELECT id FROM root_folders ORDER BY id")
+_MAPPED_BY_ROOT = text("""
+    SELECT f.root_id, COUNT(*) FROM map JOIN files f ON f.id = map.file_id
+    WHERE f.root_id IN :root_ids GROUP BY f.root_id
+""").bindparams(bindparam("root_ids", expanding=True))
+
+_engines: Dict[Tuple[int, bool], Engine] = {}
+_ready: set = set()
+_lock = threading.Lock()
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def enabled() -> bool:
+    return bool(settings.INDEX_SHARDS) and IS_SQLITE
+
+
+def shard_path(root_id: int) -> str:
+    return os.path.join(settings.INDEX_SHARD_DIR, f"root_{int(root_id)}.db")
+
+
+def shard_exists(root_id: int) -> bool:
+    return os.path.exists(shard_path(root_id))
+
+
+def _engine(root_id: int, read_only: bool) -> Engine:
+    key = (root_id, read_only)
+    with _lock:
+        eng = _engines.get(key)
+        if eng is None:
+            pool = {"pool_size": 2, "max_overflow": settings.DB_READ_POOL_SIZE} if read_only else {}
+            eng = create_sqlite_engine(
+                shard_path(root_id), read_only=read_only, attach={LIB: engine.url.database}, **pool
+            )
+            _engines[key] = eng
+        return eng
+
+
+def _dispose(root_id: int) -> None:
+    with _lock:
+        engines = [_engines.pop((root_id, ro), None) for ro in (False, True)]
+        _ready.discard(root_id)
+    for eng in engines:
+        if eng is not None:
+            eng.dispose()
+
+
+def _create_schema(conn: Connection) -> None:
+    from app.services.index_store import DOCS_DDL
+
+    for ddl in DOCS_DDL:
+        conn.execute(text(ddl))
+
+
+def writer(root_id: int) -> Connection:
+    """Conexão de escrita no shard da raiz (criado na primeira vez). Quem chama fecha."""
+    if root_id not in _ready:
+        os.makedirs(settings.INDEX_SHARD_DIR, exist_ok=True)
+        with _engine(root_id, read_only=False).begin() as conn:
+            _create_schema(conn)
+        _ready.add(root_id)
+    return _engine(root_id, read_only=False).connect()
+
+
+def reader(root_id: int) -> Session:
+    return Session(bind=_engine(root_id, read_only=True))
+
+
+def all_root_ids(db: Session) -> List[int]:
+    return [r for (r,) in db.execute(_ROOT_IDS)]
+
+
+def target_roots(db: Session, root_id: Optional[int], root_ids: Optional[Sequence[int]]) -> List[int]:
+    """Shards que uma consulta precisa abrir (root_ids = raízes legíveis, None = todas)."""
+    if root_id is not None:
+        wanted = [root_id] if root_ids is None or root_id in root_ids else []
+    elif root_ids is not None:
+        wanted = sorted(set(root_ids))
+    else:
+        wanted = all_root_ids(db)
+    # raiz sem shard ainda não tem nada indexado
+    return [r for r in wanted if shard_exists(r)]
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=max(1, settings.SEARCH_SHARD_WORKERS),
+                                       thread_name_prefix="shard")
+        return _pool
+
+
+def fan_out(root_ids: Sequence[int], fn: Callable[[Session, int], T]) -> List[Tuple[int, T]]:
+    """fn(sessão do shard, root_id) em cada shard, em paralelo; resultados na ordem de root_ids."""
+    def one(rid: int) -> T:
+        with reader(rid) as sdb:
+            return fn(sdb, rid)
+
+    if len(root_ids) <= 1:
+        return [(rid, one(rid)) for rid in root_ids]
+    futures = [(rid, _executor().submit(one, rid)) for rid in root_ids]
+    return [(rid, fut.result()) for rid, fut in futures]
+
+
+def reset_shard(db: Session, root_id: int) -> None:
+    """Esvazia o índice de conteúdo da raiz: map da raiz e docs do shard.
+    Os arquivos continuam em files; voltam ao índice com reindex_all."""
+    db.execute(_CLEAR_MAP_OF_ROOT, {"root_id": root_id})
+    db.commit()
+    if not shard_exists(root_id):
+        return
+    # no mesmo arquivo (não apaga): conexões abertas em outros processos continuam válidas
+    with _engine(root_id, read_only=False).begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS docs_vocab"))
+        conn.execute(text("DROP TABLE IF EXISTS docs"))
+        _create_schema(conn)
+    with _engine(root_id, read_only=False).connect() as conn:
+        conn.exec_driver_sql("VACUUM")
+        # em WAL o VACUUM passa pelo -wal: sem o checkpoint o espaço não volta ao disco
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def drop_shard(root_id: int) -> None:
+    """Apaga o arquivo do shard (raiz removida)."""
+    _dispose(root_id)
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(shard_path(root_id) + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def shard_info(db: Session, root_ids: Sequence[int]) -> List[dict]:
+    mapped = dict(db.execute(_MAPPED_BY_ROOT, {"root_ids": list(root_ids)}).fetchall()) if root_ids else {}
+    out = []
+    for rid in root_ids:
+        path = shard_path(rid)
+        size = sum(os.path.getsize(path + s) for s in ("", "-wal") if os.path.exists(path + s))
+        out.append({
+            "root_id": rid,
+            "path": path,
+            "exists": os.path.exists(path),
+            "size_bytes": size,
+            "files_indexed": mapped.get(rid, 0),
+        })
+    return out
+
+
+def switch_layout_if_changed(db: Session) -> bool:
+    """Na inicialização: se INDEX_SHARDS mudou, descarta o índice de conteúdo do
+    layout anterior (map, docs e extract_status). Retorna True se descartou: tudo
+    volta à fila."""
+    wanted = 1 if enabled() else 0
+    current = db.execute(text("SELECT value FROM app_meta WHERE key = 'index_sharded'")).scalar()
+    if current is None:
+        # banco anterior a esta opção: se já há índice, ele está no layout único
+        has_map = db.execute(text("SELECT 1 FROM map LIMIT 1")).first() is not None
+        current = 0 if has_map else wanted
+    if current == wanted:
+        db.execute(text("""
+            INSERT INTO app_meta(key, value) VALUES ('index_sharded', :v)
+            ON CONFLICT(key) DO NOTHING
+        """), {"v": wanted})
+        db.commit()
+        return False
+    log.warning("INDEX_SHARDS mudou (%s -> %s): índice de conteúdo será reconstruído", current, wanted)
+    db.execute(text("DELETE FROM map"))
+    db.execute(text("DELETE FROM docs"))
+    # a varredura pula arquivos com status no fingerprint atual (truncated, error...):
+    # sem apagar, eles ficariam fora do novo índice
+    db.execute(text("DELETE FROM extract_status"))
+    db.execute(text("""
+        INSERT INTO app_meta(key, value) VALUES ('index_sharded', :v)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+    """), {"v": wanted})
+    db.commit()
+    # shards de um período anterior com INDEX_SHARDS ligado não valem mais
+    if os.path.isdir(settings.INDEX_SHARD_DIR):
+        for name in os.listdir(settings.INDEX_SHARD_DIR):
+            if name.startswith("root_") and ".db" in name:
+                os.remove(os.path.join(settings.INDEX_SHARD_DIR, name))
+    return True
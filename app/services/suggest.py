@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+app/services/suggest.py
+- Autocompletar (search-as-you-type) sem rodar MATCH com '*' a cada tecla.
+- Termos: tabela suggest_terms (termo, nº de docs), derivada de docs_vocab
+  (fts5vocab) ao final de cada indexação que altera o índice. Termos em menos
+  de SUGGEST_MIN_DOCS documentos ficam de fora (erros de digitação, números).
+  Ler o fts5vocab direto a cada tecla custaria centenas de ms em prefixos amplos.
+- Arquivos: trecho do nome via files_trgm (filename_index).
+- Cache LRU dos prefixos mais digitados, invalidado pela geração do índice.
+- Usuário sem acesso a todas as raízes só recebe termos presentes em algum
+  documento das suas raízes, checados todos numa consulta só, e sem a contagem
+  docs: o vocabulário é global e a contagem revelaria o conteúdo das outras.
+- INDEX_SHARDS: suggest_terms soma o docs_vocab de cada shard; a checagem de
+  raiz consulta os shards das raízes do usuário.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Set
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.services import shards
+from app.services.filename_index import TRIGRAM_MIN, find_files
+from app.services.index_store import get_index_generation
+
+log = logging.getLogger(__name__)
+
+# candidatos buscados por sugestão pedida (parte é descartada na checagem de raiz)
+_OVERFETCH = 3
+
+_REFRESH = (
+    text("DELETE FROM suggest_terms"),
+    text("""
+        INSERT INTO suggest_terms(term, docs)
+        SELECT term, doc FROM docs_vocab
+        WHERE doc >= :min_docs AND length(term) >= 2
+    """),
+)
+# shards: cada docs_vocab somado num termo só; o corte por SUGGEST_MIN_DOCS vem depois
+_ADD_SHARD_TERM = text("""
+    INSERT INTO suggest_terms(term, docs) VALUES (:term, :docs)
+    ON CONFLICT(term) DO UPDATE SET docs = docs + excluded.docs
+""")
+_SHARD_VOCAB = text("SELECT term, doc FROM docs_vocab WHERE length(term) >= 2")
+_DROP_RARE = text("DELETE FROM suggest_terms WHERE docs < :min_docs")
+_VOCAB_CHUNK = 5000
+_TERMS = text("""
+    SELECT term, docs FROM suggest_terms
+    WHERE term >= :lo AND term < :hi
+    ORDER BY docs DESC, term
+    LIMIT :n
+""")
+# um SELECT por candidato (UNION ALL): devolve o índice dos que aparecem nas raízes
+_VISIBLE_ONE = """
+    SELECT * FROM (
+        SELECT {i} FROM docs
+        JOIN map ON map.doc_rowid = docs.rowid
+        JOIN files f ON f.id = map.file_id
+        WHERE docs MATCH :q{i} AND f.root_id IN :root_ids
+        LIMIT 1
+    )
+"""
+
+suggest_cache = LRUCache("suggest", settings.SUGGEST_CACHE_SIZE, settings.SUGGEST_CACHE_TTL_SEC)
+
+
+@dataclass
+class TermSuggestion:
+    term: str
+    docs: Optional[int]  # None para quem não lê todas as raízes
+    completion: str  # texto digitado com o último termo completado
+
+
+@dataclass
+class Suggestions:
+    terms: List[TermSuggestion] = field(default_factory=list)
+    files: List = field(default_factory=list)
+
+
+def refresh_suggest_terms(db: Session) -> int:
+    """Recria suggest_terms a partir do vocabulário do FTS5 (uma transação)."""
+    t0 = time.perf_counter()
+    db.execute(_REFRESH[0])
+    if shards.enabled():
+        count = _refresh_from_shards(db)
+    else:
+        count = db.execute(_REFRESH[1], {"min_docs": settings.SUGGEST_MIN_DOCS}).rowcount
+    db.commit()
+    log.info("suggest_terms: %s termos em %.1fs", count, time.perf_counter() - t0)
+    return count
+
+
+def _refresh_from_shards(db: Session) -> int:
+    for root_id in shards.target_roots(db, None, None):
+        with shards.reader(root_id) as sdb:
+            rows = sdb.execute(_SHARD_VOCAB)
+            while True:
+                chunk = rows.fetchmany(_VOCAB_CHUNK)
+                if not chunk:
+                    break
+                db.execute(_ADD_SHARD_TERM, [{"term": t, "docs": n} for t, n in chunk])
+    db.execute(_DROP_RARE, {"min_docs": settings.SUGGEST_MIN_DOCS})
+    return db.execute(text("SELECT COUNT(*) FROM suggest_terms")).scalar()
+
+
+def _visible(db: Session, terms: Sequence[str], root_ids: Sequence[int]) -> Set[str]:
+    """Termos com ao menos um documento nas raízes dadas."""
+    if not terms:
+        return set()
+    stmt = text(" UNION ALL ".join(_VISIBLE_ONE.format(i=i) for i in range(len(terms))))
+    stmt = stmt.bindparams(bindparam("root_ids", expanding=True))
+    params = {f"q{i}": f'"{term}"' for i, term in enumerate(terms)}
+
+    def found(conn: Session, ids: Sequence[int]) -> Set[str]:
+        return {terms[i] for (i,) in conn.execute(stmt, {**params, "root_ids": list(ids)})}
+
+    if not shards.enabled():
+        return found(db, root_ids)
+    roots = shards.target_roots(db, None, root_ids)
+    return set().union(*(hits for _, hits in shards.fan_out(roots, lambda sdb, rid: found(sdb, [rid]))))
+
+
+def normalize_term(s: str) -> str:
+    """Como o tokenizer unicode61 guarda os termos: minúsculo e sem acento."""
+    decomposed = unicodedata.normalize("NFKD", s.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def split_prefix(q: str) -> tuple:
+    """("relatorio ", "fin") para "relatorio fin": último token ainda em digitação."""
+    i = len(q)
+    while i > 0 and q[i - 1].isalnum():
+        i -= 1
+    return q[:i], q[i:]
+
+
+def _term_candidates(db: Session, prefix: str, n: int) -> List[tuple]:
+    key = (prefix, n, get_index_generation(db))
+    rows = suggest_cache.get(key)
+    if rows is None:
+        hi = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        rows = [tuple(r) for r in db.execute(_TERMS, {"lo": prefix, "hi": hi, "n": n}).fetchall()]
+        suggest_cache.put(key, rows)
+    return rows
+
+
+def suggest(
+    db: Session,
+    q: str,
+    limit: int = 8,
+    root_ids: Optional[Sequence[int]] = None,
+) -> Suggestions:
+    """Completações de termo e de nome de arquivo. root_ids=None: todas as raízes."""
+    out = Suggestions()
+    if root_ids is not None and not root_ids:
+        return out
+    head, partial = split_prefix(q)
+    prefix = normalize_term(partial)
+
+    if prefix:
+        candidates = _term_candidates(db, prefix, limit * _OVERFETCH if root_ids is not None else limit)
+        if root_ids is not None:
+            visible = _visible(db, [term for term, _ in candidates], root_ids)
+            candidates = [(term, None) for term, _ in candidates if term in visible]
+        out.terms = [TermSuggestion(term=term, docs=docs, completion=head + term)
+                     for term, docs in candidates[:limit]]
+
+    fragment = q.strip()
+    if len(fragment) >= TRIGRAM_MIN:
+        out.files = find_files(db, fragment, field="name", mode="substring", root_ids=root_ids, limit=limit)
+    return out
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+app/services/text_cache.py
+- Cache em disco do texto extraído (zlib), num SQLite separado do banco principal.
+- Chave: caminho + fingerprint (size-mtime); entradas de outra EXTRACTOR_VERSION
+  contam como ausentes e são sobrescritas.
+- Tamanho limitado (TEXT_CACHE_MAX_MB): ao estourar, remove as menos usadas (LRU).
+- Reconstruir o índice (reindex_all, troca de tokenizer, recuperação do FTS)
+  passa a ler daqui em vez de reabrir PDF/DOCX/PPTX/XLSX.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+from app.services.extractors import EXTRACTOR_VERSION
+
+# só vale a pena para formatos com parser; texto puro já é leitura direta
+CACHED_EXTS = {".pdf", ".docx", ".pptx", ".xlsx", ".odt", ".ods", ".odp", ".rtf", ".eml"}
+
+# ao estourar o limite, libera até ficar nessa fração (evita despejo a cada lote)
+EVICT_TARGET = 0.9
+
+_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS text_cache (
+        path TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        last_used REAL NOT NULL,
+        data BLOB NOT NULL,
+        PRIMARY KEY (path, fingerprint)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_text_cache_last_used ON text_cache(last_used)",
+)
+
+_SEL = text("SELECT version, data FROM text_cache WHERE path = :path AND fingerprint = :fp")
+_PUT = text("""
+    INSERT INTO text_cache(path, fingerprint, version, size, last_used, data)
+    VALUES (:path, :fp, :version, :size, :now, :data)
+    ON CONFLICT(path, fingerprint) DO UPDATE SET
+        version = excluded.version, size = excluded.size,
+        last_used = excluded.last_used, data = excluded.data
+""")
+_TOUCH = text("UPDATE text_cache SET last_used = :now WHERE path = :path AND fingerprint = :fp")
+_TOTAL = text("SELECT COALESCE(SUM(size), 0) FROM text_cache")
+_OLDEST = text("SELECT rowid, size FROM text_cache ORDER BY last_used ASC LIMIT :n")
+_DEL = text("DELETE FROM text_cache WHERE rowid = :rowid")
+
+Key = Tuple[str, str]  # (path, fingerprint)
+
+
+class TextCache:
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.engine: Engine = create_engine(
+            f"sqlite:///{path}", connect_args={"check_same_thread": False}, future=True
+        )
+        with self.engine.begin() as conn:
+            for ddl in _DDL:
+                conn.execute(text(ddl))
+            self._bytes = conn.execute(_TOTAL).scalar_one()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, fingerprint: str) -> Optional[str]:
+        with self.engine.connect() as conn:
+            row = conn.execute(_SEL, {"path": path, "fp": fingerprint}).first()
+        if row is None or row.version != EXTRACTOR_VERSION:
+            return None
+        try:
+            return zlib.decompress(row.data).decode("utf-8")
+        except (zlib.error, UnicodeDecodeError):
+            return None
+
+    def put_many(self, items: Iterable[Tuple[str, str, str]], touched: Iterable[Key] = ()) -> None:
+        """Grava (path, fingerprint, texto) e atualiza o LRU dos acertos, numa transação."""
+        now = time.time()
+        rows: List[Dict] = []
+        for path, fp, content in items:
+            data = zlib.compress(content.encode("utf-8"), 6)
+            rows.append({"path": path, "fp": fp, "version": EXTRACTOR_VERSION,
+                         "size": len(data), "now": now, "data": data})
+        touch = [{"path": p, "fp": fp, "now": now} for p, fp in touched]
+        if not rows and not touch:
+            return
+        with self._lock, self.engine.begin() as conn:
+            if rows:
+                conn.execute(_PUT, rows)
+            if touch:
+                conn.execute(_TOUCH, touch)
+            # contagem aproximada (sobrescritas somam de novo); a real é refeita no despejo
+            self._bytes += sum(r["size"] for r in rows)
+            if self._bytes > self.max_bytes:
+                self._evict(conn)
+
+    def _evict(self, conn) -> None:
+        self._bytes = conn.execute(_TOTAL).scalar_one()
+        target = int(self.max_bytes * EVICT_TARGET)
+        while self._bytes > target:
+            victims = conn.execute(_OLDEST, {"n": 500}).fetchall()
+            if not victims:
+                break
+            drop = []
+            for rowid, size in victims:
+                if self._bytes <= target:
+                    break
+                drop.append({"rowid": rowid})
+                self._bytes -= size
+            conn.execute(_DEL, drop)
+
+
+_cache: Optional[TextCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_text_cache() -> Optional[TextCache]:
+    """Instância única por processo; None se desligado (TEXT_CACHE_MAX_MB <= 0)."""
+    global _cache
+    if settings.TEXT_CACHE_MAX_MB <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = TextCache(settings.TEXT_CACHE_PATH, settings.TEXT_CACHE_MAX_MB * 1024 * 1024)
+        return _cache
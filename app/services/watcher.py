@@ -0,0 +1,536 @@
+# -*- coding: utf-8 -*-
+"""
+app/services/watcher.py
+- Watcher opcional (WATCH_ENABLED): mudanças no disco chegam a 'files' e ao
+  índice em segundos, sem esperar o próximo scan e sem percorrer a árvore.
+- Linux: inotify via ctypes (sem dependência extra), um watch por diretório.
+  Sem inotify (outro SO, caminho UNC, limite fs.inotify.max_user_watches,
+  WATCH_BACKEND=poll): scan incremental a cada WATCH_POLL_SEC.
+- Eventos são agrupados por caminho e aplicados em lote quando ficam
+  WATCH_DEBOUNCE_SEC sem novidade (ou WATCH_MAX_DELAY_SEC após o primeiro):
+  upsert/remoção em files e indexação só dos arquivos tocados.
+- Ao iniciar e quando a fila do kernel estoura (IN_Q_OVERFLOW) roda um scan
+  incremental da raiz: cobre o que mudou sem ninguém olhando.
+- inotify não vê mudanças feitas por outras máquinas num compartilhamento
+  montado (CIFS/NFS): para essas raízes use WATCH_BACKEND=poll.
+- Com vários processos, cada raiz fica com quem pegar a trava watch:<root_id>
+  (os outros assumem se ele morrer); cada lote aplicado segura scan:<root_id>.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import stat as stat_mod
+import struct
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import SessionLocal, serialized_writer
+from app.models.models import RootFolder
+from app.services.index_store import bump_index_generation, purge_files
+from app.services.indexer import run_index
+from app.services.scanner import FileBatchWriter, FileEntry, run_root_scan
+from app.services.work_locks import scan_key, watch_key, work_locks
+
+log = logging.getLogger(__name__)
+
+# --------- inotify (ctypes) ---------
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# IN_MODIFY fica de fora (um evento por write); o arquivo entra no fechamento.
+# IN_CREATE de arquivo também: ainda está vazio, vem o IN_CLOSE_WRITE depois.
+_WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK
+)
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len (+ nome)
+_READ_SIZE = 256 * 1024
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch
+    except (OSError, AttributeError):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+_libc = _load_libc()
+
+
+def inotify_available() -> bool:
+    return _libc is not None
+
+
+@dataclass
+class ChangeSet:
+    paths: Set[str] = field(default_factory=set)  # arquivos a conferir (stat): upsert ou remoção
+    gone_dirs: Set[str] = field(default_factory=set)  # diretórios que saíram: remove o que havia abaixo
+    rescan: bool = False  # scan incremental da raiz
+
+    def __bool__(self) -> bool:
+        return bool(self.paths or self.gone_dirs or self.rescan)
+
+
+class _InotifyBackend:
+    name = "inotify"
+
+    def __init__(self, root_path: str):
+        self.root = root_path.rstrip("/") or "/"
+        self.fd = -1
+        self._wd_path: Dict[int, str] = {}
+        self._path_wd: Dict[str, int] = {}
+        self._poller = select.poll()
+
+    def start(self) -> None:
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        self._poller.register(self.fd, select.POLLIN)
+        try:
+            self._add_tree(self.root)
+        except OSError:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    @property
+    def watches(self) -> int:
+        return len(self._wd_path)
+
+    def _add_watch(self, path: str) -> bool:
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            e = ctypes.get_errno()
+            if e == errno.ENOSPC:
+                raise OSError(e, "limite de watches do inotify (fs.inotify.max_user_watches)")
+            return False  # sumiu, sem permissão, não é diretório: segue
+        # mesmo inode já vigiado (rename dentro da raiz) devolve o mesmo wd
+        self._wd_path[wd] = path
+        self._path_wd[path] = wd
+        return True
+
+    def _add_tree(self, top: str, changes: Optional[ChangeSet] = None) -> None:
+        """Vigia top e subdiretórios; com `changes`, os arquivos já presentes entram
+        como pendentes (foram criados antes do watch existir)."""
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            if not self._add_watch(path):
+                continue
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            elif changes is not None:
+                                changes.paths.add(entry.path)
+                        except OSError:
+                            pass
+            except OSError:
+                pass
+
+    def _drop_tree(self, top: str) -> None:
+        prefix = top + "/"
+        for path in [p for p in self._path_wd if p == top or p.startswith(prefix)]:
+            wd = self._path_wd.pop(path)
+            # wd remapeado por um rename dentro da raiz continua valendo
+            if self._wd_path.get(wd) == path:
+                del self._wd_path[wd]
+                _libc.inotify_rm_watch(self.fd, wd)
+
+    def _forget(self, wd: int) -> None:
+        path = self._wd_path.pop(wd, None)
+        if path is not None and self._path_wd.get(path) == wd:
+            del self._path_wd[path]
+
+    def read(self, timeout: float, changes: ChangeSet) -> bool:
+        if not self._poller.poll(int(timeout * 1000)):
+            return False
+        try:
+            data = os.read(self.fd, _READ_SIZE)
+        except BlockingIOError:
+            return False
+        moved_out: List[str] = []
+        off = 0
+        while off < len(data):
+            wd, mask, _cookie, ln = _EVENT.unpack_from(data, off)
+            name = data[off + _EVENT.size:off + _EVENT.size + ln].split(b"\0", 1)[0]
+            off += _EVENT.size + ln
+
+            if mask & IN_Q_OVERFLOW:
+                changes.rescan = True
+                continue
+            if mask & IN_IGNORED:
+                self._forget(wd)
+                continue
+            parent = self._wd_path.get(wd)
+            if parent is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if parent == self.root:
+                    changes.rescan = True
+                continue
+
+            path = os.path.join(parent, os.fsdecode(name))
+            if not mask & IN_ISDIR:
+                if mask & (IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE):
+                    changes.paths.add(path)
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                self._add_tree(path, changes)
+            elif mask & IN_MOVED_FROM:
+                # resolvido no fim do lote: se o par IN_MOVED_TO veio junto,
+                # os watches já foram remapeados para o novo caminho
+                changes.gone_dirs.add(path)
+                moved_out.append(path)
+            elif mask & IN_DELETE:
+                changes.gone_dirs.add(path)
+        for path in moved_out:
+            self._drop_tree(path)
+        return True
+
+
+class _PollingBackend:
+    name = "poll"
+
+    def __init__(self, root_path: str, interval: float):
+        self.interval = max(1.0, interval)
+        self._next = time.monotonic() + self.interval
+        self.watches = 0
+
+    def start(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def read(self, timeout: float, changes: ChangeSet) -> bool:
+        wait = self._next - time.monotonic()
+        if wait > 0:
+            time.sleep(min(wait, timeout))
+            if time.monotonic() < self._next:
+                return False
+        self._next = time.monotonic() + self.interval
+        changes.rescan = True
+        return True
+
+
+# --------- Aplicação das mudanças no banco ---------
+_SEL_BY_PATH = text("SELECT path, id, size, mtime FROM files WHERE root_id = :root_id AND path IN :paths").bindparams(
+    bindparam("paths", expanding=True)
+)
+_SEL_UNDER = text("SELECT path, id FROM files WHERE root_id = :root_id AND path >= :lo AND path < :hi")
+
+_PATH_CHUNK = 1000
+# lotes pequenos são extraídos na própria thread (subir processos custa mais)
+_LOCAL_EXTRACT_MAX = 64
+
+
+@dataclass
+class WatchStats:
+    events: int = 0  # leituras com eventos (inotify) ou ciclos de polling
+    flushes: int = 0
+    upserted: int = 0
+    deleted: int = 0
+    indexed: int = 0
+    rescans: int = 0
+    errors: int = 0
+
+
+def _known(db: Session, root_id: int, paths: List[str]) -> Dict[str, tuple]:
+    out: Dict[str, tuple] = {}
+    for i in range(0, len(paths), _PATH_CHUNK):
+        rows = db.execute(_SEL_BY_PATH, {"root_id": root_id, "paths": paths[i:i + _PATH_CHUNK]})
+        out.update({path: (fid, size, mtime) for path, fid, size, mtime in rows})
+    return out
+
+
+def apply_changes(
+    db: Session,
+    root_id: int,
+    changes: ChangeSet,
+    stats: WatchStats,
+    check: Optional[Callable[[], None]] = None,
+) -> None:
+    """Sincroniza files com o disco para os caminhos tocados e indexa o que mudou.
+    `check` é chamado durante scan/indexação (pode levantar exceção para parar)."""
+    progress = (lambda _stats: check()) if check is not None else None
+    if changes.rescan:
+        _, scan = run_root_scan(db, root_id, mode="incremental", progress=progress)
+        stats.upserted += scan.inserted + scan.updated
+        stats.deleted += scan.deleted
+        stats.indexed += run_index(db, root_id=root_id, progress=progress).indexed
+        stats.rescans += 1
+        # o scan incremental poda diretórios de mtime igual: arquivos regravados
+        # no lugar ainda dependem dos caminhos abaixo
+
+    gone: Set[int] = set()
+    for d in changes.gone_dirs:
+        prefix = d.rstrip("/") + "/"
+        for path, fid in db.execute(_SEL_UNDER, {"root_id": root_id, "lo": prefix, "hi": prefix + "\U0010ffff"}):
+            if not os.path.lexists(path):
+                gone.add(fid)
+
+    paths = sorted(changes.paths)
+    existing = _known(db, root_id, paths)
+    writer = FileBatchWriter(db, root_id)
+    touched: List[str] = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        if st is None or not stat_mod.S_ISREG(st.st_mode):
+            if path in existing:
+                gone.add(existing[path][0])
+            continue
+        entry = FileEntry(name=os.path.basename(path), path=path, size=int(st.st_size), mtime=int(st.st_mtime))
+        prev = existing.get(path)
+        if prev is not None and prev[1:] == (entry.size, entry.mtime):
+            continue
+        writer.add(entry, os.path.splitext(entry.name)[1].lower())
+        touched.append(path)
+    writer.flush()
+    stats.upserted += len(touched)
+    stats.deleted += purge_files(db, gone)
+
+    if touched:
+        ids = [v[0] for v in _known(db, root_id, touched).values()]
+        workers = 1 if len(ids) <= _LOCAL_EXTRACT_MAX else None
+        # suggest_terms fica para a próxima indexação completa: recalcular a cada lote custa segundos
+        stats.indexed += run_index(
+            db, file_ids=ids, workers=workers, refresh_suggest=False, progress=progress,
+        ).indexed
+    if touched or gone:
+        bump_index_generation(db)
+
+
+# --------- Um watcher por raiz ---------
+class _Stopped(Exception):
+    pass
+
+
+class RootWatcher:
+    def __init__(self, root_id: int, path: str):
+        self.root_id = root_id
+        self.path = path
+        self.stats = WatchStats()
+        self.backend_name: Optional[str] = None
+        self.watches = 0
+        self.pending = 0
+        self.last_flush_at: Optional[datetime] = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._loop, name=f"watch-{root_id}", daemon=True)
+
+    def _open_backend(self):
+        wanted = settings.WATCH_BACKEND
+        if wanted != "poll" and inotify_available() and not self.path.startswith("\\\\"):
+            backend = _InotifyBackend(self.path)
+            try:
+                backend.start()
+                return backend
+            except OSError as e:
+                log.warning("watcher raiz %s: inotify indisponível (%s), usando polling", self.root_id, e)
+        elif wanted == "inotify":
+            log.warning("watcher raiz %s: inotify indisponível, usando polling", self.root_id)
+        return _PollingBackend(self.path, settings.WATCH_POLL_SEC)
+
+    def _check_stop(self) -> None:
+        if self.stop_event.is_set():
+            raise _Stopped()
+
+    def _flush(self, changes: ChangeSet) -> bool:
+        db = SessionLocal()
+        try:
+            with work_locks.hold(scan_key(self.root_id), poll=self._check_stop) as key, \
+                    serialized_writer(poll=self._check_stop):
+                # trava perdida: LockLost, o lote volta a ser tentado (como em falha)
+                def check() -> None:
+                    self._check_stop()
+                    work_locks.check(key)
+
+                apply_changes(db, self.root_id, changes, self.stats, check=check)
+            self.stats.flushes += 1
+            self.last_flush_at = datetime.utcnow()
+            return True
+        except _Stopped:
+            # desligando: o que já foi gravado fica, o resto o scan de partida recupera
+            db.rollback()
+            return True
+        except Exception:
+            db.rollback()
+            self.stats.errors += 1
+            log.exception("watcher raiz %s: falha ao aplicar mudanças", self.root_id)
+            return False
+        finally:
+            db.close()
+
+    def _loop(self) -> None:
+        backend = self._open_backend()
+        self.backend_name = backend.name
+        self.watches = backend.watches
+        # alcança o que mudou enquanto ninguém olhava
+        changes = ChangeSet(rescan=True)
+        first = last = time.monotonic()
+        try:
+            while not self.stop_event.is_set():
+                now = time.monotonic()
+                timeout = 1.0
+                if changes:
+                    due = min(last + settings.WATCH_DEBOUNCE_SEC, first + settings.WATCH_MAX_DELAY_SEC)
+                    if now >= due:
+                        self.pending = 0
+                        if not self._flush(changes):
+                            # tenta de novo com um scan incremental, sem martelar o banco
+                            self.stop_event.wait(settings.WATCH_MAX_DELAY_SEC)
+                            changes = ChangeSet(rescan=True)
+                            first = last = time.monotonic()
+                            continue
+                        changes = ChangeSet()
+                        continue
+                    timeout = min(timeout, due - now)
+                had = bool(changes)
+                if backend.read(max(timeout, 0.01), changes):
+                    self.stats.events += 1
+                    last = time.monotonic()
+                    if not had:
+                        first = last
+                    self.pending = len(changes.paths) + len(changes.gone_dirs)
+                    self.watches = backend.watches
+        finally:
+            backend.close()
+
+    def status(self) -> dict:
+        return {
+            "root_id": self.root_id,
+            "path": self.path,
+            "backend": self.backend_name,
+            "watches": self.watches,
+            "pending": self.pending,
+            "last_flush_at": self.last_flush_at.isoformat() if self.last_flush_at else None,
+            **asdict(self.stats),
+        }
+
+
+# --------- Gerenciador ---------
+# de quanto em quanto tempo confere raízes novas/removidas
+_ROOTS_REFRESH_SEC = 60.0
+
+
+def _wanted_root_ids() -> Optional[Set[int]]:
+    raw = settings.WATCH_ROOTS.strip()
+    if not raw:
+        return None
+    return {int(x) for x in raw.split(",") if x.strip()}
+
+
+class WatchManager:
+    def __init__(self) -> None:
+        self._watchers: Dict[int, RootWatcher] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if not settings.WATCH_ENABLED or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="watch-manager", daemon=True)
+        self._thread.start()
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        with self._lock:
+            watchers = list(self._watchers.values())
+            self._watchers.clear()
+        for w in watchers:
+            w.stop_event.set()
+        for w in watchers:
+            w.thread.join(timeout=10)
+            work_locks.release(watch_key(w.root_id))
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def status(self) -> List[dict]:
+        with self._lock:
+            return [w.status() for w in self._watchers.values()]
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self._sync()
+            except Exception:
+                log.exception("watcher: falha ao carregar raízes")
+            if self._stop.wait(_ROOTS_REFRESH_SEC):
+                return
+
+    def _sync(self) -> None:
+        wanted = _wanted_root_ids()
+        db = SessionLocal()
+        try:
+            roots = {
+                rf.id: rf.path for rf in db.query(RootFolder).all()
+                if (wanted is None or rf.id in wanted) and rf.path and os.path.isdir(rf.path)
+            }
+        finally:
+            db.close()
+        with self._lock:
+            if self._stop.is_set():
+                return
+            for root_id, w in list(self._watchers.items()):
+                # raiz removida/alterada, ou a trava venceu e outro processo assumiu
+                if roots.get(root_id) != w.path or not work_locks.holds(watch_key(root_id)):
+                    w.stop_event.set()
+                    del self._watchers[root_id]
+                    work_locks.release(watch_key(root_id))
+            for root_id, path in roots.items():
+                if root_id not in self._watchers:
+                    # outro processo já acompanha esta raiz
+                    if not work_locks.try_acquire(watch_key(root_id)):
+                        continue
+                    w = RootWatcher(root_id, path)
+                    self._watchers[root_id] = w
+                    w.thread.start()
+                    log.info("watcher raiz %s: %s", root_id, path)
+
+
+watch_manager = WatchManager()
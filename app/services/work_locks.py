@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+app/services/work_locks.py
+- Travas entre processos (uvicorn --workers N) na tabela job_locks: chave,
+  dono (host:pid:uuid) e validade. Uma thread renova as travas do processo a
+  cada LOCK_TTL_SEC/3; se o processo morre, a trava vence e outro assume.
+- scan:<root_id>: um scan por raiz (jobs, background=false e o watcher).
+- index:<n>: INDEX_MAX_CONCURRENT indexações ao mesmo tempo, somando todos os
+  processos. Esvaziar um shard (drop/rebuild) segura todas (hold_all).
+- watch:<root_id>: um só processo acompanha cada raiz.
+- serialized_writer() continua valendo dentro do processo; estas travas
+  valem entre processos.
+- Trava perdida (venceu e outro processo assumiu): o heartbeat chama o
+  on_lost de quem a tomou (jobs: cancela o job) e check() passa a levantar
+  LockLost; o trabalho para no próximo ponto de progresso em vez de seguir
+  gravando junto com o novo dono.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import OperationalError
+
+from app.core.config import settings
+from app.db.database import engine
+
+log = logging.getLogger(__name__)
+
+# só toma a trava se ela estiver livre ou vencida
+_ACQUIRE = text("""
+    INSERT INTO job_locks (key, owner, job_id, acquired_at, expires_at)
+    VALUES (:key, :owner, :job_id, :now, :until)
+    ON CONFLICT(key) DO UPDATE SET
+        owner = excluded.owner, job_id = excluded.job_id,
+        acquired_at = excluded.acquired_at, expires_at = excluded.expires_at
+    WHERE job_locks.expires_at < :now
+""")
+_RENEW = text("""
+    UPDATE job_locks SET expires_at = :until
+    WHERE owner = :owner AND key IN :keys
+    RETURNING key
+""").bindparams(bindparam("keys", expanding=True))
+_RELEASE = text("DELETE FROM job_locks WHERE key = :key AND owner = :owner")
+_ACTIVE = text("""
+    SELECT key, owner, job_id, acquired_at, expires_at FROM job_locks
+    WHERE expires_at >= :now ORDER BY key
+""")
+
+
+class LockLost(RuntimeError):
+    """A trava venceu e foi assumida por outro processo."""
+
+    def __init__(self, key: str):
+        super().__init__(f"trava {key} perdida: venceu e foi assumida por outro processo")
+        self.key = key
+
+
+def scan_key(root_id: int) -> List[str]:
+    return [f"scan:{root_id}"]
+
+
+def index_keys() -> List[str]:
+    return [f"index:{n}" for n in range(max(1, settings.INDEX_MAX_CONCURRENT))]
+
+
+def watch_key(root_id: int) -> str:
+    return f"watch:{root_id}"
+
+
+class WorkLocks:
+    def __init__(self) -> None:
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._held: Dict[str, Optional[int]] = {}  # chave -> job_id
+        self._on_lost: Dict[str, Callable[[str], None]] = {}
+        self._lock = threading.Lock()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    # ----- travas -----
+    def try_acquire(self, key: str, job_id: Optional[int] = None,
+                    on_lost: Optional[Callable[[str], None]] = None) -> bool:
+        """on_lost(key) é chamado (na thread do heartbeat) se a trava for perdida."""
+        now = time.time()
+        try:
+            with engine.begin() as conn:
+                got = conn.execute(_ACQUIRE, {
+                    "key": key, "owner": self.owner, "job_id": job_id,
+                    "now": now, "until": now + settings.LOCK_TTL_SEC,
+                }).rowcount == 1
+        except OperationalError:
+            # banco ocupado: conta como trava ocupada, quem espera tenta de novo
+            return False
+        if got:
+            with self._lock:
+                self._held[key] = job_id
+                if on_lost is not None:
+                    self._on_lost[key] = on_lost
+            self._ensure_heartbeat()
+        return got
+
+    def holds(self, key: str) -> bool:
+        with self._lock:
+            return key in self._held
+
+    def check(self, key: str) -> None:
+        """Para os pontos de progresso de quem segura `key`: LockLost se ela foi perdida."""
+        if not self.holds(key):
+            raise LockLost(key)
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._on_lost.pop(key, None)
+            if key not in self._held:
+                return
+            del self._held[key]
+        try:
+            with engine.begin() as conn:
+                conn.execute(_RELEASE, {"key": key, "owner": self.owner})
+        except OperationalError:
+            # não conseguiu apagar: a trava vence sozinha em LOCK_TTL_SEC
+            log.warning("trava %s: falha ao liberar", key)
+
+    def release_all(self) -> None:
+        with self._lock:
+            keys = list(self._held)
+        for key in keys:
+            self.release(key)
+
+    @contextmanager
+    def hold(
+        self,
+        keys: Sequence[str],
+        job_id: Optional[int] = None,
+        poll: Optional[Callable[[], None]] = None,
+        interval: float = 1.0,
+        on_lost: Optional[Callable[[str], None]] = None,
+    ) -> Iterator[str]:
+        """Espera até conseguir uma das `keys` (vagas equivalentes). Enquanto
+        espera, chama `poll` a cada `interval` segundos (pode levantar exceção
+        para desistir, ex.: job cancelado). Devolve a chave obtida; ver
+        try_acquire para on_lost."""
+        while True:
+            key = next((k for k in keys if self.try_acquire(k, job_id, on_lost)), None)
+            if key is not None:
+                break
+            if poll is not None:
+                poll()
+            time.sleep(interval)
+        try:
+            yield key
+        finally:
+            self.release(key)
+
+    @contextmanager
+    def hold_all(
+        self,
+        keys: Sequence[str],
+        job_id: Optional[int] = None,
+        poll: Optional[Callable[[], None]] = None,
+        interval: float = 1.0,
+        on_lost: Optional[Callable[[str], None]] = None,
+    ) -> Iterator[List[str]]:
+        """Espera por todas as `keys`, uma a uma e sempre na mesma ordem (sem
+        deadlock entre dois hold_all): exclusivo sobre vagas que hold() divide,
+        ex. todas as index:<n> para mexer num shard sem indexação rodando."""
+        with ExitStack() as stack:
+            for key in keys:
+                stack.enter_context(self.hold([key], job_id, poll, interval, on_lost))
+            yield list(keys)
+
+    def active(self) -> List[dict]:
+        now = time.time()
+        with engine.connect() as conn:
+            rows = conn.execute(_ACTIVE, {"now": now}).fetchall()
+        return [{
+            "key": r.key,
+            "owner": r.owner,
+            "job_id": r.job_id,
+            "mine": r.owner == self.owner,
+            "held_sec": round(now - r.acquired_at, 1),
+            "expires_in_sec": round(r.expires_at - now, 1),
+        } for r in rows]
+
+    # ----- heartbeat -----
+    def _ensure_heartbeat(self) -> None:
+        with self._lock:
+            if self._heartbeat is not None:
+                return
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="work-locks", daemon=True)
+            self._heartbeat.start()
+
+    def _heartbeat_loop(self) -> None:
+        while True:
+            time.sleep(max(0.5, settings.LOCK_TTL_SEC / 3))
+            self.renew()
+
+    def renew(self) -> None:
+        """Uma rodada do heartbeat: renova as travas do processo e avisa as perdidas."""
+        with self._lock:
+            keys = list(self._held)
+        if not keys:
+            return
+        now = time.time()
+        try:
+            with engine.begin() as conn:
+                kept = {k for (k,) in conn.execute(_RENEW, {
+                    "keys": keys, "owner": self.owner, "until": now + settings.LOCK_TTL_SEC,
+                })}
+        except OperationalError:
+            # banco ocupado: a validade (LOCK_TTL_SEC) cobre as próximas tentativas
+            log.warning("travas: heartbeat adiado (banco ocupado)")
+            return
+        with self._lock:
+            # venceu e outro processo assumiu (ex.: processo parado por mais de LOCK_TTL_SEC)
+            lost = [k for k in keys if k not in kept and k in self._held]
+            callbacks = []
+            for k in lost:
+                del self._held[k]
+                callbacks.append((k, self._on_lost.pop(k, None)))
+        for k, on_lost in callbacks:
+            log.error("trava %s perdida: venceu e foi assumida por outro processo", k)
+            if on_lost is not None:
+                try:
+                    on_lost(k)
+                except Exception:
+                    log.exception("trava %s: falha ao avisar a perda", k)
+
+
+work_locks = WorkLocks()
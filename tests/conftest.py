@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Testes rodam contra um banco SQLite temporário: as variáveis de ambiente são
+definidas antes de qualquer import de app (settings e engine são criados no import).
+"""
+
+import os
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="mylib-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(_TMP, 'mylib.db')}",
+    TEXT_CACHE_PATH=os.path.join(_TMP, "text_cache.db"),
+    INDEX_SHARD_DIR=os.path.join(_TMP, "shards"),
+    INDEX_WORKERS="1",
+    WATCH_ENABLED="false",
+)
+
+import pytest  # noqa: E402
+
+from app.db.database import SessionLocal  # noqa: E402
+from app.db.init_db import init_db  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _schema():
+    init_db()
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client_as():
+    """client_as(user): TestClient da API autenticado como `user` (sem JWT)."""
+    from fastapi.testclient import TestClient
+
+    from app.core.deps import get_current_user
+    from app.main import app
+
+    def make(user):
+        app.dependency_overrides[get_current_user] = lambda: user
+        return TestClient(app)
+
+    try:
+        yield make
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core import auth_cache
+from app.core.security import create_access_token
+from app.main import app
+from app.models.models import RootFolder, RootFolderPermission, User
+
+
+@pytest.fixture
+def reader(db, tmp_path):
+    """Usuário comum + uma raiz; devolve (user, root, headers com JWT de verdade)."""
+    rf = RootFolder(path=str(tmp_path))
+    user = User(username=f"leitor_{tmp_path.name}", email=f"{tmp_path.name}@example.com", password_hash="x")
+    db.add_all([rf, user])
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(user.username)}"}
+    return user, rf, headers
+
+
+def test_revoked_permission_is_denied_right_after_commit(db, reader):
+    user, rf, headers = reader
+    client = TestClient(app)
+    url = f"/index/status?root_id={rf.id}"
+
+    perm = RootFolderPermission(root_id=rf.id, user_id=user.id, access_level="reader")
+    db.add(perm)
+    db.commit()
+    assert client.get(url, headers=headers).status_code == 200
+    # a leitura ficou no cache (senão o teste não prova a invalidação)
+    assert auth_cache.root_access_cache.get(user.id) == {rf.id: "reader"}
+
+    db.delete(perm)
+    db.flush()
+    # só o flush não invalida: outra requisição ainda pode ver a transação antiga
+    assert auth_cache.root_access_cache.get(user.id) == {rf.id: "reader"}
+    db.commit()
+    assert auth_cache.root_access_cache.get(user.id) is None
+    assert client.get(url, headers=headers).status_code == 403
+
+
+def test_deactivated_user_is_rejected_right_after_commit(db, reader):
+    user, rf, headers = reader
+    client = TestClient(app)
+    db.add(RootFolderPermission(root_id=rf.id, user_id=user.id, access_level="reader"))
+    db.commit()
+    assert client.get(f"/index/status?root_id={rf.id}", headers=headers).status_code == 200
+    assert auth_cache.user_cache.get(user.username) is not None
+
+    user.is_active = 0
+    db.commit()
+    assert client.get(f"/index/status?root_id={rf.id}", headers=headers).status_code == 401
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import io
+import zipfile
+
+from app.services import bulk_zip
+from app.services.bulk_zip import SKIPPED_NAME, ZipEntry, iter_zip
+
+
+class _FailingRead(io.FileIO):
+    """Lê o primeiro bloco e falha no seguinte (ex.: compartilhamento caiu)."""
+
+    def read(self, size=-1):
+        if self.tell() > 0:
+            raise OSError(5, "Input/output error")
+        return super().read(size)
+
+
+def _entries(tmp_path, names):
+    out = []
+    for i, name in enumerate(names):
+        path = tmp_path / name
+        path.write_bytes(name.encode() * 100)
+        out.append(ZipEntry(file_id=i, root_id=1, path=str(path), arcname=name))
+    return out
+
+
+def test_read_error_mid_entry_keeps_archive_valid_and_lists_file(tmp_path, monkeypatch):
+    entries = _entries(tmp_path, ["antes.txt", "falha.txt", "depois.txt"])
+    real_open = open
+
+    def fake_open(path, mode="r", *args, **kwargs):
+        if path.endswith("falha.txt"):
+            return _FailingRead(path, "rb")
+        return real_open(path, mode, *args, **kwargs)
+
+    monkeypatch.setattr(bulk_zip, "CHUNK_SIZE", 64)
+    monkeypatch.setattr(bulk_zip, "open", fake_open, raising=False)
+    data = b"".join(iter_zip(entries))
+
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        assert zf.read("antes.txt") == b"antes.txt" * 100
+        assert zf.read("depois.txt") == b"depois.txt" * 100
+        assert len(zf.read("falha.txt")) == 64
+        skipped = zf.read(SKIPPED_NAME).decode()
+    assert entries[1].path in skipped and "incompleto" in skipped
+
+
+def test_large_entries_are_written_as_zip64(tmp_path, monkeypatch):
+    entries = _entries(tmp_path, ["grande.bin", "pequeno.bin"])
+    monkeypatch.setattr(bulk_zip, "ZIP64_FROM", 500)
+    data = b"".join(iter_zip(entries))
+
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        assert zf.read("grande.bin") == b"grande.bin" * 100
+        assert SKIPPED_NAME not in zf.namelist()
+    # cabeçalho local da entrada grande leva o campo extra do ZIP64 (id 0x0001)
+    assert data[26:28] != b"\0\0" and data[30 + len("grande.bin"):][:2] == b"\x01\x00"
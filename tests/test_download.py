@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from app.models.models import File, RootFolder, User
+
+_BODY = bytes(range(256)) * 40  # 10240 bytes
+
+
+def _setup(db, tmp_path):
+    root = tmp_path / "baixar"
+    root.mkdir()
+    path = root / "dados.bin"
+    path.write_bytes(_BODY)
+    rf = RootFolder(path=str(root))
+    db.add(rf)
+    db.commit()
+    st = path.stat()
+    f = File(root_id=rf.id, path=str(path), name="dados.bin", ext=".bin", size=st.st_size, mtime=int(st.st_mtime))
+    user = User(username=f"baixa{rf.id}", email=f"baixa{rf.id}@example.com", password_hash="x", is_superuser=1)
+    db.add_all([f, user])
+    db.commit()
+    return f.id, user
+
+
+def test_range_request_returns_partial_content(db, tmp_path, client_as):
+    file_id, user = _setup(db, tmp_path)
+    client = client_as(user)
+
+    r = client.get(f"/download/{file_id}", headers={"Range": "bytes=100-199"})
+    assert r.status_code == 206
+    assert r.content == _BODY[100:200]
+    assert r.headers["content-range"] == f"bytes 100-199/{len(_BODY)}"
+
+    # sufixo: últimos 50 bytes
+    r = client.get(f"/download/{file_id}", headers={"Range": "bytes=-50"})
+    assert r.status_code == 206
+    assert r.content == _BODY[-50:]
+
+    r = client.get(f"/download/{file_id}")
+    assert r.status_code == 200 and r.content == _BODY
+    assert r.headers["accept-ranges"] == "bytes"
+
+
+def test_if_none_match_returns_304(db, tmp_path, client_as):
+    file_id, user = _setup(db, tmp_path)
+    client = client_as(user)
+
+    etag = client.get(f"/download/{file_id}").headers["etag"]
+    r = client.get(f"/download/{file_id}", headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.content == b""
+    assert r.headers["etag"] == etag
+    assert client.get(f"/download/{file_id}", headers={"If-None-Match": '"0-0"'}).status_code == 200
+
+
+def test_range_beyond_end_returns_416(db, tmp_path, client_as):
+    file_id, user = _setup(db, tmp_path)
+    r = client_as(user).get(f"/download/{file_id}", headers={"Range": f"bytes={len(_BODY) + 10}-"})
+    assert r.status_code == 416
+    assert r.headers["content-range"] == f"bytes */{len(_BODY)}"
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from email.message import EmailMessage
+
+from app.services import extractors
+from app.services.extractors import ExtractLimits, extract_file
+
+_RTF = (
+    r"{\rtf1\ansi\ansicpg1252\uc1{\fonttbl{\f0 Arial;}}{\*\generator X;}"
+    + r"Ol\'e1 mundo\par \u8364? euro \\ barra \{chave\}\tab fim\par " * 20
+    + r"\\\\\\\par ap\'f3s}"
+)
+
+
+def test_rtf_read_in_blocks_keeps_tokens_split_at_block_edges(tmp_path, monkeypatch):
+    path = tmp_path / "doc.rtf"
+    path.write_text(_RTF, encoding="latin-1")
+    whole = extract_file(str(path), ".rtf")
+    assert whole.status == "ok"
+    assert whole.content.startswith("Olá mundo\n€ euro \\ barra {chave}\tfim\n")
+    assert whole.content.endswith("\\\\\\\napós")
+    assert "Arial" not in whole.content and "X;" not in whole.content
+
+    # blocos pequenos cortam palavras de controle, \'hh, \uN e "\\" em todo ponto
+    for size in range(1, 50):
+        monkeypatch.setattr(extractors, "READ_BLOCK_CHARS", size)
+        assert extract_file(str(path), ".rtf").content == whole.content, size
+
+
+def test_eml_parses_at_most_max_message_bytes(tmp_path):
+    msg = EmailMessage()
+    msg["Subject"] = "Relatório mensal"
+    msg["From"] = "a@example.com"
+    msg.set_content("corpo do e-mail")
+    msg.add_attachment(b"\0" * 200_000, maintype="application", subtype="octet-stream",
+                       filename="anexo.bin")
+    path = tmp_path / "msg.eml"
+    path.write_bytes(msg.as_bytes())
+
+    full = extract_file(str(path), ".eml")
+    assert full.status == "ok"
+    assert "anexo.bin" in full.content
+
+    capped = extract_file(str(path), ".eml", ExtractLimits(max_message_bytes=4096))
+    assert capped.status == "truncated"
+    assert "Subject: Relatório mensal" in capped.content
+    assert "corpo do e-mail" in capped.content
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+import pytest
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.models.models import RootFolder
+from app.services import index_queue
+from app.services.index_queue import PRIORITY_MODIFIED, PRIORITY_NEW, PRIORITY_RETRY, QueueLease
+from app.services.indexer import run_index
+from app.services.scanner import run_root_scan
+
+EXTS = [".txt"]
+
+
+@pytest.fixture
+def queued_root(db, tmp_path):
+    """Raiz com 5 .txt já varridos (os triggers os põem na fila)."""
+    root = tmp_path / "fila"
+    root.mkdir()
+    for i in range(5):
+        (root / f"doc{i}.txt").write_text(f"conteudo {i}")
+    rf = RootFolder(path=str(root))
+    db.add(rf)
+    db.commit()
+    run_root_scan(db, rf.id, mode="full")
+    return rf
+
+
+def _queue(db, root_id):
+    return {r.name: r for r in db.execute(text("""
+        SELECT f.name, q.file_id, q.priority, q.attempts, q.not_before, q.lease_owner, q.lease_until
+        FROM index_queue q JOIN files f ON f.id = q.file_id WHERE q.root_id = :r
+    """), {"r": root_id})}
+
+
+def test_triggers_feed_the_queue_from_the_scan(db, queued_root, tmp_path):
+    root = tmp_path / "fila"
+    (root / "sem_extrator.xyz").write_text("fora")
+    run_root_scan(db, queued_root.id, mode="full")
+    q = _queue(db, queued_root.id)
+    assert set(q) == {f"doc{i}.txt" for i in range(5)}
+    assert {r.priority for r in q.values()} == {PRIORITY_NEW}
+
+    run_index(db, root_id=queued_root.id, refresh_suggest=False)
+    assert _queue(db, queued_root.id) == {}
+
+    # tamanho mudou: volta como modificado; arquivo apagado sai da fila
+    (root / "doc1.txt").write_text("conteudo bem maior agora")
+    (root / "doc2.txt").write_text("tambem mudou de tamanho")
+    run_root_scan(db, queued_root.id, mode="full")
+    q = _queue(db, queued_root.id)
+    assert set(q) == {"doc1.txt", "doc2.txt"}
+    assert {r.priority for r in q.values()} == {PRIORITY_MODIFIED}
+    os.remove(root / "doc2.txt")
+    run_root_scan(db, queued_root.id, mode="full")
+    assert set(_queue(db, queued_root.id)) == {"doc1.txt"}
+
+
+def test_concurrent_leases_claim_disjoint_batches(db, queued_root, monkeypatch):
+    monkeypatch.setattr(index_queue, "CLAIM_BATCH", 2)
+    a = QueueLease(db, EXTS, root_ids=[queued_root.id])
+    b = QueueLease(db, EXTS, root_ids=[queued_root.id])
+    mine = [r.id for r in a.claimed(limit=3)]
+    theirs = [r.id for r in b.claimed()]
+    assert len(mine) == 3 and len(theirs) == 2
+    assert not set(mine) & set(theirs)
+    assert list(QueueLease(db, EXTS, root_ids=[queued_root.id]).claimed()) == []
+
+    # devolvido (cancelamento): outra execução pega de novo
+    a.release()
+    assert sorted(r.id for r in QueueLease(db, EXTS, root_ids=[queued_root.id]).claimed()) == sorted(mine)
+
+
+def test_expired_lease_is_claimed_by_another_run(db, queued_root):
+    dead = QueueLease(db, EXTS, root_ids=[queued_root.id])
+    ids = [r.id for r in dead.claimed()]
+    other = QueueLease(db, EXTS, root_ids=[queued_root.id])
+    assert list(other.claimed()) == []
+
+    # o processo dono morreu: o lease vence
+    db.execute(text("UPDATE index_queue SET lease_until = :t"), {"t": time.time() - 1})
+    db.commit()
+    assert sorted(r.id for r in other.claimed()) == sorted(ids)
+    # o dono antigo não tira da fila o que agora é de outro
+    dead.checkpoint(ids, [])
+    db.commit()
+    assert len(_queue(db, queued_root.id)) == 5
+    other.checkpoint(ids, [])
+    db.commit()
+    assert _queue(db, queued_root.id) == {}
+
+
+def test_failed_extraction_is_retried_with_exponential_backoff(db, queued_root, monkeypatch):
+    monkeypatch.setattr(settings, "INDEX_RETRY_BACKOFF_SEC", 100.0)
+    monkeypatch.setattr(settings, "INDEX_RETRY_MAX_ATTEMPTS", 3)
+    assert [index_queue.retry_delay(n) for n in (1, 2, 3)] == [100.0, 200.0, 400.0]
+
+    # só doc0 fica na fila
+    db.execute(text("DELETE FROM index_queue WHERE file_id IN (SELECT id FROM files WHERE name != 'doc0.txt')"))
+    db.commit()
+
+    def fail_once(attempts):
+        lease = QueueLease(db, EXTS, root_ids=[queued_root.id])
+        (row,) = lease.claimed()
+        t0 = time.time()
+        lease.checkpoint([], [(row.id, attempts, "timeout", "lento")])
+        db.commit()
+        return t0
+
+    for attempts, delay in ((0, 100.0), (1, 200.0)):
+        t0 = fail_once(attempts)
+        row = _queue(db, queued_root.id)["doc0.txt"]
+        assert row.priority == PRIORITY_RETRY and row.attempts == attempts + 1
+        assert row.lease_owner is None
+        assert t0 + delay <= row.not_before <= time.time() + delay
+        # esperando a nova tentativa: ninguém pega
+        assert list(QueueLease(db, EXTS, root_ids=[queued_root.id]).claimed()) == []
+        db.execute(text("UPDATE index_queue SET not_before = 0"))
+        db.commit()
+
+    # terceira falha: desiste (fica em extract_status; volta se o arquivo mudar)
+    fail_once(2)
+    assert _queue(db, queued_root.id) == {}
+
+
+def test_checkpoint_renews_the_lease_of_what_is_still_outstanding(db, queued_root):
+    lease = QueueLease(db, EXTS, root_ids=[queued_root.id])
+    ids = [r.id for r in lease.claimed()]
+    db.execute(text("UPDATE index_queue SET lease_until = 1"))
+    db.commit()
+    lease._renewed = 0.0
+
+    lease.checkpoint(ids[:1], [])
+    db.commit()
+    q = _queue(db, queued_root.id)
+    assert len(q) == 4
+    assert all(r.lease_owner == lease.owner and r.lease_until > time.time() for r in q.values())
+
+
+def test_progress_renews_the_lease_between_checkpoints(db, queued_root, monkeypatch):
+    # lease curto; um lote de 5 arquivos não fecha (BATCH_SIZE) antes de vencer
+    monkeypatch.setattr(settings, "INDEX_LEASE_SEC", 0.3)
+    seen = []
+
+    def slow_progress(stats):
+        until = db.execute(text(
+            "SELECT MIN(lease_until) FROM index_queue WHERE root_id = :r AND lease_owner IS NOT NULL"
+        ), {"r": queued_root.id}).scalar()
+        if until is not None:
+            seen.append((time.time(), until))
+        time.sleep(0.15)
+
+    stats = run_index(db, root_id=queued_root.id, progress=slow_progress, refresh_suggest=False)
+    assert stats.indexed == 5
+    assert len(seen) >= 4
+    # a cada arquivo o lease continua válido e foi estendido
+    assert all(until > now for now, until in seen)
+    assert seen[-1][1] - seen[0][1] > 0.3
+    assert _queue(db, queued_root.id) == {}
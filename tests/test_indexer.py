@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import sys
+import time
+from collections import Counter
+
+import pytest
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.db import init_db
+from app.models.models import RootFolder
+from app.services import index_queue, indexer
+from app.services.index_queue import QueueLease
+from app.services.indexer import run_index
+from app.services.scanner import run_root_scan
+
+# extrator de .txt que trava dentro de uma única chamada quando o arquivo pede
+_HANGING_PLUGIN = '''
+import time
+from app.services import extractors
+
+@extractors.register_extractor(".txt")
+def iter_txt_or_hang(path, limits):
+    with open(path, encoding="utf-8") as f:
+        data = f.read()
+    if "TRAVA" in data:
+        time.sleep(3600)
+    yield data
+'''
+
+
+def test_hung_parser_is_killed_and_recorded_as_timeout(db, tmp_path, monkeypatch):
+    plugin_dir = tmp_path / "plugins"
+    plugin_dir.mkdir()
+    (plugin_dir / "trava_plugin.py").write_text(_HANGING_PLUGIN)
+    monkeypatch.syspath_prepend(str(plugin_dir))
+    # processos de extração (spawn) leem o plugin do ambiente
+    monkeypatch.setenv("INDEX_EXTRACTOR_PLUGINS", "trava_plugin")
+    monkeypatch.setattr(settings, "INDEX_FILE_TIMEOUT_SEC", 1.0)
+    monkeypatch.setattr(settings, "INDEX_WORKERS", 1)
+    monkeypatch.setattr(indexer, "HARD_TIMEOUT_GRACE_SEC", 0.5)
+
+    root = tmp_path / "trava"
+    root.mkdir()
+    (root / "a.txt").write_text("alfa normal")
+    (root / "b.txt").write_text("TRAVA")
+    (root / "c.txt").write_text("gama normal")
+    rf = RootFolder(path=str(root))
+    db.add(rf)
+    db.commit()
+    run_root_scan(db, rf.id, mode="full")
+
+    t0 = time.monotonic()
+    stats = run_index(db, root_id=rf.id, refresh_suggest=False)
+    assert time.monotonic() - t0 < 30
+    assert stats.indexed + stats.errors == 3
+
+    rows = dict(db.execute(text("""
+        SELECT f.name, s.status FROM files f LEFT JOIN extract_status s ON s.file_id = f.id
+        WHERE f.root_id = :r
+    """), {"r": rf.id}).fetchall())
+    assert rows == {"a.txt": None, "b.txt": "timeout", "c.txt": None}
+    assert "trava_plugin" not in sys.modules  # o pai nunca rodou o extrator
+
+
+def _names(db, q, root_id):
+    from app.services.search import SearchFilters, search_docs
+
+    hits, _, _ = search_docs(db, q, SearchFilters(root_id=root_id), limit=50)
+    return sorted(h.path.rsplit("/", 1)[-1] for h in hits)
+
+
+def test_dedup_shares_docs_only_between_files_with_the_same_name(db, tmp_path):
+    root = tmp_path / "copias"
+    for sub in ("a", "b", "c"):
+        (root / sub).mkdir(parents=True)
+    body = "conteudo repetido " * 300
+    for rel in ("a/relatorio.txt", "b/relatorio.txt", "c/copia.txt"):
+        (root / rel).write_text(body)
+    rf = RootFolder(path=str(root))
+    db.add(rf)
+    db.commit()
+    run_root_scan(db, rf.id, mode="full")
+    stats = run_index(db, root_id=rf.id, refresh_suggest=False)
+    assert stats.deduped == 1
+
+    assert _names(db, "relatorio", rf.id) == ["relatorio.txt", "relatorio.txt"]
+    assert _names(db, "copia", rf.id) == ["copia.txt"]
+    assert len(_names(db, "repetido", rf.id)) == 3
+
+    # índice de antes da regra: a cópia apontava para o docs de outro nome
+    db.execute(text("""
+        UPDATE map SET doc_rowid = (
+            SELECT m.doc_rowid FROM map m JOIN files f ON f.id = m.file_id
+            WHERE f.root_id = :r AND f.name = 'relatorio.txt' LIMIT 1
+        )
+        WHERE file_id = (SELECT id FROM files WHERE root_id = :r AND name = 'copia.txt')
+    """), {"r": rf.id})
+    db.execute(text("DELETE FROM app_meta WHERE key = 'dedup_by_name'"))
+    db.commit()
+    assert _names(db, "copia", rf.id) == []
+
+    init_db._ensure_dedup_by_name()
+    db.expire_all()
+    run_index(db, root_id=rf.id, refresh_suggest=False)
+    assert _names(db, "copia", rf.id) == ["copia.txt"]
+    assert _names(db, "relatorio", rf.id) == ["relatorio.txt", "relatorio.txt"]
+
+
+@pytest.mark.parametrize("by_file", [False, True])
+def test_small_claim_batches_visit_every_pending_file_once(db, tmp_path, monkeypatch, by_file):
+    root = tmp_path / f"paginas_{by_file}"
+    root.mkdir()
+    for i in range(7):
+        (root / f"doc{i}.txt").write_text(f"pagina {i}")
+    rf = RootFolder(path=str(root))
+    db.add(rf)
+    db.commit()
+    run_root_scan(db, rf.id, mode="full")
+    run_index(db, root_id=rf.id, refresh_suggest=False)
+
+    # 3 modificados + 2 novos pendentes, 4 já indexados fora da fila; lotes de 2
+    for i in range(3):
+        (root / f"doc{i}.txt").write_text(f"pagina {i} alterada")
+    for i in range(7, 9):
+        (root / f"doc{i}.txt").write_text(f"pagina {i}")
+    run_root_scan(db, rf.id, mode="full")
+    ids = dict(db.execute(text("SELECT name, id FROM files WHERE root_id = :r"), {"r": rf.id}).fetchall())
+    pending = {ids[f"doc{i}.txt"] for i in (0, 1, 2, 7, 8)}
+
+    monkeypatch.setattr(index_queue, "CLAIM_BATCH", 2)
+    visited = Counter()
+    real_claimed = QueueLease.claimed
+
+    def spy(self, limit=None):
+        for row in real_claimed(self, limit):
+            visited[row.id] += 1
+            yield row
+
+    monkeypatch.setattr(QueueLease, "claimed", spy)
+    if by_file:
+        # lista do watcher: também vai em blocos de CLAIM_BATCH
+        stats = run_index(db, file_ids=sorted(ids.values()), refresh_suggest=False)
+    else:
+        stats = run_index(db, root_id=rf.id, refresh_suggest=False)
+
+    assert set(visited) == pending
+    assert set(visited.values()) == {1}
+    assert stats.indexed == 5 and stats.skipped == 4
+    assert db.execute(text("SELECT COUNT(*) FROM index_queue WHERE root_id = :r"), {"r": rf.id}).scalar() == 0
+    assert sorted(_names(db, "alterada", rf.id)) == ["doc0.txt", "doc1.txt", "doc2.txt"]
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.db.database import SessionLocal
+from app.models.models import Job, RootFolder
+from app.services import jobs
+from app.services.jobs import FINAL_STATUSES, JobManager, work_key
+
+
+@pytest.fixture
+def manager():
+    mgr = JobManager()
+    try:
+        yield mgr
+    finally:
+        mgr.shutdown()
+
+
+@pytest.fixture
+def blocking_kind(monkeypatch):
+    """Tipo de job de teste: roda até `release` ser setado, chamando ctx.update no caminho."""
+    started, release = threading.Event(), threading.Event()
+
+    def run(db, ctx, params):
+        ctx.update(processed=1)
+        started.set()
+        while not release.is_set():
+            ctx.update(processed=1)
+            time.sleep(0.02)
+        return {"ok": params.get("n")}
+
+    monkeypatch.setitem(jobs._RUNNERS, "teste", run)
+    yield started, release
+    release.set()  # não deixa o shutdown do manager esperando um job preso
+
+
+def _wait_final(job_id, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db = SessionLocal()
+        try:
+            job = db.query(Job).filter(Job.id == job_id).first()
+            if job.status in FINAL_STATUSES:
+                return job
+        finally:
+            db.close()
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} não terminou")
+
+
+def test_scan_job_runs_to_done(db, tmp_path, manager):
+    root = tmp_path / "job_scan"
+    root.mkdir()
+    for i in range(3):
+        (root / f"f{i}.txt").write_text("x")
+    rf = RootFolder(path=str(root))
+    db.add(rf)
+    db.commit()
+
+    job = manager.submit(db, "scan", {"root_id": rf.id, "mode": "full"}, root_id=rf.id)
+    done = _wait_final(job.id)
+    assert done.status == "done"
+    result = json.loads(done.result)
+    assert result["inserted"] == 3 and result["root_id"] == rf.id
+    assert done.processed == 3
+
+
+def test_identical_request_joins_the_active_job(db, manager, monkeypatch):
+    # sem executar: os jobs ficam 'queued'
+    monkeypatch.setattr(manager, "_schedule", lambda job_id: None)
+    first = manager.submit(db, "index", {"root_id": None, "n": 1})
+    again = manager.submit(db, "index", {"n": 1, "root_id": None})
+    other = manager.submit(db, "index", {"root_id": None, "n": 2})
+    assert again.id == first.id
+    assert other.id != first.id
+
+    # cancelar um job ainda na fila encerra direto; o próximo pedido cria outro
+    manager.cancel(db, first)
+    assert first.status == "cancelled"
+    assert manager.submit(db, "index", {"root_id": None, "n": 1}).id != first.id
+    for job in db.query(Job).filter(Job.status == "queued").all():
+        manager.cancel(db, job)
+
+
+def test_cancel_stops_a_running_job(db, manager, blocking_kind):
+    started, _ = blocking_kind
+    job = manager.submit(db, "teste", {"n": 1})
+    assert started.wait(10)
+    assert manager.live(job.id)["processed"] == 1
+
+    manager.cancel(db, job)
+    done = _wait_final(job.id)
+    assert done.status == "cancelled"
+    assert manager.live(job.id) is None
+
+
+def test_restart_marks_stale_running_jobs_interrupted_and_resumes_queued(db, manager, blocking_kind):
+    _, release = blocking_kind
+    release.set()
+    old = datetime.utcnow() - timedelta(hours=1)
+    stale = Job(kind="teste", params=json.dumps({"n": 10}), work_key=work_key("teste", {"n": 10}),
+                status="running", started_at=old, heartbeat_at=old)
+    queued = Job(kind="teste", params=json.dumps({"n": 11}), work_key=work_key("teste", {"n": 11}),
+                 status="queued")
+    db.add_all([stale, queued])
+    db.commit()
+
+    manager.start()
+
+    db.expire_all()
+    assert db.get(Job, stale.id).status == "interrupted"
+    assert "heartbeat" in db.get(Job, stale.id).error
+    done = _wait_final(queued.id)
+    assert done.status == "done"
+    assert json.loads(done.result) == {"ok": 11}
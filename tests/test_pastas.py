@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.core.deps import get_current_user
+from app.main import app
+from app.models.models import RootFolder, User
+from app.services import shards
+from app.services.indexer import run_index
+from app.services.scanner import run_root_scan
+
+
+def test_delete_root_purges_its_index_rows(db, tmp_path):
+    root = tmp_path / "removida"
+    root.mkdir()
+    for i in range(3):
+        (root / f"doc{i}.txt").write_text(f"removivel {i}")
+    rf = RootFolder(path=str(root))
+    db.add(rf)
+    db.commit()
+    run_root_scan(db, rf.id, mode="full")
+    run_index(db, root_id=rf.id, refresh_suggest=False)
+    file_ids = [fid for (fid,) in db.execute(text("SELECT id FROM files WHERE root_id = :r"), {"r": rf.id})]
+    doc_rowids = [r for (r,) in db.execute(
+        text("SELECT doc_rowid FROM map WHERE file_id IN (SELECT id FROM files WHERE root_id = :r)"), {"r": rf.id})]
+    assert len(file_ids) == 3 and len(doc_rowids) == 3
+
+    admin = User(username="admin_pastas", email="admin_pastas@example.com", password_hash="x", is_superuser=1)
+    db.add(admin)
+    db.commit()
+    app.dependency_overrides[get_current_user] = lambda: admin
+    try:
+        r = TestClient(app).delete(f"/roots/{rf.id}")
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+    assert r.status_code == 204
+
+    ids = ",".join(map(str, file_ids))
+    for table in ("files", "map", "extract_status", "index_queue"):
+        col = "id" if table == "files" else "file_id"
+        assert db.execute(text(f"SELECT COUNT(*) FROM {table} WHERE {col} IN ({ids})")).scalar() == 0, table
+    if shards.enabled():
+        assert not shards.shard_exists(rf.id)
+    else:
+        rowids = ",".join(map(str, doc_rowids))
+        assert db.execute(text(f"SELECT COUNT(*) FROM docs WHERE rowid IN ({rowids})")).scalar() == 0
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+
+import pytest
+from sqlalchemy import text
+
+from app.models.models import RootFolder
+from app.services import scanner
+from app.services.scanner import DirListing, scan_tree
+
+
+@pytest.fixture
+def tree(tmp_path, db):
+    """root/a/x.txt, root/a/b/y.txt, root/a/b/z.txt + raiz cadastrada."""
+    root = tmp_path / "root"
+    b = root / "a" / "b"
+    b.mkdir(parents=True)
+    (root / "a" / "x.txt").write_text("x")
+    (b / "y.txt").write_text("y")
+    (b / "z.txt").write_text("z")
+    rf = RootFolder(path=str(root))
+    db.add(rf)
+    db.commit()
+    return rf.id, root, b
+
+
+def _fail_once_on(monkeypatch, target):
+    real = scanner._list_dir
+
+    def flaky(path, parent, mtime_ns, cache):
+        if path == str(target):
+            return DirListing(path=path, parent=parent, error="EIO simulado")
+        return real(path, parent, mtime_ns, cache)
+
+    monkeypatch.setattr(scanner, "_list_dir", flaky)
+    return lambda: monkeypatch.setattr(scanner, "_list_dir", real)
+
+
+def _paths(db, root_id):
+    return sorted(p for (p,) in db.execute(text("SELECT path FROM files WHERE root_id = :r"), {"r": root_id}))
+
+
+def test_subdir_error_once_then_parent_unchanged(db, tree, monkeypatch):
+    root_id, root, b = tree
+    scan_tree(db, root_id, str(root))
+
+    # b falha uma vez: nada abaixo dele é apagado
+    restore = _fail_once_on(monkeypatch, b)
+    stats = scan_tree(db, root_id, str(root), mode="full")
+    restore()
+    assert stats.errors == 1
+    assert stats.deleted == 0
+
+    # depois, "a" continua igual (podado): o scan ainda desce em b
+    stats = scan_tree(db, root_id, str(root))
+    assert stats.deleted == 0
+    assert stats.files_count == 3
+    assert len(_paths(db, root_id)) == 3
+
+
+def test_pruned_parent_descends_into_dirs_known_only_from_files(db, tree):
+    root_id, root, b = tree
+    scan_tree(db, root_id, str(root))
+    # banco sem a linha de b em scan_dirs (ex.: gravado por versão anterior)
+    db.execute(text("DELETE FROM scan_dirs WHERE root_id = :r AND path = :p"), {"r": root_id, "p": str(b)})
+    db.commit()
+
+    stats = scan_tree(db, root_id, str(root))
+    assert stats.deleted == 0
+    assert stats.files_count == 3
+
+
+def test_removed_subdir_is_still_purged(db, tree):
+    root_id, root, b = tree
+    scan_tree(db, root_id, str(root))
+    shutil.rmtree(b)
+
+    stats = scan_tree(db, root_id, str(root))
+    assert stats.deleted == 2
+    assert _paths(db, root_id) == [os.path.join(str(root), "a", "x.txt")]
+
+
+def test_incremental_rescan_counts_each_kind_of_change(db, tmp_path):
+    root = tmp_path / "mudancas"
+    (root / "parado").mkdir(parents=True)
+    for name in ("igual.txt", "muda.txt", "some.txt", os.path.join("parado", "p.txt")):
+        (root / name).write_text("v1")
+    rf = RootFolder(path=str(root))
+    db.add(rf)
+    db.commit()
+    stats = scan_tree(db, rf.id, str(root))
+    assert (stats.inserted, stats.updated, stats.skipped, stats.deleted) == (4, 0, 0, 0)
+
+    (root / "muda.txt").write_text("versao 2, maior")
+    (root / "novo.txt").write_text("v1")
+    (root / "some.txt").unlink()
+    # o mtime do diretório já muda com a criação/remoção; garante mesmo em FS de resolução grossa
+    st = os.stat(root)
+    os.utime(root, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    stats = scan_tree(db, rf.id, str(root))
+    assert (stats.inserted, stats.updated, stats.skipped, stats.deleted) == (1, 1, 1, 1)
+    # "parado" não mudou: podado, entra só nos totais
+    assert stats.pruned_dirs == 1
+    assert stats.files_count == 4
+    assert [os.path.relpath(p, root) for p in _paths(db, rf.id)] == [
+        "igual.txt", "muda.txt", "novo.txt", os.path.join("parado", "p.txt")]
+
+    # nada mudou: tudo podado
+    stats = scan_tree(db, rf.id, str(root))
+    assert (stats.inserted, stats.updated, stats.skipped, stats.deleted) == (0, 0, 0, 0)
+    assert stats.pruned_dirs == 2 and stats.files_count == 4
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from app.core.config import settings
+from app.models.models import RootFolder, User
+from app.services.indexer import run_index
+from app.services.scanner import run_root_scan
+from app.services.search import SearchFilters, search_docs
+
+
+def _add_root(db, path):
+    rf = RootFolder(path=str(path))
+    db.add(rf)
+    db.commit()
+    return rf.id
+
+
+def _index(db, root_id):
+    run_root_scan(db, root_id, mode="full")
+    run_index(db, root_id=root_id, refresh_suggest=False)
+
+
+def _all_pages(db, q, filters, order):
+    out, cursor, truncated = [], None, False
+    while True:
+        hits, cursor, page_truncated = search_docs(db, q, filters, order=order, limit=3, cursor=cursor)
+        out += [h.name for h in hits]
+        truncated |= page_truncated
+        if cursor is None:
+            return out, truncated
+
+
+@pytest.fixture
+def small_window(monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_MAX_SCORED", 4)
+
+
+def test_score_window_counts_only_filtered_hits(db, tmp_path, small_window, monkeypatch):
+    root = tmp_path / "janela"
+    root.mkdir()
+    for i in range(8):
+        (root / f"velho{i}.txt").write_text(f"orcamento antigo {i}")
+    root_id = _add_root(db, root)
+    _index(db, root_id)
+    # acertos mais novos (rowid maior) que não passam no filtro de extensão
+    for i in range(8):
+        (root / f"novo{i}.csv").write_text(f"orcamento novo {i}")
+    _index(db, root_id)
+
+    filters = SearchFilters(exts=[".txt"], root_id=root_id)
+    recent, truncated = _all_pages(db, "orcamento", filters, "recent")
+    assert len(recent) == 8 and not truncated
+
+    relevance, truncated = _all_pages(db, "orcamento", filters, "relevance")
+    assert len(relevance) == 4
+    assert all(name.endswith(".txt") for name in relevance)
+    assert truncated
+
+    relevance, truncated = _all_pages(db, "orcamento", SearchFilters(root_id=root_id), "relevance")
+    assert len(relevance) == 4 and truncated
+    # janela maior que o total: nada fica de fora
+    monkeypatch.setattr(settings, "SEARCH_MAX_SCORED", 100)
+    relevance, truncated = _all_pages(db, "orcamento", SearchFilters(root_id=root_id), "relevance")
+    assert len(relevance) == 16 and not truncated
+
+
+def test_restricted_user_relevance_window_uses_readable_roots(db, tmp_path, small_window):
+    from fastapi.testclient import TestClient
+
+    from app.core.deps import get_current_user
+    from app.main import app
+    from app.models.models import RootFolderPermission, User
+
+    own = tmp_path / "propria"
+    other = tmp_path / "outra"
+    own.mkdir()
+    other.mkdir()
+    for i in range(8):
+        (own / f"meu{i}.txt").write_text(f"viaduto {i}")
+    own_id = _add_root(db, own)
+    _index(db, own_id)
+    # acertos mais novos numa raiz que o usuário não lê
+    for i in range(8):
+        (other / f"alheio{i}.txt").write_text(f"viaduto {i}")
+    other_id = _add_root(db, other)
+    _index(db, other_id)
+
+    user = User(username="restrito", email="restrito@example.com", password_hash="x", is_superuser=0)
+    db.add(user)
+    db.commit()
+    db.add(RootFolderPermission(root_id=own_id, user_id=user.id, access_level="reader"))
+    db.commit()
+
+    app.dependency_overrides[get_current_user] = lambda: user
+    try:
+        client = TestClient(app)
+        r = client.get("/search", params={"q": "viaduto", "order": "relevance", "limit": 50})
+        assert r.status_code == 200
+        names = [hit["name"] for hit in r.json()]
+        assert len(names) == 4 and all(n.startswith("meu") for n in names)
+        assert r.headers.get("X-Search-Truncated") == "true"
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+
+
+def test_suggest_for_restricted_user_hides_other_roots_and_global_counts(db, tmp_path, monkeypatch):
+    from app.services.suggest import refresh_suggest_terms, suggest
+
+    monkeypatch.setattr(settings, "SUGGEST_MIN_DOCS", 1)
+    own = tmp_path / "sugestao_propria"
+    other = tmp_path / "sugestao_outra"
+    own.mkdir()
+    other.mkdir()
+    (own / "a.txt").write_text("zebrafina")
+    (other / "b.txt").write_text("zebralonga")
+    (other / "c.txt").write_text("zebrafina")
+    own_id = _add_root(db, own)
+    other_id = _add_root(db, other)
+    _index(db, own_id)
+    _index(db, other_id)
+    refresh_suggest_terms(db)
+
+    everyone = suggest(db, "zebra", limit=5)
+    assert [(t.term, t.docs) for t in everyone.terms] == [("zebrafina", 2), ("zebralonga", 1)]
+
+    restricted = suggest(db, "zebra", limit=5, root_ids=[own_id])
+    assert [(t.term, t.docs) for t in restricted.terms] == [("zebrafina", None)]
+    assert suggest(db, "zebra", limit=5, root_ids=[other_id]).terms[0].docs is None
+
+
+def test_cors_exposes_search_pagination_headers(db, client_as):
+    user = User(username="cors", email="cors@example.com", password_hash="x", is_superuser=1)
+    db.add(user)
+    db.commit()
+    r = client_as(user).get("/search", params={"q": "qualquer"}, headers={"Origin": "http://cliente.example"})
+    exposed = {h.strip().lower() for h in r.headers["access-control-expose-headers"].split(",")}
+    assert {"x-next-cursor", "x-search-truncated"} <= exposed
+
+
+def test_cursor_is_valid_for_queries_differing_only_in_spacing(db, tmp_path):
+    from app.services.search import search_cache, search_cached
+
+    root = tmp_path / "espacos"
+    root.mkdir()
+    for i in range(5):
+        (root / f"e{i}.txt").write_text(f"ponte estaiada {i}")
+    root_id = _add_root(db, root)
+    _index(db, root_id)
+    filters = SearchFilters(root_id=root_id)
+
+    first, cursor, _ = search_cached(db, "ponte  estaiada", filters, order="recent", limit=2)
+    assert cursor is not None
+    # o cache guardou a página 1 pela forma normalizada; a página 2 vem da outra grafia
+    search_cache.clear()
+    second, _, _ = search_cached(db, " ponte estaiada ", filters, order="recent", limit=2, cursor=cursor)
+    third, _, _ = search_docs(db, "ponte\testaiada", filters, order="recent", limit=2, cursor=cursor)
+    assert len(second) == 2 and second == third
+    assert not {h.file_id for h in first} & {h.file_id for h in second}
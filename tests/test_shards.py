@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.db import init_db
+from app.models.models import RootFolder
+from app.services.indexer import run_index
+from app.services.scanner import run_root_scan
+
+
+def test_layout_switch_requeues_files_with_extract_status(db, tmp_path, monkeypatch):
+    root = tmp_path / "camadas"
+    root.mkdir()
+    (root / "curto.txt").write_text("ata")
+    (root / "longo.txt").write_text("relatorio " * 50)
+    rf = RootFolder(path=str(root))
+    db.add(rf)
+    db.commit()
+    monkeypatch.setattr(settings, "INDEX_MAX_CHARS", 100)
+    run_root_scan(db, rf.id, mode="full")
+    run_index(db, root_id=rf.id, refresh_suggest=False)
+    statuses = dict(db.execute(text("""
+        SELECT f.name, s.status FROM extract_status s JOIN files f ON f.id = s.file_id
+        WHERE f.root_id = :r
+    """), {"r": rf.id}).fetchall())
+    assert statuses == {"longo.txt": "truncated"}
+
+    def queued():
+        return {name for (name,) in db.execute(text("""
+            SELECT f.name FROM index_queue q JOIN files f ON f.id = q.file_id WHERE f.root_id = :r
+        """), {"r": rf.id})}
+
+    assert queued() == set()
+    for sharded in (not settings.INDEX_SHARDS, settings.INDEX_SHARDS):
+        monkeypatch.setattr(settings, "INDEX_SHARDS", sharded)
+        init_db._ensure_index_layout()
+        init_db._ensure_index_queue_triggers()
+        db.expire_all()
+        # o arquivo truncado volta à fila junto com os demais
+        assert queued() == {"curto.txt", "longo.txt"}
+        run_index(db, root_id=rf.id, refresh_suggest=False)
+        assert queued() == set()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.models.models import RootFolder, User
+from app.services import shards
+from app.services.jobs import JobCancelled, JobContext
+from app.services.scanner import run_root_scan
+from app.services.work_locks import LockLost, index_keys, work_locks
+
+
+def test_lost_lock_signals_holder_and_check_raises(db):
+    ctx = JobContext(job_id=0, kind="index")
+    assert work_locks.try_acquire("teste:perdida", on_lost=ctx.lock_lost)
+    work_locks.check("teste:perdida")
+
+    # venceu e outro processo assumiu
+    db.execute(text("UPDATE job_locks SET owner = 'outro:1:x', expires_at = expires_at + 3600 "
+                    "WHERE key = 'teste:perdida'"))
+    db.commit()
+    work_locks.renew()
+
+    assert ctx.lost_lock == "teste:perdida"
+    with pytest.raises(JobCancelled):
+        ctx.update(processed=1)
+    with pytest.raises(LockLost):
+        work_locks.check("teste:perdida")
+    # liberar não apaga a trava do novo dono
+    work_locks.release("teste:perdida")
+    owner = db.execute(text("SELECT owner FROM job_locks WHERE key = 'teste:perdida'")).scalar()
+    assert owner == "outro:1:x"
+
+
+@pytest.mark.parametrize("url", ["/scan/{root_id}?background=false", "/index/run?root_id={root_id}&background=false"])
+def test_sync_endpoints_answer_409_when_the_lock_is_lost(db, tmp_path, client_as, monkeypatch, url):
+    root = tmp_path / "perde"
+    root.mkdir()
+    (root / "a.txt").write_text("conteudo")
+    rf = RootFolder(path=str(root))
+    admin = User(username=f"trava{tmp_path.name}", email=f"trava{tmp_path.name}@example.com",
+                 password_hash="x", is_superuser=1)
+    db.add_all([rf, admin])
+    db.commit()
+    if url.startswith("/index"):
+        run_root_scan(db, rf.id, mode="full")
+
+    def lost(key):
+        raise LockLost(key)
+
+    monkeypatch.setattr(work_locks, "check", lost)
+    r = client_as(admin).post(url.format(root_id=rf.id))
+    assert r.status_code == 409
+    assert "perdida" in r.json()["detail"]
+
+
+def test_hold_all_waits_for_every_index_slot(db, monkeypatch):
+    monkeypatch.setattr(settings, "INDEX_MAX_CONCURRENT", 3)
+    # outro processo indexando na vaga index:1
+    db.execute(text("INSERT INTO job_locks (key, owner, job_id, acquired_at, expires_at) "
+                    "VALUES ('index:1', 'outro:1:x', NULL, :now, :now + 3600)"), {"now": time.time()})
+    db.commit()
+    inside, leave = threading.Event(), threading.Event()
+
+    def exclusive():
+        with work_locks.hold_all(index_keys(), interval=0.05):
+            inside.set()
+            leave.wait(10)
+
+    t = threading.Thread(target=exclusive)
+    t.start()
+    try:
+        assert not inside.wait(0.3)
+        assert work_locks.holds("index:0") and not work_locks.holds("index:2")
+
+        db.execute(text("DELETE FROM job_locks WHERE key = 'index:1'"))
+        db.commit()
+        assert inside.wait(10)
+        assert all(work_locks.holds(k) for k in index_keys())
+    finally:
+        leave.set()
+        t.join(10)
+    assert not any(work_locks.holds(k) for k in index_keys())
+
+
+def test_shard_drop_holds_every_index_slot(db, client_as, monkeypatch):
+    monkeypatch.setattr(settings, "INDEX_MAX_CONCURRENT", 3)
+    monkeypatch.setattr(shards, "enabled", lambda: True)
+    held = []
+    monkeypatch.setattr(shards, "reset_shard", lambda db, root_id: held.extend(
+        k for k in index_keys() if work_locks.holds(k)))
+    rf = RootFolder(path="/nao/importa/drop")
+    admin = User(username="drop_admin", email="drop_admin@example.com", password_hash="x", is_superuser=1)
+    db.add_all([rf, admin])
+    db.commit()
+
+    assert client_as(admin).delete(f"/index/shards/{rf.id}").status_code == 204
+    assert held == index_keys()